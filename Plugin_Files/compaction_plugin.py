@@ -0,0 +1,308 @@
+# Plugin_Files/compaction_plugin.py
+# Version: 1.42.20260118 – Retention + downsampling for snapshot tables
+#   uptime_stats (every 60 s) and dashboard_totals (every 10 min) only ever get
+#   appended to. Once an hour this job keeps RAW_RETENTION of full-resolution
+#   rows, folds older rows into <table>_hourly and hourly rows older than
+#   HOURLY_RETENTION into <table>_daily (min / max / last per metric, last for
+#   text columns). Each batch is one short transaction: upsert into the rollup,
+#   delete the folded primary-key range. The newest raw row is never removed, so
+#   "ORDER BY id DESC LIMIT 1" readers are unaffected.
+#   get_series(name, start, end) answers from the coarsest resolution the range
+#   needs, re-bucketing any newer, finer rows so the series has no gap.
+#
+#   CLI:  python -m Plugin_Files.compaction_plugin [--series uptime|dashboard]
+
+import argparse
+import asyncio
+from datetime import timedelta
+from sqlalchemy import text
+
+from utils.db_mysql import get_db, build_multi_insert
+from utils import scheduler
+
+COMPACTION_INTERVAL = 3600
+RAW_RETENTION = timedelta(days=7)
+HOURLY_RETENTION = timedelta(days=90)
+BATCH_SIZE = 2000      # rows folded + deleted per transaction
+BATCH_PAUSE_S = 0.05   # yield between batches so writers never queue behind us
+LEVELS = ("raw", "hourly", "daily")
+
+SERIES = {
+    "uptime": {
+        "table": "uptime_stats",
+        "time_columns": ("snapshot_time", "updated_at"),  # core.py vs uptime_plugin schema
+        "metrics": ("uptime_pct",),
+        "last_only": ("total_up", "total_down", "status"),
+    },
+    "dashboard": {
+        "table": "dashboard_totals",
+        "time_columns": ("updated_at",),
+        "metrics": ("total_users", "total_pings", "total_vehicles", "total_fillups",
+                    "total_finance_entries", "total_activities"),
+        "last_only": (),
+    },
+}
+
+_time_column = {}  # series name -> detected timestamp column
+
+def _rollup_table(cfg, level: str) -> str:
+    return f"{cfg['table']}_{level}"
+
+def _rollup_columns(cfg):
+    columns = ["bucket", "samples", "last_ts"]
+    for m in cfg["metrics"]:
+        columns += [f"{m}_min", f"{m}_max", f"{m}_last"]
+    columns += [f"{c}_last" for c in cfg["last_only"]]
+    return columns
+
+def _upsert_suffix(cfg, table: str) -> str:
+    # Assignments apply left to right: the *_last choices must read last_ts before it moves
+    newer = f"new.last_ts >= {table}.last_ts"
+    parts = []
+    for m in cfg["metrics"]:
+        parts += [
+            f"{m}_min = LEAST(COALESCE({table}.{m}_min, new.{m}_min), COALESCE(new.{m}_min, {table}.{m}_min))",
+            f"{m}_max = GREATEST(COALESCE({table}.{m}_max, new.{m}_max), COALESCE(new.{m}_max, {table}.{m}_max))",
+            f"{m}_last = IF({newer}, new.{m}_last, {table}.{m}_last)",
+        ]
+    parts += [f"{c}_last = IF({newer}, new.{c}_last, {table}.{c}_last)" for c in cfg["last_only"]]
+    parts += [f"samples = {table}.samples + new.samples",
+              f"last_ts = GREATEST({table}.last_ts, new.last_ts)"]
+    return "AS new ON DUPLICATE KEY UPDATE\n    " + ",\n    ".join(parts)
+
+async def init_db():
+    async for session in get_db():
+        for cfg in SERIES.values():
+            metric_cols = "".join(
+                f"{m}_min DOUBLE NULL, {m}_max DOUBLE NULL, {m}_last DOUBLE NULL, " for m in cfg["metrics"]
+            )
+            text_cols = "".join(f"{c}_last VARCHAR(50) NULL, " for c in cfg["last_only"])
+            for level in LEVELS[1:]:
+                await session.execute(text(f'''
+                    CREATE TABLE IF NOT EXISTS {_rollup_table(cfg, level)} (
+                        bucket DATETIME NOT NULL PRIMARY KEY,
+                        samples INT NOT NULL DEFAULT 0,
+                        last_ts DATETIME NOT NULL,
+                        {metric_cols}{text_cols}
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+                '''))
+        await session.commit()
+    print("[compaction] Hourly/daily rollup tables ready")
+
+async def _detect_time_column(session, name: str):
+    """The snapshot table's timestamp column (the two uptime_stats schemas differ)"""
+    if name not in _time_column:
+        cfg = SERIES[name]
+        result = await session.execute(text('''
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+        '''), {"table": cfg["table"]})
+        present = {r[0] for r in result.fetchall()}
+        found = next((c for c in cfg["time_columns"] if c in present), None)
+        if found is None:
+            return None  # table not created yet – don't cache
+        _time_column[name] = found
+    return _time_column[name]
+
+def _bucket(ts, level: str):
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if level == "daily" else ts
+
+def _raw_point(cfg, row) -> dict:
+    """A raw snapshot row in rollup shape (min = max = last)"""
+    point = {"last_ts": row.ts, "samples": 1}
+    for m in cfg["metrics"]:
+        value = getattr(row, m)
+        value = float(value) if value is not None else None
+        point.update({f"{m}_min": value, f"{m}_max": value, f"{m}_last": value})
+    for c in cfg["last_only"]:
+        value = getattr(row, c)
+        point[f"{c}_last"] = str(value) if value is not None else None
+    return point
+
+def _merge(acc: dict, point: dict, cfg) -> dict:
+    if acc is None:
+        return dict(point)
+    for m in cfg["metrics"]:
+        lows = [v for v in (acc[f"{m}_min"], point[f"{m}_min"]) if v is not None]
+        highs = [v for v in (acc[f"{m}_max"], point[f"{m}_max"]) if v is not None]
+        acc[f"{m}_min"] = min(lows) if lows else None
+        acc[f"{m}_max"] = max(highs) if highs else None
+    if point["last_ts"] >= acc["last_ts"]:
+        for key in [f"{m}_last" for m in cfg["metrics"]] + [f"{c}_last" for c in cfg["last_only"]]:
+            acc[key] = point[key]
+        acc["last_ts"] = point["last_ts"]
+    acc["samples"] += point["samples"]
+    return acc
+
+def _fold(cfg, points, level: str) -> dict:
+    buckets = {}
+    for point in points:
+        key = _bucket(point["last_ts"], level)
+        buckets[key] = _merge(buckets.get(key), point, cfg)
+    for key, acc in buckets.items():
+        acc["bucket"] = key
+    return buckets
+
+async def _compact_raw(session, name: str, cutoff) -> int:
+    """Fold raw rows older than cutoff into hourly, BATCH_SIZE rows per transaction"""
+    cfg = SERIES[name]
+    time_col = await _detect_time_column(session, name)
+    if time_col is None:
+        return 0
+    target = _rollup_table(cfg, "hourly")
+    select_cols = ", ".join(("id", f"{time_col} AS ts") + cfg["metrics"] + cfg["last_only"])
+    keep_id = (await session.execute(text(f"SELECT MAX(id) FROM {cfg['table']}"))).scalar() or 0
+    await session.commit()
+
+    folded = 0
+    while True:
+        result = await session.execute(text(f'''
+            SELECT {select_cols}
+            FROM {cfg['table']}
+            WHERE {time_col} < :cutoff AND id < :keep_id
+            ORDER BY id
+            LIMIT :batch
+        '''), {"cutoff": cutoff, "keep_id": keep_id, "batch": BATCH_SIZE})
+        rows = result.fetchall()
+        if not rows:
+            await session.commit()
+            break
+        buckets = _fold(cfg, (_raw_point(cfg, r) for r in rows), "hourly")
+        sql, params = build_multi_insert(target, _rollup_columns(cfg), list(buckets.values()),
+                                         suffix=_upsert_suffix(cfg, target))
+        await session.execute(text(sql), params)
+        await session.execute(text(f'''
+            DELETE FROM {cfg['table']}
+            WHERE id BETWEEN :first AND :last AND {time_col} < :cutoff
+        '''), {"first": rows[0].id, "last": rows[-1].id, "cutoff": cutoff})
+        await session.commit()
+        folded += len(rows)
+        if len(rows) < BATCH_SIZE:
+            break
+        await asyncio.sleep(BATCH_PAUSE_S)
+    return folded
+
+async def _compact_hourly(session, name: str, cutoff) -> int:
+    """Fold hourly buckets older than cutoff into daily"""
+    cfg = SERIES[name]
+    source, target = _rollup_table(cfg, "hourly"), _rollup_table(cfg, "daily")
+    columns = _rollup_columns(cfg)
+
+    folded = 0
+    while True:
+        result = await session.execute(text(f'''
+            SELECT {", ".join(columns)}
+            FROM {source}
+            WHERE bucket < :cutoff
+            ORDER BY bucket
+            LIMIT :batch
+        '''), {"cutoff": cutoff, "batch": BATCH_SIZE})
+        rows = [dict(r._mapping) for r in result.fetchall()]
+        if not rows:
+            await session.commit()
+            break
+        buckets = _fold(cfg, rows, "daily")
+        sql, params = build_multi_insert(target, columns, list(buckets.values()),
+                                         suffix=_upsert_suffix(cfg, target))
+        await session.execute(text(sql), params)
+        await session.execute(text(f'''
+            DELETE FROM {source} WHERE bucket BETWEEN :first AND :last
+        '''), {"first": rows[0]["bucket"], "last": rows[-1]["bucket"]})
+        await session.commit()
+        folded += len(rows)
+        if len(rows) < BATCH_SIZE:
+            break
+        await asyncio.sleep(BATCH_PAUSE_S)
+    return folded
+
+async def run_compaction(names=None) -> dict:
+    """One compaction pass; returns {series: (raw rows folded, hourly rows folded)}"""
+    summary = {}
+    async for session in get_db():
+        now = (await session.execute(text("SELECT NOW()"))).scalar()
+        await session.commit()
+        raw_cutoff = _bucket(now - RAW_RETENTION, "hourly")
+        hourly_cutoff = _bucket(now - HOURLY_RETENTION, "daily")
+        for name in names or SERIES:
+            try:
+                raw = await _compact_raw(session, name, raw_cutoff)
+                hourly = await _compact_hourly(session, name, hourly_cutoff)
+            except Exception as e:
+                await session.rollback()
+                print(f"[compaction] {name} failed: {e}")
+                continue
+            summary[name] = (raw, hourly)
+            if raw or hourly:
+                print(f"[compaction] {name}: {raw:,} raw rows → hourly, {hourly:,} hourly rows → daily")
+    return summary
+
+async def get_series(name: str, start, end=None, resolution: str = None):
+    """
+    Points for [start, end] as dicts: bucket, samples, last_ts, <metric>_min/_max/_last,
+    <column>_last. resolution: "raw" | "hourly" | "daily"; by default the finest one
+    that still holds data back to start.
+    """
+    cfg = SERIES[name]
+    async for session in get_db():
+        now = (await session.execute(text("SELECT NOW()"))).scalar()
+        end = end or now
+        if resolution is None:
+            if start >= now - RAW_RETENTION:
+                resolution = "raw"
+            elif start >= now - HOURLY_RETENTION:
+                resolution = "hourly"
+            else:
+                resolution = "daily"
+
+        points = []
+        time_col = await _detect_time_column(session, name)
+        if time_col is not None:
+            select_cols = ", ".join((f"{time_col} AS ts",) + cfg["metrics"] + cfg["last_only"])
+            result = await session.execute(text(f'''
+                SELECT {select_cols}
+                FROM {cfg['table']}
+                WHERE {time_col} BETWEEN :start AND :end
+                ORDER BY {time_col}
+            '''), {"start": start, "end": end})
+            points = [_raw_point(cfg, r) for r in result.fetchall()]
+        if resolution == "raw":
+            for point in points:
+                point["bucket"] = point["last_ts"]
+            return points
+
+        # Coarser levels hold the older part of the range; finer rows are re-bucketed
+        for level in LEVELS[1:LEVELS.index(resolution) + 1]:
+            result = await session.execute(text(f'''
+                SELECT {", ".join(_rollup_columns(cfg))}
+                FROM {_rollup_table(cfg, level)}
+                WHERE bucket BETWEEN :start AND :end
+                ORDER BY bucket
+            '''), {"start": _bucket(start, level), "end": end})
+            points += [dict(r._mapping) for r in result.fetchall()]
+    buckets = _fold(cfg, points, resolution)
+    return [buckets[key] for key in sorted(buckets)]
+
+async def _startup():
+    await init_db()
+    scheduler.register("compaction", run_compaction, COMPACTION_INTERVAL)
+
+def initialize():
+    asyncio.create_task(_startup())
+    print(f"[compaction_plugin] Initialized – raw kept {RAW_RETENTION.days}d, "
+          f"hourly {HOURLY_RETENTION.days}d, daily forever")
+
+async def _cli(names):
+    from utils.db_mysql import engine
+    await init_db()
+    try:
+        print(await run_compaction(names))
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact uptime_stats / dashboard_totals into hourly and daily rollups")
+    parser.add_argument("--series", choices=sorted(SERIES), action="append", help="default: all")
+    args = parser.parse_args()
+    asyncio.run(_cli(args.series))
@@ -1,78 +1,26 @@
 # Plugin_Files/dashboard_snapshot_plugin.py
-# Version: 1.42.20260117 – Full file with improved timestamped logging for visibility
+# Version: 1.42.20260118 – Full file with improved timestamped logging for visibility
 #          Every update now prints success/failure clearly in console
+#          total_activities = finished trips (trips_plugin)
+#          Totals come from utils/counters (incremented by the write paths), so a
+#          snapshot is one read of dashboard_counters instead of COUNT(*) scans;
+#          a reconciliation pass recounts the source tables every RECONCILE_INTERVAL
+#          Runs on the shared async engine (no blocking mysql.connector calls)
 
 import asyncio
-import mysql.connector
-from mysql.connector import Error
 from datetime import datetime
+from sqlalchemy import text
 
-from utils.db_mysql import config
-from pathlib import Path
+from utils.db_mysql import get_db
+from utils import counters, scheduler
 
-ROOT = Path(__file__).parent.parent
+SNAPSHOT_INTERVAL = 600          # 10 minutes
+RECONCILE_INTERVAL = 6 * 3600    # full recount to correct any counter drift
 
-def update_snapshot():
-    now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    conn = None
-    cursor = None
-    try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user=config["mysql_user"],
-            password=config["mysql_password"],
-            database=config["mysql_db"],
-            connect_timeout=10,
-            raise_on_warnings=True
-        )
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            INSERT INTO dashboard_totals (
-                total_users, total_pings, total_vehicles, total_fillups,
-                total_finance_entries, total_activities
-            )
-            SELECT 
-                (SELECT COUNT(DISTINCT user_id) FROM gps_records) AS total_users,
-                (SELECT COUNT(*) FROM gps_records) AS total_pings,
-                (SELECT COUNT(*) FROM vehicles) AS total_vehicles,
-                (SELECT COUNT(*) FROM fuel_records) AS total_fillups,
-                (SELECT COUNT(*) FROM finance_records) AS total_finance_entries,
-                0 AS total_activities
-        """)
-        conn.commit()
-        print(f"[{now_str}] [dashboard_snapshot] Totals updated successfully")
-
-    except Error as e:
-        print(f"[{now_str}] [dashboard_snapshot] MySQL error during update: {e}")
-    except Exception as e:
-        print(f"[{now_str}] [dashboard_snapshot] Unexpected error during update: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
-
-async def periodic_update():
-    print("[dashboard_snapshot] Starting periodic updates (every 10 minutes)")
-    while True:
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, update_snapshot)
-        await asyncio.sleep(600)  # 10 minutes
-
-def initialize():
+async def init_db():
     print("[dashboard_snapshot] Initializing dashboard_totals table...")
-    conn = None
-    cursor = None
-    try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user=config["mysql_user"],
-            password=config["mysql_password"],
-            database=config["mysql_db"]
-        )
-        cursor = conn.cursor()
-        cursor.execute("""
+    async for session in get_db():
+        await session.execute(text('''
             CREATE TABLE IF NOT EXISTS dashboard_totals (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -83,16 +31,49 @@ def initialize():
                 total_finance_entries INT DEFAULT 0,
                 total_activities INT DEFAULT 0
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-        """)
-        conn.commit()
-        print("[dashboard_snapshot] Ensured dashboard_totals table exists")
+        '''))
+        await session.commit()
+    await counters.init_db()  # normally already done by core.ensure_all_tables
+    print("[dashboard_snapshot] Ensured dashboard_totals + dashboard_counters tables exist")
+
+async def update_snapshot():
+    now_str = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    try:
+        async for session in get_db():
+            await session.execute(text('''
+                INSERT INTO dashboard_totals (
+                    total_users, total_pings, total_vehicles, total_fillups,
+                    total_finance_entries, total_activities
+                )
+                SELECT
+                    COALESCE(SUM(CASE WHEN name = 'users' THEN value END), 0),
+                    COALESCE(SUM(CASE WHEN name = 'pings' THEN value END), 0),
+                    COALESCE(SUM(CASE WHEN name = 'vehicles' THEN value END), 0),
+                    COALESCE(SUM(CASE WHEN name = 'fillups' THEN value END), 0),
+                    COALESCE(SUM(CASE WHEN name = 'finance_entries' THEN value END), 0),
+                    COALESCE(SUM(CASE WHEN name = 'activities' THEN value END), 0)
+                FROM dashboard_counters
+            '''))
+            await session.commit()
+        print(f"[{now_str}] [dashboard_snapshot] Totals updated successfully")
     except Exception as e:
-        print(f"[dashboard_snapshot] Table setup failed: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+        print(f"[{now_str}] [dashboard_snapshot] Error during update: {e}")
+
+async def reconcile():
+    drift = await counters.reconcile()
+    status = f"corrected {len(drift)} counter(s)" if drift else "no drift"
+    print(f"[dashboard_snapshot] Counter reconciliation: {status}")
 
-    asyncio.create_task(periodic_update())
-    print("[dashboard_snapshot] Initialized – running updates every 10 minutes")
\ No newline at end of file
+async def _startup():
+    await init_db()
+    async for session in get_db():
+        seeded = await counters.is_seeded(session)
+    if not seeded:
+        print("[dashboard_snapshot] Seeding dashboard_counters from the source tables...")
+        await counters.reconcile()
+    scheduler.register("dashboard_snapshot", update_snapshot, SNAPSHOT_INTERVAL)
+    scheduler.register("dashboard_reconcile", reconcile, RECONCILE_INTERVAL, first_delay=RECONCILE_INTERVAL)
+
+def initialize():
+    asyncio.create_task(_startup())
+    print("[dashboard_snapshot] Initialized – snapshots every 10 minutes from live counters")
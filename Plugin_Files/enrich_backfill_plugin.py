@@ -0,0 +1,262 @@
+# Plugin_Files/enrich_backfill_plugin.py
+# Version: 1.42.20260118 – Resumable bulk enrichment backfill for gps_records
+#   Streams gps_records in id order (server-side cursor, one keyset window at a
+#   time) flagging pings that have no geopy_enriched row yet, or one saved while
+#   geocoding failed (city NULL – queue full or retries exhausted). Per-user distances
+#   are computed a chunk at a time over every ping (so a skipped, already
+#   enriched ping still counts as the predecessor); only unenriched pings are
+#   geocoded through geopy_plugin.reverse_geocode (cache → offline → rate-limited
+#   Nominatim on the backfill lane) and written as one multi-row upsert per chunk.
+#   The last processed id is stored in job_checkpoints in the same transaction,
+#   so a stopped or crashed run resumes where it left off.
+#
+#   Telegram:  /backfill [start|stop|status|reset]
+#   CLI:       python -m Plugin_Files.enrich_backfill_plugin [--chunk N] [--reset]
+
+import argparse
+import asyncio
+import time
+from sqlalchemy import text
+
+from utils.db_mysql import engine, build_multi_insert
+from utils import checkpoints, geocode_cache
+from utils.distance import segment_distances_m
+from utils.geocode_worker import PRIORITY_BACKFILL
+from Plugin_Files import geopy_plugin
+
+JOB_NAME = "geopy_backfill"
+CHUNK_SIZE = 500           # rows geocoded + upserted per transaction
+WINDOW_SIZE = 20000        # rows per streamed query; bounds the cursor drain on stop
+DISTANCE_METHOD = "vincenty"  # matches enrich_ping's geodesic; "haversine" is ~8x faster
+STREAM_WRITE_TIMEOUT = 3600  # seconds the server waits on a slow reader (geocoding between reads)
+
+ENRICHED_COLUMNS = (
+    "ping_id", "latitude", "longitude",
+    "address", "city", "country",
+    "distance_m", "original_timestamp",
+)
+UPSERT_SUFFIX = '''AS new
+    ON DUPLICATE KEY UPDATE
+        address     = new.address,
+        city        = new.city,
+        country     = new.country,
+        distance_m  = new.distance_m'''
+
+_task = None
+_stop_requested = False
+_progress = {
+    "running": False,
+    "rows": 0,
+    "scanned": 0,
+    "chunks": 0,
+    "watermark": 0,
+    "started_at": None,
+    "elapsed_s": 0.0,
+    "rows_per_sec": 0.0,
+}
+
+async def init_db():
+    await checkpoints.init_db()
+    print("[enrich_backfill] job_checkpoints table ready")
+
+def _user_distances(rows, last_pos: dict) -> dict:
+    """ping_id -> meters from the same user's previous ping (None for a user's first ping)"""
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row.user_id, []).append(row)
+
+    distances = {}
+    for user_id, user_rows in by_user.items():
+        lats = [r.latitude for r in user_rows]
+        lons = [r.longitude for r in user_rows]
+        prev = last_pos.get(user_id)
+        if prev is not None:
+            segments = segment_distances_m([prev[0]] + lats, [prev[1]] + lons, DISTANCE_METHOD)
+        else:
+            segments = [None] + segment_distances_m(lats, lons, DISTANCE_METHOD)
+        for row, meters in zip(user_rows, segments):
+            distances[row.id] = meters
+        last_pos[user_id] = (lats[-1], lons[-1])
+    return distances
+
+async def _load_previous_positions(rows, last_pos: dict):
+    """First time a user shows up in this run: their ping right before the first one seen"""
+    first_seen = {}
+    for row in rows:
+        if row.user_id not in last_pos and row.user_id not in first_seen:
+            first_seen[row.user_id] = row.id
+    for user_id, ping_id in first_seen.items():
+        lat, lon = await geopy_plugin.get_last_ping_location(ping_id, user_id)
+        last_pos[user_id] = (lat, lon) if lat is not None else None
+
+async def _process_chunk(rows, last_pos: dict):
+    """Geocode + upsert the pending rows of a chunk; returns how many were written"""
+    await _load_previous_positions(rows, last_pos)
+    distances = _user_distances(rows, last_pos)
+    pending = [r for r in rows if r.pending]
+
+    # Duplicate cells inside a chunk coalesce in the worker / hit the cache
+    places = await asyncio.gather(*(
+        geopy_plugin.reverse_geocode(r.latitude, r.longitude, PRIORITY_BACKFILL, wait_for_slot=True)
+        for r in pending
+    ))
+
+    records = []
+    for row, place in zip(pending, places):
+        place = place or {}
+        records.append({
+            "ping_id": row.id,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "address": place.get("address"),
+            "city": place.get("city"),
+            "country": place.get("country"),
+            "distance_m": distances.get(row.id),
+            "original_timestamp": row.timestamp,
+        })
+
+    async with engine.begin() as conn:
+        if records:
+            sql, params = build_multi_insert("geopy_enriched", ENRICHED_COLUMNS, records, suffix=UPSERT_SUFFIX)
+            await conn.execute(text(sql), params)
+        await checkpoints.set_watermark(conn, JOB_NAME, rows[-1].id)
+    return len(records)
+
+async def run_backfill(chunk_size: int = CHUNK_SIZE, on_progress=None) -> dict:
+    """
+    Enrich every gps_records row past the checkpoint that has no geopy_enriched row
+    (or one without a place because geocoding failed at the time).
+    rows counts enriched pings, scanned counts every ping streamed.
+    on_progress: optional async callable(progress dict) after each chunk.
+    Returns the final progress dict.
+    """
+    global _stop_requested
+    _stop_requested = False
+    last_pos = {}  # user_id -> (lat, lon) of the last ping processed, or None
+
+    async with engine.connect() as conn:
+        watermark = await checkpoints.get_watermark(conn, JOB_NAME)
+
+    _progress.update(running=True, rows=0, scanned=0, chunks=0, watermark=watermark,
+                     started_at=time.time(), elapsed_s=0.0, rows_per_sec=0.0)
+    started = time.perf_counter()
+    print(f"[enrich_backfill] Starting from id > {watermark} (chunk {chunk_size})")
+
+    try:
+        while not _stop_requested:
+            window_rows = 0
+            async with engine.connect() as conn:
+                await conn.execute(text(f"SET SESSION net_write_timeout = {STREAM_WRITE_TIMEOUT}"))
+                result = await conn.stream(text('''
+                    SELECT g.id, g.user_id, g.latitude, g.longitude, g.timestamp,
+                           (e.ping_id IS NULL OR e.city IS NULL) AS pending
+                    FROM gps_records g
+                    LEFT JOIN geopy_enriched e ON e.ping_id = g.id
+                    WHERE g.id > :watermark
+                    ORDER BY g.id
+                    LIMIT :window
+                '''), {"watermark": watermark, "window": WINDOW_SIZE})
+
+                async for rows in result.partitions(chunk_size):
+                    written = await _process_chunk(rows, last_pos)
+                    window_rows += len(rows)
+                    watermark = rows[-1].id
+
+                    elapsed = time.perf_counter() - started
+                    _progress["rows"] += written
+                    _progress["scanned"] += len(rows)
+                    _progress["chunks"] += 1
+                    _progress["watermark"] = watermark
+                    _progress["elapsed_s"] = elapsed
+                    _progress["rows_per_sec"] = _progress["rows"] / elapsed if elapsed else 0.0
+                    print(f"[enrich_backfill] {_progress['rows']:,} enriched / {_progress['scanned']:,} scanned "
+                          f"up to id {watermark} – "
+                          f"{_progress['rows_per_sec']:,.1f} rows/s")
+                    if on_progress is not None:
+                        await on_progress(dict(_progress))
+                    if _stop_requested:
+                        break
+
+            if window_rows < WINDOW_SIZE:
+                break  # reached the newest ping
+    finally:
+        _progress["running"] = False
+
+    state = "stopped" if _stop_requested else "finished"
+    print(f"[enrich_backfill] {state.capitalize()}: {_progress['rows']:,} rows in "
+          f"{_progress['elapsed_s']:.1f}s ({_progress['rows_per_sec']:,.1f} rows/s), watermark {watermark}")
+    return dict(_progress, state=state)
+
+def start(on_done=None) -> bool:
+    """Run the backfill as a background task; False if one is already running"""
+    global _task
+    if _task is not None and not _task.done():
+        return False
+
+    async def _runner():
+        try:
+            summary = await run_backfill()
+        except Exception as e:
+            print(f"[enrich_backfill] Backfill failed: {e}")
+            summary = dict(_progress, state=f"failed: {e}")
+        if on_done is not None:
+            await on_done(summary)
+
+    _task = asyncio.create_task(_runner())
+    return True
+
+def request_stop() -> bool:
+    """Ask a running backfill to stop after its current chunk"""
+    global _stop_requested
+    if _task is None or _task.done():
+        return False
+    _stop_requested = True
+    return True
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+def progress() -> dict:
+    return dict(_progress)
+
+async def reset_checkpoint():
+    async with engine.begin() as conn:
+        await checkpoints.set_watermark(conn, JOB_NAME, 0)
+    _progress["watermark"] = 0
+    print("[enrich_backfill] Checkpoint reset to 0")
+
+async def get_checkpoint() -> int:
+    async with engine.connect() as conn:
+        return await checkpoints.get_watermark(conn, JOB_NAME)
+
+async def shutdown():
+    if is_running():
+        request_stop()
+        await asyncio.gather(_task, return_exceptions=True)
+
+def initialize():
+    asyncio.create_task(init_db())
+    print("[enrich_backfill_plugin] Initialized – /backfill ready")
+
+async def _cli(chunk_size: int, reset: bool):
+    await checkpoints.init_db()
+    await geocode_cache.init_db()
+    await geopy_plugin.load_offline_geocoder()
+    geopy_plugin.geocoder.start()
+    if reset:
+        await reset_checkpoint()
+    try:
+        await run_backfill(chunk_size)
+    finally:
+        await geopy_plugin.geocoder.shutdown()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill geopy_enriched for existing gps_records")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="rows per chunk/transaction")
+    parser.add_argument("--reset", action="store_true", help="start over from id 0")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_cli(args.chunk, args.reset))
+    except KeyboardInterrupt:
+        print("[enrich_backfill] Interrupted – rerun to resume from the last checkpoint")
@@ -0,0 +1,183 @@
+# Plugin_Files/export_plugin.py
+# Version: 1.42.20260118 – Streaming export of ping and finance history
+#   Rows come off an unbuffered server-side cursor (conn.stream) a partition at a
+#   time and are written straight into gzip-compressed CSV or NDJSON, so memory
+#   stays constant whatever the table size. Output is split into parts of at most
+#   PART_BYTES compressed (Telegram's bot upload limit is 50 MB); each finished
+#   part is handed to on_part (the /export command sends it and deletes it).
+#
+#   Telegram:  /export [pings|finance] [csv|ndjson]   (your own rows only)
+#   CLI:       python -m Plugin_Files.export_plugin pings|finance [--format csv|ndjson]
+#              [--user USER_ID] [--out DIR]
+
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from sqlalchemy import text
+
+from utils.db_mysql import engine
+
+ROOT = Path(__file__).parent.parent
+EXPORT_DIR = ROOT / "data" / "exports"
+PARTITION_ROWS = 5000            # rows pulled from the cursor per step
+PART_BYTES = 45 * 1024 * 1024    # compressed size at which a new part file starts
+STREAM_WRITE_TIMEOUT = 600       # seconds the server waits on a slow reader
+FORMATS = ("csv", "ndjson")
+
+EXPORTS = {
+    "pings": '''
+        SELECT g.id, g.user_id, g.timestamp, g.latitude, g.longitude,
+               e.address, e.city, e.country, e.distance_m
+        FROM gps_records g
+        LEFT JOIN geopy_enriched e ON e.ping_id = g.id
+        {where}
+        ORDER BY g.id
+    ''',
+    "finance": '''
+        SELECT r.id, r.user_id, r.record_date, c.name AS category, c.type,
+               r.amount, r.description, r.created_at
+        FROM finance_records r
+        JOIN finance_categories c ON c.id = r.category_id
+        {where}
+        ORDER BY r.id
+    ''',
+}
+USER_COLUMN = {"pings": "g.user_id", "finance": "r.user_id"}
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+class _PartWriter:
+    """gzip text writer that rolls over to a new part file past PART_BYTES compressed"""
+
+    def __init__(self, out_dir: Path, stem: str, fmt: str, columns):
+        self.out_dir = out_dir
+        self.stem = stem
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.part = 0
+        self.rows_in_part = 0
+        self.raw = self.gz = self.out = self.csv = None
+        self.path = None
+
+    def _open(self):
+        self.part += 1
+        self.rows_in_part = 0
+        self.path = self.out_dir / f"{self.stem}.part{self.part:03d}.{self.fmt}.gz"
+        self.raw = open(self.path, "wb")
+        self.gz = gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=6)
+        self.out = io.TextIOWrapper(self.gz, encoding="utf-8", newline="")
+        if self.fmt == "csv":
+            self.csv = csv.writer(self.out)
+            self.csv.writerow(self.columns)
+
+    def close(self):
+        """Finish the current part; returns (path, rows) or None if nothing was open"""
+        if self.out is None:
+            return None
+        self.out.close()  # flushes the wrapper and the gzip trailer
+        self.raw.close()
+        closed = (self.path, self.rows_in_part)
+        self.raw = self.gz = self.out = None
+        return closed
+
+    def write(self, rows):
+        """Write one partition; returns the parts that filled up along the way"""
+        finished = []
+        for row in rows:
+            if self.out is None:
+                self._open()
+            if self.fmt == "csv":
+                self.csv.writerow(row)
+            else:
+                self.out.write(json.dumps(
+                    {col: _json_value(v) for col, v in zip(self.columns, row)}, ensure_ascii=False
+                ) + "\n")
+            self.rows_in_part += 1
+            # raw.tell() is what gzip has flushed so far – close enough for a size cap
+            if self.raw.tell() >= PART_BYTES:
+                finished.append(self.close())
+        return finished
+
+async def export_table(kind: str, fmt: str = "csv", user_id: int = None,
+                       out_dir: Path = EXPORT_DIR, on_part=None) -> dict:
+    """
+    Stream one export to gzip part files.
+    kind: "pings" | "finance"; user_id limits to one user (None = everyone, CLI only).
+    on_part: optional async callable(path, part_no, rows) for each finished part.
+    Returns a summary dict with the part paths.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}' (use {', '.join(EXPORTS)})")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (use {', '.join(FORMATS)})")
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    stem = f"{kind}_{user_id if user_id is not None else 'all'}_{stamp}"
+    where = f"WHERE {USER_COLUMN[kind]} = :uid" if user_id is not None else ""
+
+    summary = {"kind": kind, "format": fmt, "rows": 0, "parts": [], "elapsed_s": 0.0, "rows_per_sec": 0.0}
+    started = time.perf_counter()
+    writer = None
+
+    async def _finished(parts):
+        for path, rows in parts:
+            summary["parts"].append(str(path))
+            print(f"[export] Part {len(summary['parts'])}: {path.name} ({rows:,} rows, "
+                  f"{path.stat().st_size / 1024 / 1024:.1f} MB)")
+            if on_part is not None:
+                await on_part(path, len(summary["parts"]), rows)
+
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(f"SET SESSION net_write_timeout = {STREAM_WRITE_TIMEOUT}"))
+            result = await conn.stream(text(EXPORTS[kind].format(where=where)), {"uid": user_id})
+            writer = _PartWriter(out_dir, stem, fmt, result.keys())
+            async for rows in result.partitions(PARTITION_ROWS):
+                # compression is CPU work – keep it off the event loop
+                await _finished(await asyncio.to_thread(writer.write, rows))
+                summary["rows"] += len(rows)
+        last = writer.close()
+        if last is not None:
+            await _finished([last])
+    finally:
+        if writer is not None:
+            writer.close()
+
+    summary["elapsed_s"] = time.perf_counter() - started
+    summary["rows_per_sec"] = summary["rows"] / summary["elapsed_s"] if summary["elapsed_s"] else 0.0
+    print(f"[export] {kind} ({fmt}): {summary['rows']:,} rows in {len(summary['parts'])} part(s), "
+          f"{summary['elapsed_s']:.1f}s ({summary['rows_per_sec']:,.0f} rows/s)")
+    return summary
+
+def initialize():
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    print("[export_plugin] Initialized – /export ready")
+
+async def _cli(kind: str, fmt: str, user_id, out_dir: str):
+    try:
+        await export_table(kind, fmt, user_id, Path(out_dir))
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ping or finance history as gzip CSV / NDJSON")
+    parser.add_argument("kind", choices=sorted(EXPORTS))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--user", type=int, default=None, help="only this Telegram user id (default: all)")
+    parser.add_argument("--out", default=str(EXPORT_DIR), help="output directory")
+    args = parser.parse_args()
+    asyncio.run(_cli(args.kind, args.format, args.user, args.out))
@@ -1,15 +1,29 @@
 # Plugin_Files/fillup_plugin.py
 # Version: 1.42.20260117 – Full file with added logging at every major step
 #          Logs received data, save attempts, finance linking, and final success
+#          Each fill-up updates vehicle_fuel_stats in the same transaction
+#          Fill-ups go to the user's active vehicle (cached, /vehicle use)
+#          The fuel record and its finance expense ("fuel" category, gallons × price)
+#          are written in one transaction with one commit; finance_records.fuel_record_id
+#          links the two so either side joins on an index
 
 import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from sqlalchemy import text
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 
 from utils.db_mysql import get_db, init_mysql
+from utils import counters
+from Plugin_Files.vehicles_plugin import apply_fillup, get_active_vehicle
+from Plugin_Files.finance_plugin import (
+    resolve_category,
+    apply_record_totals,
+    apply_record_rollups,
+)
+
+FUEL_CATEGORY = "fuel"
 
 ROOT = Path(__file__).parent.parent
 
@@ -42,6 +56,29 @@ async def init_db():
                 print("[fillup_plugin] Index idx_vehicle_fill_date already exists")
             else:
                 print(f"[fillup_plugin] Index creation failed: {e}")
+
+        # Link from the auto-created finance expense back to its fill-up
+        try:
+            await session.execute(text('''
+                ALTER TABLE finance_records ADD COLUMN fuel_record_id INT NULL
+            '''))
+            await session.commit()
+            print("[fillup_plugin] Added fuel_record_id to finance_records")
+        except Exception as e:
+            if "Duplicate column name" not in str(e):
+                print(f"[fillup_plugin] fuel_record_id column failed: {e}")
+
+        try:
+            await session.execute(text('''
+                CREATE UNIQUE INDEX uk_fuel_record ON finance_records (fuel_record_id)
+            '''))
+            await session.commit()
+            print("[fillup_plugin] Created index uk_fuel_record")
+        except Exception as e:
+            if "Duplicate key name" in str(e):
+                print("[fillup_plugin] Index uk_fuel_record already exists")
+            else:
+                print(f"[fillup_plugin] Index creation failed: {e}")
     print("[fillup_plugin] Fuel records table and indexes ready")
 
 # Example interactive flow – adapt if your actual handlers differ
@@ -50,8 +87,8 @@ async def init_db():
 async def cmd_fillup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Start fill-up conversation (simplified – add your real state management)
     keyboard = [
-        [InlineKeyboardButton("Full Tank", callback_data="full")],
-        [InlineKeyboardButton("Partial", callback_data="partial")],
+        [InlineKeyboardButton("Full Tank", callback_data="fillup_full")],
+        [InlineKeyboardButton("Partial", callback_data="fillup_partial")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text(
@@ -64,7 +101,7 @@ async def handle_fillup_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
 
-    is_full = query.data == "full"
+    is_full = query.data == "fillup_full"
     context.user_data["fillup_data"] = {"is_full": is_full}
 
     await query.edit_message_text(
@@ -74,6 +111,8 @@ async def handle_fillup_callback(update: Update, context: ContextTypes.DEFAULT_T
 
 # Message handler for the data input (gallons price odometer)
 async def handle_fillup_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if "fillup_data" not in context.user_data:
+        return  # not in a /fillup flow – leave the message alone
     text = update.message.text.strip().split()
     if len(text) < 2:
         await update.message.reply_text("Need at least: gallons price [optional odometer]")
@@ -94,17 +133,24 @@ async def handle_fillup_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "odometer": odometer,
     })
 
-    # TODO: Replace hardcoded vehicle_id=1 with real vehicle selection/lookup
-    vehicle_id = 1  # ← FIX THIS LATER – e.g. from user active vehicle
     user_id = update.effective_user.id
+    vehicle_id = await get_active_vehicle(user_id)
+    if vehicle_id is None:
+        await update.message.reply_text(
+            "Add a vehicle first: /vehicle add PLATE YEAR MAKE MODEL ODOMETER"
+        )
+        return
     fill_date = datetime.utcnow()
 
     print(f"[fillup] Received data from user {user_id}: "
           f"gallons={gallons}, price=${price:.2f}, odo={odometer}, vehicle={vehicle_id}")
 
+    is_full = user_data.get("is_full", True)
+    cost = round(gallons * price, 2)
+
     async for session in get_db():
         try:
-            await session.execute(text('''
+            result = await session.execute(text('''
                 INSERT INTO fuel_records (vehicle_id, user_id, odometer, gallons, price, fill_date, is_full_tank)
                 VALUES (:vehicle_id, :user_id, :odometer, :gallons, :price, :fill_date, :is_full_tank)
             '''), {
@@ -114,34 +160,45 @@ async def handle_fillup_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 "gallons": gallons,
                 "price": price,
                 "fill_date": fill_date,
-                "is_full_tank": 1 if user_data.get("is_full", True) else 0
+                "is_full_tank": 1 if is_full else 0
             })
-            await session.commit()
+            fuel_record_id = result.lastrowid
+            await apply_fillup(session, vehicle_id, odometer, gallons, price, fill_date, is_full=is_full)
 
-            # Auto-create finance expense
-            description = f"Fuel fill-up: {gallons} gal @ ${price:.2f}"
+            # Linked finance expense – same transaction, committed together below
+            cat_id, cat_type = await resolve_category(session, user_id, FUEL_CATEGORY)
+            # fill_date is UTC; finance records are dated in local time like /finance add
+            record_date = fill_date.replace(tzinfo=timezone.utc).astimezone().date()
             await session.execute(text('''
-                INSERT INTO finance_records (type, amount, description, vehicle_id, timestamp)
-                VALUES ('expense', :amount, :description, :vehicle_id, :timestamp)
+                INSERT INTO finance_records
+                (user_id, category_id, amount, description, record_date, fuel_record_id)
+                VALUES (:uid, :cat_id, :amount, :description, :record_date, :fuel_record_id)
             '''), {
-                "amount": price,
-                "description": description,
-                "vehicle_id": vehicle_id,
-                "timestamp": fill_date
+                "uid": user_id,
+                "cat_id": cat_id,
+                "amount": cost,
+                "description": f"Fuel fill-up: {gallons} gal @ ${price:.2f}",
+                "record_date": record_date,
+                "fuel_record_id": fuel_record_id,
             })
+            await apply_record_totals(session, user_id, [(cat_type, cost)])
+            await apply_record_rollups(session, user_id, [(cat_id, record_date, cost)])
+            await counters.increment(session, {"fillups": 1, "finance_entries": 1})
             await session.commit()
 
-            print(f"[fillup] SUCCESS: Logged fill-up + finance expense for vehicle {vehicle_id}")
+            print(f"[fillup] SUCCESS: Logged fill-up {fuel_record_id} + ${cost:.2f} finance expense "
+                  f"for vehicle {vehicle_id}")
 
             await update.message.reply_text(
-                f"Fill-up logged: {gallons} gal @ ${price:.2f}. "
-                f"{'Full' if user_data.get('is_full', True) else 'Partial'} tank."
+                f"Fill-up logged: {gallons} gal @ ${price:.2f} (${cost:.2f}). "
+                f"{'Full' if is_full else 'Partial'} tank."
             )
 
             # Clean up user data
             context.user_data.pop("fillup_data", None)
 
         except Exception as e:
+            await session.rollback()
             print(f"[fillup] Save failed for user {user_id}: {e}")
             await update.message.reply_text(f"Error saving fill-up: {str(e)}")
 
@@ -0,0 +1,296 @@
+# Plugin_Files/finance_import_plugin.py
+# Version: 1.42.20260118 – Bulk finance import from bank exports (CSV / OFX / QFX)
+#   Files are stream-parsed (csv module line by line, OFX tokenized in 64 KB
+#   chunks) so memory stays flat however long the export is. Rows are written
+#   in batches: categories resolved through the finance category cache
+#   (guess_category_type), one multi-row INSERT per batch, balances and monthly
+#   rollups updated in the same transaction. Each row carries a content hash (import_hash) so
+#   importing the same export twice adds nothing. The amount's sign decides the
+#   type: a category whose type disagrees (a refund matching "coffee") is booked
+#   to "Imported income" / "Imported expense" instead.
+#
+#   Telegram:  send the file as a document with caption /import
+#   CLI:       python -m Plugin_Files.finance_import_plugin USER_ID path/to/export.csv
+#              (local paths are CLI only – bot users can't point the server at its own files)
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import re
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from sqlalchemy import text
+
+from utils.db_mysql import get_db, build_multi_insert
+from utils import counters
+from Plugin_Files.finance_plugin import (
+    CATEGORY_TYPE_MAP,
+    resolve_category,
+    apply_record_totals,
+    apply_record_rollups,
+)
+
+ROOT = Path(__file__).parent.parent
+IMPORT_DIR = ROOT / "data" / "imports"
+BATCH_SIZE = 1000
+POSITIVE_TYPES = ("income", "asset")
+INCOME_FALLBACK = "Imported income"
+EXPENSE_FALLBACK = "Imported expense"
+OFX_CHUNK_BYTES = 64 * 1024
+
+RECORD_COLUMNS = ("user_id", "category_id", "amount", "description", "record_date", "import_hash")
+
+CSV_DATE_COLUMNS = ("date", "transaction date", "posted date", "posting date", "trans. date")
+CSV_AMOUNT_COLUMNS = ("amount", "transaction amount")
+CSV_DEBIT_COLUMNS = ("debit", "withdrawal", "withdrawals")
+CSV_CREDIT_COLUMNS = ("credit", "deposit", "deposits")
+CSV_DESC_COLUMNS = ("description", "payee", "name", "memo", "details")
+CSV_CATEGORY_COLUMNS = ("category",)
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%d.%m.%Y", "%Y%m%d")
+
+async def init_db():
+    async for session in get_db():
+        try:
+            await session.execute(text('''
+                ALTER TABLE finance_records ADD COLUMN import_hash CHAR(40) NULL
+            '''))
+            await session.commit()
+            print("[finance_import] Added import_hash to finance_records")
+        except Exception as e:
+            if "Duplicate column name" not in str(e):
+                print(f"[finance_import] import_hash column failed: {e}")
+
+        try:
+            await session.execute(text('''
+                CREATE UNIQUE INDEX uk_user_import_hash ON finance_records (user_id, import_hash)
+            '''))
+            await session.commit()
+            print("[finance_import] Created index uk_user_import_hash")
+        except Exception as e:
+            if "Duplicate key name" in str(e):
+                print("[finance_import] Index uk_user_import_hash already exists")
+            else:
+                print(f"[finance_import] Index creation failed: {e}")
+
+def _parse_date(value: str):
+    value = value.strip().split(" ")[0].split("T")[0]  # drop any time part
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _parse_amount(value: str):
+    value = (value or "").strip().replace("$", "").replace(",", "")
+    if not value:
+        return None
+    negative = value.startswith("(") and value.endswith(")")  # accounting style (12.34)
+    try:
+        amount = Decimal(value.strip("()"))
+    except InvalidOperation:
+        return None
+    return -amount if negative else amount
+
+def _pick(columns: dict, names):
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return None
+
+def iter_csv(path: Path):
+    """Yield (date, signed amount, description, category or None) one CSV line at a time"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        columns = {(name or "").strip().lower(): name for name in reader.fieldnames or []}
+        date_col = _pick(columns, CSV_DATE_COLUMNS)
+        amount_col = _pick(columns, CSV_AMOUNT_COLUMNS)
+        debit_col = _pick(columns, CSV_DEBIT_COLUMNS)
+        credit_col = _pick(columns, CSV_CREDIT_COLUMNS)
+        desc_col = _pick(columns, CSV_DESC_COLUMNS)
+        cat_col = _pick(columns, CSV_CATEGORY_COLUMNS)
+        if date_col is None or (amount_col is None and debit_col is None and credit_col is None):
+            raise ValueError(f"CSV needs a date and an amount (or debit/credit) column, got: {reader.fieldnames}")
+
+        for row in reader:
+            record_date = _parse_date(row.get(date_col) or "")
+            if amount_col is not None:
+                amount = _parse_amount(row.get(amount_col))
+            else:
+                debit = _parse_amount(row.get(debit_col)) if debit_col else None
+                credit = _parse_amount(row.get(credit_col)) if credit_col else None
+                amount = (credit or 0) - abs(debit or 0) if (debit or credit) else None
+            if record_date is None or amount is None:
+                continue
+            yield (record_date, amount, (row.get(desc_col) or "").strip() if desc_col else "",
+                   (row.get(cat_col) or "").strip() or None if cat_col else None)
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def iter_ofx(path: Path):
+    """
+    Yield (date, signed amount, description, None) per <STMTTRN>.
+    Works for SGML OFX 1.x (unclosed leaf tags) and XML OFX 2.x, reading fixed-size chunks.
+    """
+    txn = None
+    tail = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(OFX_CHUNK_BYTES)
+            data = tail + chunk
+            # Keep an incomplete trailing tag for the next chunk
+            cut = data.rfind("<") if chunk else len(data)
+            tail, data = data[cut:], data[:cut]
+            for closing, tag, value in _OFX_TAG.findall(data):
+                tag = tag.upper()
+                if tag == "STMTTRN":
+                    if not closing:
+                        txn = {}
+                    elif txn is not None:
+                        record_date = _parse_date((txn.get("DTPOSTED") or "")[:8])
+                        amount = _parse_amount(txn.get("TRNAMT"))
+                        if record_date is not None and amount is not None:
+                            desc = " ".join(p for p in (txn.get("NAME"), txn.get("MEMO")) if p)
+                            yield record_date, amount, desc, None
+                        txn = None
+                elif txn is not None and not closing and value.strip():
+                    txn[tag] = value.strip()
+            if not chunk:
+                break
+
+def _category_for(amount: Decimal, description: str, category):
+    """Export category if present, else a CATEGORY_TYPE_MAP keyword in the description, else by sign"""
+    if category:
+        return category[:100]
+    lowered = description.lower()
+    for keyword in CATEGORY_TYPE_MAP:
+        if keyword in lowered:
+            return keyword
+    return INCOME_FALLBACK if amount > 0 else EXPENSE_FALLBACK
+
+def _row_hash(user_id: int, record_date, amount: Decimal, description: str, occurrence: int) -> str:
+    # occurrence keeps genuinely repeated transactions (two identical coffees) within one file
+    key = f"{user_id}|{record_date.isoformat()}|{amount:.2f}|{description}|{occurrence}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+async def _write_batch(user_id: int, batch) -> int:
+    """Insert one batch of parsed rows; returns how many were new"""
+    hashes = [row["import_hash"] for row in batch]
+    async for session in get_db():
+        # Serialize imports per user on their balances row (released at commit), so
+        # the duplicate check below is exact and every inserted row is counted once
+        await session.execute(text(
+            "INSERT IGNORE INTO finance_balances (user_id) VALUES (:uid)"
+        ), {"uid": user_id})
+        await session.execute(text(
+            "SELECT user_id FROM finance_balances WHERE user_id = :uid FOR UPDATE"
+        ), {"uid": user_id})
+
+        params = {f"h{i}": h for i, h in enumerate(hashes)}
+        result = await session.execute(text(f'''
+            SELECT import_hash FROM finance_records
+            WHERE user_id = :uid AND import_hash IN ({", ".join(f":h{i}" for i in range(len(hashes)))})
+        '''), {"uid": user_id, **params})
+        existing = {r[0] for r in result.fetchall()}
+
+        records, totals, rollups = [], [], []
+        for row in batch:
+            if row["import_hash"] in existing:
+                continue
+            signed = row.pop("signed_amount")
+            cat_id, cat_type = await resolve_category(session, user_id, row.pop("category"))
+            if (cat_type in POSITIVE_TYPES) != (signed > 0):
+                fallback = INCOME_FALLBACK if signed > 0 else EXPENSE_FALLBACK
+                cat_id, cat_type = await resolve_category(session, user_id, fallback)
+            row["category_id"] = cat_id
+            records.append(row)
+            totals.append((cat_type, row["amount"]))
+            rollups.append((cat_id, row["record_date"], row["amount"]))
+        if records:
+            sql, params = build_multi_insert("finance_records", RECORD_COLUMNS, records)
+            await session.execute(text(sql), params)
+            await counters.increment(session, {"finance_entries": len(records)})
+            await apply_record_totals(session, user_id, totals)
+            await apply_record_rollups(session, user_id, rollups)
+        await session.commit()
+        return len(records)
+    return 0
+
+async def import_file(user_id: int, path, on_progress=None) -> dict:
+    """
+    Stream-import a CSV / OFX / QFX export for a user.
+    on_progress: optional async callable(summary dict) after each batch.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix in (".ofx", ".qfx"):
+        rows = iter_ofx(path)
+    elif suffix in (".csv", ".txt"):
+        rows = iter_csv(path)
+    else:
+        raise ValueError(f"Unsupported file type: {suffix} (use .csv, .ofx or .qfx)")
+
+    summary = {"parsed": 0, "inserted": 0, "duplicates": 0, "elapsed_s": 0.0, "rows_per_sec": 0.0}
+    started = time.perf_counter()
+    seen = {}
+    batch = []
+
+    async def flush():
+        inserted = await _write_batch(user_id, batch)
+        summary["inserted"] += inserted
+        summary["duplicates"] += len(batch) - inserted
+        batch.clear()
+        summary["elapsed_s"] = time.perf_counter() - started
+        summary["rows_per_sec"] = summary["parsed"] / summary["elapsed_s"] if summary["elapsed_s"] else 0.0
+        print(f"[finance_import] {summary['parsed']:,} rows parsed, {summary['inserted']:,} new – "
+              f"{summary['rows_per_sec']:,.0f} rows/s")
+        if on_progress is not None:
+            await on_progress(dict(summary))
+
+    for record_date, amount, description, category in rows:
+        description = description[:1000]
+        dedupe_key = (record_date, amount, description)
+        seen[dedupe_key] = seen.get(dedupe_key, 0) + 1
+        batch.append({
+            "user_id": user_id,
+            "amount": abs(amount),  # stored positive; the category type carries the sign
+            "signed_amount": amount,
+            "description": description or None,
+            "record_date": record_date,
+            "import_hash": _row_hash(user_id, record_date, amount, description, seen[dedupe_key]),
+            "category": _category_for(amount, description, category),
+        })
+        summary["parsed"] += 1
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    summary["elapsed_s"] = time.perf_counter() - started
+    summary["rows_per_sec"] = summary["parsed"] / summary["elapsed_s"] if summary["elapsed_s"] else 0.0
+    print(f"[finance_import] Done: {path.name} – {summary['inserted']:,} imported, "
+          f"{summary['duplicates']:,} duplicates skipped, {summary['rows_per_sec']:,.0f} rows/s")
+    return summary
+
+def initialize():
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    asyncio.create_task(init_db())
+    print("[finance_import_plugin] Initialized – send a CSV/OFX with caption /import")
+
+async def _cli(user_id: int, path: str):
+    from utils.db_mysql import engine
+    await init_db()
+    try:
+        await import_file(user_id, path)
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a bank export into finance_records")
+    parser.add_argument("user_id", type=int, help="Telegram user id to import for")
+    parser.add_argument("path", help="CSV, OFX or QFX file")
+    args = parser.parse_args()
+    asyncio.run(_cli(args.user_id, args.path))
@@ -2,16 +2,32 @@
 # Finance plugin for RootRecord - tracks income, expenses, debts, assets
 # Categories auto-create with type guessing
 # Commands: /finance (menu), /finance quickstats, /finance add <category> <amount> [desc]
+#           /finance report [month|year] [category] (monthly / yearly summaries)
+#           /finance verify, /finance rebuild (balance totals vs finance_records)
+# finance_balances: one row per user with per-type running totals, updated in the
+# same transaction as each record insert – balance reads are a primary-key lookup
+# Categories are cached per user (name → id, type); an unknown name is created or
+# fetched with one INSERT ... ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id) and
+# cached once the caller's transaction commits
+# finance_rollups: totals per (user, month, category) kept in step with every insert;
+# /finance report [month|year] [category] reads only the months it shows
 
 import asyncio
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, date
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, CallbackQueryHandler, ContextTypes
-from sqlalchemy import text
-from utils.db_mysql import get_db, init_mysql
+from sqlalchemy import event, text
+from utils.db_mysql import get_db, init_mysql, build_multi_insert
+from utils import counters
 
 ROOT = Path(__file__).parent.parent
+CATEGORY_CACHE_USERS = 500  # users whose category maps stay in memory
+
+# user_id -> {lowercased name: (category_id, type)}; keys are lowercased because
+# the utf8mb4 collation behind uk_user_category is case-insensitive
+_category_cache = OrderedDict()
 
 async def init_db():
     print("[finance_plugin] Creating/updating finance tables and view...")
@@ -54,11 +70,46 @@ async def init_db():
             GROUP BY r.user_id;
         '''))
 
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS finance_balances (
+                user_id BIGINT PRIMARY KEY,
+                total_income DECIMAL(15,2) NOT NULL DEFAULT 0,
+                total_expense DECIMAL(15,2) NOT NULL DEFAULT 0,
+                total_debt DECIMAL(15,2) NOT NULL DEFAULT 0,
+                total_asset DECIMAL(15,2) NOT NULL DEFAULT 0,
+                record_count INT NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS finance_rollups (
+                user_id BIGINT NOT NULL,
+                month DATE NOT NULL,
+                category_id BIGINT NOT NULL,
+                total DECIMAL(15,2) NOT NULL DEFAULT 0,
+                record_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month, category_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+
         await session.commit()
+
+        # First run with the balances / rollup tables: seed them from existing records
+        result = await session.execute(text("SELECT COUNT(*) FROM finance_balances"))
+        seed_balances = result.scalar() == 0
+        result = await session.execute(text("SELECT COUNT(*) FROM finance_rollups"))
+        seed_rollups = result.scalar() == 0
+    if seed_balances:
+        rebuilt = await rebuild_balances()
+        print(f"[finance_plugin] Seeded finance_balances for {rebuilt} users")
+    if seed_rollups:
+        rebuilt = await rebuild_rollups()
+        print(f"[finance_plugin] Seeded finance_rollups ({rebuilt} month/category rows)")
     print("[finance_plugin] Finance tables + summary view ready")
 
 CATEGORY_TYPE_MAP = {
-    'salary': 'income', 'paycheck': 'income', 'bonus': 'income',
+    'salary': 'income', 'paycheck': 'income', 'bonus': 'income', 'income': 'income',
     'rent': 'expense', 'groceries': 'expense', 'fuel': 'expense', 'gas': 'expense',
     'coffee': 'expense', 'food': 'expense', 'dinner': 'expense',
     'loan': 'debt', 'credit': 'debt', 'borrow': 'debt',
@@ -72,25 +123,240 @@ def guess_category_type(name: str) -> str:
             return cat_type
     return 'expense'
 
-async def get_or_create_category(session, user_id: int, cat_name: str) -> int:
+async def _user_categories(session, user_id: int) -> dict:
+    """The user's category map, loaded with one SELECT the first time it's needed"""
+    cats = _category_cache.get(user_id)
+    if cats is None:
+        result = await session.execute(text('''
+            SELECT id, name, type FROM finance_categories WHERE user_id = :uid
+        '''), {"uid": user_id})
+        cats = {name.lower(): (cat_id, cat_type) for cat_id, name, cat_type in result.fetchall()}
+        _category_cache[user_id] = cats
+        while len(_category_cache) > CATEGORY_CACHE_USERS:
+            _category_cache.popitem(last=False)
+    _category_cache.move_to_end(user_id)
+    return cats
+
+def invalidate_categories(user_id: int):
+    """Forget a user's cached categories (e.g. after categories were edited in the database)"""
+    _category_cache.pop(user_id, None)
+
+def _publish_categories(session):
+    """after_commit: categories created in the transaction are real now – cache them"""
+    for user_id, created in session.info.pop("pending_categories", {}).items():
+        cats = _category_cache.get(user_id)
+        if cats is not None:  # an evicted map is reloaded from the table anyway
+            cats.update(created)
+
+def _discard_categories(session):
+    """after_rollback: the ids handed out in the transaction no longer exist"""
+    session.info.pop("pending_categories", None)
+
+def _pending_categories(session, user_id: int) -> dict:
+    """Categories created in the session's open transaction, cached only once it commits"""
+    pending = session.info.get("pending_categories")
+    if pending is None:
+        pending = session.info["pending_categories"] = {}
+        sync_session = session.sync_session
+        if not event.contains(sync_session, "after_commit", _publish_categories):
+            event.listen(sync_session, "after_commit", _publish_categories)
+            event.listen(sync_session, "after_rollback", _discard_categories)
+    return pending.setdefault(user_id, {})
+
+async def resolve_category(session, user_id: int, cat_name: str):
+    """
+    (category_id, type) for a user's category, creating it if needed.
+    Known names cost no query. A new name is one atomic insert-or-get in the
+    caller's transaction (no commit here) – a concurrent add of the same name
+    hits the unique key and LAST_INSERT_ID(id) hands back the existing id.
+    New ids reach the shared cache only when the caller commits.
+    """
+    cats = await _user_categories(session, user_id)
+    key = cat_name.lower()
+    if key in cats:
+        return cats[key]
+    pending = _pending_categories(session, user_id)
+    if key in pending:
+        return pending[key]
+
+    # Types are guessed from the name, so a row added concurrently has the same type
     cat_type = guess_category_type(cat_name)
     result = await session.execute(text('''
-        SELECT id FROM finance_categories 
-        WHERE user_id = :uid AND name = :name
-    '''), {"uid": user_id, "name": cat_name})
-    row = result.fetchone()
-    if row:
-        return row[0]
-
-    await session.execute(text('''
         INSERT INTO finance_categories (user_id, name, type)
         VALUES (:uid, :name, :type)
+        ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
     '''), {"uid": user_id, "name": cat_name, "type": cat_type})
-    await session.commit()
-    result = await session.execute(text("SELECT LAST_INSERT_ID()"))
-    return result.scalar()
+    pending[key] = (result.lastrowid, cat_type)
+    return pending[key]
+
+async def get_or_create_category(session, user_id: int, cat_name: str) -> int:
+    cat_id, _ = await resolve_category(session, user_id, cat_name)
+    return cat_id
+
+BALANCE_TYPES = ('income', 'expense', 'debt', 'asset')
+
+async def apply_record_totals(session, user_id: int, rows):
+    """
+    Add newly inserted records to finance_balances in the caller's transaction.
+    rows: iterable of (category_type, amount). One atomic upsert – no read, no lock wait.
+    """
+    totals = {t: 0.0 for t in BALANCE_TYPES}
+    count = 0
+    for cat_type, amount in rows:
+        totals[cat_type] += float(amount)
+        count += 1
+    if not count:
+        return
+    await session.execute(text('''
+        INSERT INTO finance_balances
+            (user_id, total_income, total_expense, total_debt, total_asset, record_count)
+        VALUES (:uid, :income, :expense, :debt, :asset, :count) AS new
+        ON DUPLICATE KEY UPDATE
+            total_income  = finance_balances.total_income  + new.total_income,
+            total_expense = finance_balances.total_expense + new.total_expense,
+            total_debt    = finance_balances.total_debt    + new.total_debt,
+            total_asset   = finance_balances.total_asset   + new.total_asset,
+            record_count  = finance_balances.record_count  + new.record_count
+    '''), {"uid": user_id, **totals, "count": count})
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+async def apply_record_rollups(session, user_id: int, rows):
+    """
+    Add newly inserted records to finance_rollups in the caller's transaction.
+    rows: iterable of (category_id, record_date, amount) – one multi-row upsert.
+    """
+    grouped = {}
+    for category_id, record_date, amount in rows:
+        key = (month_start(record_date), category_id)
+        total, count = grouped.get(key, (0.0, 0))
+        grouped[key] = (total + float(amount), count + 1)
+    if not grouped:
+        return
+    sql, params = build_multi_insert(
+        "finance_rollups", ("user_id", "month", "category_id", "total", "record_count"),
+        [{"user_id": user_id, "month": m, "category_id": c, "total": t, "record_count": n}
+         for (m, c), (t, n) in grouped.items()],
+        suffix='''AS new ON DUPLICATE KEY UPDATE
+            total        = finance_rollups.total + new.total,
+            record_count = finance_rollups.record_count + new.record_count''',
+    )
+    await session.execute(text(sql), params)
+
+async def rebuild_rollups(user_id: int = None) -> int:
+    """Recompute finance_rollups from finance_records (one user or everyone); returns rows written"""
+    where = "WHERE user_id = :uid" if user_id is not None else ""
+    async for session in get_db():
+        await session.execute(text(f"DELETE FROM finance_rollups {where}"), {"uid": user_id})
+        result = await session.execute(text(f'''
+            INSERT INTO finance_rollups (user_id, month, category_id, total, record_count)
+            SELECT user_id,
+                   DATE_SUB(record_date, INTERVAL DAYOFMONTH(record_date) - 1 DAY) AS month,
+                   category_id, SUM(amount), COUNT(*)
+            FROM finance_records
+            {where}
+            GROUP BY user_id, month, category_id
+        '''), {"uid": user_id})
+        await session.commit()
+        written = result.rowcount
+    print(f"[finance] Rebuilt finance_rollups ({written} rows)")
+    return written
+
+_TOTALS_FROM_RECORDS = '''
+    SELECT r.user_id,
+           SUM(CASE WHEN c.type = 'income'  THEN r.amount ELSE 0 END) AS total_income,
+           SUM(CASE WHEN c.type = 'expense' THEN r.amount ELSE 0 END) AS total_expense,
+           SUM(CASE WHEN c.type = 'debt'    THEN r.amount ELSE 0 END) AS total_debt,
+           SUM(CASE WHEN c.type = 'asset'   THEN r.amount ELSE 0 END) AS total_asset,
+           COUNT(*) AS record_count
+    FROM finance_records r
+    JOIN finance_categories c ON r.category_id = c.id
+'''
+
+async def rebuild_balances(user_id: int = None) -> int:
+    """Recompute finance_balances from finance_records (one user or everyone); returns users written"""
+    where = "WHERE r.user_id = :uid" if user_id is not None else ""
+    async for session in get_db():
+        if user_id is not None:
+            await session.execute(text("DELETE FROM finance_balances WHERE user_id = :uid"), {"uid": user_id})
+        else:
+            await session.execute(text("DELETE FROM finance_balances"))
+        result = await session.execute(text(f'''
+            INSERT INTO finance_balances
+                (user_id, total_income, total_expense, total_debt, total_asset, record_count)
+            {_TOTALS_FROM_RECORDS}
+            {where}
+            GROUP BY r.user_id
+        '''), {"uid": user_id})
+        await session.commit()
+        written = result.rowcount
+    print(f"[finance] Rebuilt finance_balances ({written} users)")
+    return written
+
+async def verify_balances(user_id: int) -> dict:
+    """Stored totals vs a fresh aggregate over finance_records: {type: (stored, actual)} for mismatches"""
+    async for session in get_db():
+        result = await session.execute(text(f'''
+            {_TOTALS_FROM_RECORDS}
+            WHERE r.user_id = :uid
+            GROUP BY r.user_id
+        '''), {"uid": user_id})
+        actual = result.mappings().fetchone() or {}
+        stored = await get_balances(user_id, session) or {}
+
+    mismatches = {}
+    for col in ("total_income", "total_expense", "total_debt", "total_asset", "record_count"):
+        a = float(actual.get(col) or 0)
+        b = float(stored.get(col) or 0)
+        if abs(a - b) >= 0.005:
+            mismatches[col] = (b, a)
+    return mismatches
+
+async def get_balances(user_id: int, session=None):
+    """
+    Per-type totals plus derived balance figures for a user (primary-key lookup),
+    or None if the user has no records.
+    """
+    if session is None:
+        async for own_session in get_db():
+            return await get_balances(user_id, own_session)
+        return None
+
+    result = await session.execute(text('''
+        SELECT total_income, total_expense, total_debt, total_asset, record_count
+        FROM finance_balances WHERE user_id = :uid
+    '''), {"uid": user_id})
+    row = result.mappings().fetchone()
+    if row is None:
+        return None
+    balances = dict(row)
+    positive = row["total_income"] + row["total_asset"]
+    negative = row["total_expense"] + row["total_debt"]
+    balances.update(
+        total_positive=positive,
+        total_negative=negative,
+        current_balance=positive - negative,
+        net_worth=positive - negative,
+    )
+    return balances
 
 async def finance_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /finance <subcommand> – CommandHandler("finance") sees every /finance message
+    sub = context.args[0].lower() if context.args else None
+    if sub == "add":
+        await add_record(update, context)
+        return
+    if sub == "quickstats":
+        await show_quickstats(update.message, context)
+        return
+    if sub in ("verify", "rebuild"):
+        await verify_or_rebuild(update, context, rebuild=(sub == "rebuild"))
+        return
+    if sub == "report":
+        await show_report(update, context)
+        return
+
     keyboard = [
         [InlineKeyboardButton("Quick Stats", callback_data="fin_quickstats")],
         [InlineKeyboardButton("Add Record", callback_data="fin_add")],
@@ -119,7 +385,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def add_record(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    args = context.args
+    args = list(context.args or [])
+    if args and args[0].lower() == "add":
+        args = args[1:]  # called as /finance add ...
     if len(args) < 2:
         await update.message.reply_text("Usage: /finance add <category> <amount> [description]")
         return
@@ -135,22 +403,49 @@ async def add_record(update: Update, context: ContextTypes.DEFAULT_TYPE):
     record_date = datetime.now().date()
 
     async for session in get_db():
-        cat_id = await get_or_create_category(session, user_id, cat_name)
-        await session.execute(text('''
-            INSERT INTO finance_records 
-            (user_id, category_id, amount, description, record_date)
-            VALUES (:uid, :cat_id, :amt, :desc, :date)
-        '''), {
-            "uid": user_id,
-            "cat_id": cat_id,
-            "amt": amount,
-            "desc": desc,
-            "date": record_date
-        })
-        await session.commit()
+        try:
+            cat_id, cat_type = await resolve_category(session, user_id, cat_name)
+            await session.execute(text('''
+                INSERT INTO finance_records 
+                (user_id, category_id, amount, description, record_date)
+                VALUES (:uid, :cat_id, :amt, :desc, :date)
+            '''), {
+                "uid": user_id,
+                "cat_id": cat_id,
+                "amt": amount,
+                "desc": desc,
+                "date": record_date
+            })
+            await apply_record_totals(session, user_id, [(cat_type, amount)])
+            await apply_record_rollups(session, user_id, [(cat_id, record_date, amount)])
+            await counters.increment(session, {"finance_entries": 1})
+            await session.commit()
+        except Exception as e:
+            print(f"[finance] Add failed for user {user_id}: {e}")
+            await update.message.reply_text(f"Error adding record: {e}")
+            return
 
     await update.message.reply_text(f"Record added: {cat_name} ${amount:,.2f}")
 
+async def verify_or_rebuild(update: Update, context: ContextTypes.DEFAULT_TYPE, rebuild: bool = False):
+    user_id = update.effective_user.id
+    mismatches = await verify_balances(user_id)
+    if not mismatches and not rebuild:
+        await update.message.reply_text("Balances verified – running totals match your records.")
+    elif not rebuild:
+        lines = [f"{col}: stored {stored:,.2f} vs records {actual:,.2f}"
+                 for col, (stored, actual) in mismatches.items()]
+        await update.message.reply_text(
+            "Balance totals are out of sync:\n" + "\n".join(lines) + "\n\nFix with /finance rebuild"
+        )
+    if rebuild:
+        await rebuild_balances(user_id)
+        await rebuild_rollups(user_id)
+        await update.message.reply_text(
+            f"Rebuilt balances ({len(mismatches)} totals corrected) and monthly report rollups."
+        )
+    print(f"[finance] User {user_id} ran balance {'rebuild' if rebuild else 'verify'}: {len(mismatches)} mismatches")
+
 async def show_quickstats(query_or_update, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(query_or_update, 'message'):
         message = query_or_update.message
@@ -159,21 +454,18 @@ async def show_quickstats(query_or_update, context: ContextTypes.DEFAULT_TYPE):
         message = query_or_update
         user_id = message.chat.id
 
-    text = "No records yet. Add one with /finance add"
-    async for session in get_db():
-        result = await session.execute(text('''
-            SELECT current_balance, total_positive, total_negative, net_worth
-            FROM finance_summary WHERE user_id = :uid
-        '''), {"uid": user_id})
-        row = result.fetchone()
-        if row and row[0] is not None:
-            bal, pos, neg, nw = row
-            text = f"**Quick Stats**\nBalance: **${bal:,.2f}**\nIncome+Assets: **${pos:,.2f}**\nExpenses+Debts: **${neg:,.2f}**\nNet Worth: **${nw:,.2f}**"
+    reply = "No records yet. Add one with /finance add"
+    b = await get_balances(user_id)
+    if b:
+        reply = (f"**Quick Stats**\nBalance: **${b['current_balance']:,.2f}**\n"
+                 f"Income+Assets: **${b['total_positive']:,.2f}**\n"
+                 f"Expenses+Debts: **${b['total_negative']:,.2f}**\n"
+                 f"Net Worth: **${b['net_worth']:,.2f}**")
 
     if hasattr(message, 'reply_text'):
-        await message.reply_text(text, parse_mode="Markdown")
+        await message.reply_text(reply, parse_mode="Markdown")
     else:
-        await message.edit_text(text, parse_mode="Markdown")
+        await message.edit_text(reply, parse_mode="Markdown")
 
 async def show_categories(query_or_update, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(query_or_update, 'message'):
@@ -183,19 +475,19 @@ async def show_categories(query_or_update, context: ContextTypes.DEFAULT_TYPE):
         message = query_or_update
         user_id = message.chat.id
 
-    text = "No categories yet — add your first record!"
+    reply = "No categories yet — add your first record!"
     async for session in get_db():
         result = await session.execute(text('''
             SELECT name, type FROM finance_categories WHERE user_id = :uid
         '''), {"uid": user_id})
         cats = result.fetchall()
         if cats:
-            text = "**Your Categories**\n" + "\n".join(f"• {c[0]} ({c[1]})" for c in cats)
+            reply = "**Your Categories**\n" + "\n".join(f"• {c[0]} ({c[1]})" for c in cats)
 
     if hasattr(message, 'reply_text'):
-        await message.reply_text(text, parse_mode="Markdown")
+        await message.reply_text(reply, parse_mode="Markdown")
     else:
-        await message.edit_text(text, parse_mode="Markdown")
+        await message.edit_text(reply, parse_mode="Markdown")
 
 async def show_balance(query_or_update, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(query_or_update, 'message'):
@@ -205,19 +497,15 @@ async def show_balance(query_or_update, context: ContextTypes.DEFAULT_TYPE):
         message = query_or_update
         user_id = message.chat.id
 
-    text = "No records yet."
-    async for session in get_db():
-        result = await session.execute(text('''
-            SELECT current_balance FROM finance_summary WHERE user_id = :uid
-        '''), {"uid": user_id})
-        row = result.fetchone()
-        if row and row[0] is not None:
-            text = f"💰 Current Balance: **${row[0]:,.2f}**"
+    reply = "No records yet."
+    b = await get_balances(user_id)
+    if b:
+        reply = f"💰 Current Balance: **${b['current_balance']:,.2f}**"
 
     if hasattr(message, 'reply_text'):
-        await message.reply_text(text, parse_mode="Markdown")
+        await message.reply_text(reply, parse_mode="Markdown")
     else:
-        await message.edit_text(text, parse_mode="Markdown")
+        await message.edit_text(reply, parse_mode="Markdown")
 
 async def show_networth(query_or_update, context: ContextTypes.DEFAULT_TYPE):
     if hasattr(query_or_update, 'message'):
@@ -227,21 +515,116 @@ async def show_networth(query_or_update, context: ContextTypes.DEFAULT_TYPE):
         message = query_or_update
         user_id = message.chat.id
 
-    text = "No records yet."
-    async for session in get_db():
-        result = await session.execute(text('''
-            SELECT net_worth FROM finance_summary WHERE user_id = :uid
-        '''), {"uid": user_id})
-        row = result.fetchone()
-        if row and row[0] is not None:
-            text = f"🌐 Net Worth: **${row[0]:,.2f}**"
+    reply = "No records yet."
+    b = await get_balances(user_id)
+    if b:
+        reply = f"🌐 Net Worth: **${b['net_worth']:,.2f}**"
 
     if hasattr(message, 'reply_text'):
-        await message.reply_text(text, parse_mode="Markdown")
+        await message.reply_text(reply, parse_mode="Markdown")
+    else:
+        await message.edit_text(reply, parse_mode="Markdown")
+
+POSITIVE_TYPES = ('income', 'asset')
+
+def _shift_month(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def _delta(current: float, previous: float) -> str:
+    diff = current - previous
+    if previous:
+        return f"{'▲' if diff >= 0 else '▼'} {diff:+,.2f} ({diff / abs(previous) * 100:+.0f}%)"
+    return f"{'▲' if diff >= 0 else '▼'} {diff:+,.2f}" if diff else "–"
+
+async def get_rollups(user_id: int, first_month: date, last_month: date, category_id: int = None):
+    """{month: {category_id: (name, type, total)}} for [first_month, last_month] – primary-key range read"""
+    months = {}
+    async for session in get_db():
+        result = await session.execute(text(f'''
+            SELECT r.month, r.category_id, c.name, c.type, r.total
+            FROM finance_rollups r
+            JOIN finance_categories c ON c.id = r.category_id
+            WHERE r.user_id = :uid
+              AND r.month BETWEEN :first AND :last
+              {"AND r.category_id = :cid" if category_id is not None else ""}
+        '''), {"uid": user_id, "first": first_month, "last": last_month, "cid": category_id})
+        for month, cid, name, cat_type, total in result.fetchall():
+            months.setdefault(month, {})[cid] = (name, cat_type, float(total))
+    return months
+
+def _month_totals(categories: dict) -> dict:
+    totals = {t: 0.0 for t in BALANCE_TYPES}
+    for _, cat_type, total in categories.values():
+        totals[cat_type] = totals.get(cat_type, 0.0) + total
+    totals["net"] = totals["income"] + totals["asset"] - totals["expense"] - totals["debt"]
+    return totals
+
+def _top_categories(months: dict, limit: int = 5):
+    combined = {}
+    for categories in months.values():
+        for cid, (name, cat_type, total) in categories.items():
+            prev = combined.get(cid, (name, cat_type, 0.0))
+            combined[cid] = (name, cat_type, prev[2] + total)
+    return sorted(combined.values(), key=lambda c: c[2], reverse=True)[:limit]
+
+async def show_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/finance report [month|year] [category] – served from finance_rollups"""
+    user_id = update.effective_user.id
+    args = [a for a in (context.args or [])[1:]]
+    period = "month"
+    if args and args[0].lower() in ("month", "year"):
+        period = args.pop(0).lower()
+
+    category_id = None
+    category_name = " ".join(args) if args else None
+    if category_name:
+        async for session in get_db():
+            cats = await _user_categories(session, user_id)
+        match = cats.get(category_name.lower())
+        if match is None:
+            await update.message.reply_text(f"No category '{category_name}'. See /finance → View Categories.")
+            return
+        category_id = match[0]
+
+    this_month = month_start(datetime.now().date())
+    span = 1 if period == "month" else 12
+    first = _shift_month(this_month, -span)  # one extra month for the first delta
+    months = await get_rollups(user_id, first, this_month, category_id)
+    title = f" – {category_name}" if category_name else ""
+
+    if period == "month":
+        current = _month_totals(months.get(this_month, {}))
+        previous = _month_totals(months.get(first, {}))
+        lines = [f"**Finance Report – {this_month:%B %Y}{title}**"]
+        for cat_type, label in (("income", "Income"), ("expense", "Expenses"), ("debt", "Debt"), ("asset", "Assets")):
+            if current[cat_type] or previous[cat_type]:
+                lines.append(f"{label}: **${current[cat_type]:,.2f}** {_delta(current[cat_type], previous[cat_type])}")
+        lines.append(f"Net: **${current['net']:,.2f}** {_delta(current['net'], previous['net'])} vs {first:%b}")
+        top = _top_categories({this_month: months.get(this_month, {})})
     else:
-        await message.edit_text(text, parse_mode="Markdown")
+        lines = [f"**Finance Report – last 12 months{title}**"]
+        prev_net = _month_totals(months.get(first, {}))["net"]
+        for i in range(1, span + 1):
+            month = _shift_month(first, i)
+            totals = _month_totals(months.get(month, {}))
+            positive = sum(totals[t] for t in POSITIVE_TYPES)
+            negative = totals["expense"] + totals["debt"]
+            lines.append(f"{month:%b %Y}: in ${positive:,.0f} / out ${negative:,.0f} / "
+                         f"net ${totals['net']:,.0f} {_delta(totals['net'], prev_net)}")
+            prev_net = totals["net"]
+        top = _top_categories({m: c for m, c in months.items() if m > first})
+
+    if top and not category_name:
+        lines.append("\n**Top categories**")
+        lines += [f"{i}. {name} ({cat_type}): ${total:,.2f}" for i, (name, cat_type, total) in enumerate(top, 1)]
+    if len(lines) == 2 and not months:
+        lines.append("No records in this period yet.")
+
+    await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+    print(f"[finance] User {user_id} viewed {period} report ({len(months)} months read)")
 
 def initialize():
     asyncio.create_task(init_mysql())
     asyncio.create_task(init_db())
-    print("[finance_plugin] Initialized – /finance menu + summary view ready")
\ No newline at end of file
+    print("[finance_plugin] Initialized – /finance menu + running balances ready")
\ No newline at end of file
@@ -6,22 +6,49 @@
 #   - Async Nominatim call via to_thread
 #   - Graceful handling of no previous ping / geocoding failures
 #   - Exported async def enrich_ping(ping_id, lat, lon) for telegram_plugin to call
+#   - Per-user previous-ping cache (warmed from idx_user_id_id, fed by ping_ingest)
+#     so distance-from-previous is per user and costs no DB round trip
+#   - reverse_geocode() checks utils/geocode_cache (LRU + MySQL) before Nominatim
+#   - Nominatim calls go through utils/geocode_worker (1 req/s token bucket,
+#     coalescing, retry/backoff); each user's newest ping takes the live lane
+#   - Newly committed pings are enriched automatically via the ping_ingest listener,
+#     through a bounded queue and ENRICH_WORKERS workers (overflow is left to enrich_backfill)
+#   - GEOCODER_BACKEND selects nominatim / offline (utils/offline_geocoder KD-tree
+#     over a GeoNames dump) / offline+nominatim (offline first pass, Nominatim refines)
 
 import asyncio
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from sqlalchemy import text
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable, GeocoderServiceError
 
 from utils.db_mysql import get_db, init_mysql
+from utils import ping_ingest, geocode_cache
+from utils.geocode_worker import GeocodeWorker, PRIORITY_LIVE, PRIORITY_BACKFILL
+from utils.offline_geocoder import OfflineGeocoder
 
 ROOT = Path(__file__).parent.parent
 USER_AGENT = "RootRecordBot/1.42 (contact: wildecho94@gmail.com)"
+RECENT_PINGS_PER_USER = 8  # enough to enrich a few pings that arrived in one batch
+NOMINATIM_RATE_PER_SEC = 1.0  # Nominatim usage policy: max 1 request/second
+ENRICH_WORKERS = 4         # committed pings enriched concurrently
+ENRICH_QUEUE_MAX = 5000    # committed pings waiting for a worker; beyond this they're left to enrich_backfill
+
+# "nominatim" | "offline" | "offline+nominatim"
+GEOCODER_BACKEND = "offline+nominatim"
+OFFLINE_DATASET = ROOT / "data" / "cities1000.txt"  # GeoNames dump; falls back to Nominatim if missing
 
 geolocator = Nominatim(user_agent=USER_AGENT)
 
+# user_id -> deque of (ping_id, lat, lon), oldest first, contiguous per user
+_recent_pings = {}
+_enrich_queue = None  # asyncio.Queue of (ping_id, lat, lon, user_id, priority), bounded
+_enrich_workers = []
+_enrich_dropped = 0
+offline_geocoder = None  # OfflineGeocoder once load_offline_geocoder() finishes
+
 async def init_db():
     print("[geopy_plugin] Creating/updating geopy_enriched table in MySQL...")
     async for session in get_db():
@@ -53,18 +80,117 @@ async def init_db():
                 print("[geopy_plugin] Index idx_ping_id already exists")
             else:
                 print(f"[geopy_plugin] Index creation failed: {e}")
+
+        try:
+            await session.execute(text('''
+                CREATE INDEX idx_user_id_id ON gps_records (user_id, id)
+            '''))
+            await session.commit()
+            print("[geopy_plugin] Created index idx_user_id_id on gps_records")
+        except Exception as e:
+            if "Duplicate key name" in str(e):
+                print("[geopy_plugin] Index idx_user_id_id already exists")
+            else:
+                print(f"[geopy_plugin] Index creation failed: {e}")
     print("[geopy_plugin] Geopy enriched table and indexes ready")
+    await geocode_cache.init_db()
+    await warm_last_position_cache()
+
+async def warm_last_position_cache():
+    """Load each user's newest ping (loose index scan on idx_user_id_id)"""
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT g.user_id, g.id, g.latitude, g.longitude
+            FROM gps_records g
+            JOIN (
+                SELECT user_id, MAX(id) AS max_id
+                FROM gps_records
+                GROUP BY user_id
+            ) latest ON latest.max_id = g.id
+        '''))
+        rows = result.fetchall()
+
+    for user_id, ping_id, lat, lon in rows:
+        recent = _recent_pings.get(user_id)
+        if recent is None:
+            _recent_pings[user_id] = deque([(ping_id, lat, lon)], maxlen=RECENT_PINGS_PER_USER)
+        elif ping_id < recent[0][0]:
+            # Newer pings were inserted while warming – this one is their predecessor
+            recent.appendleft((ping_id, lat, lon))
+    print(f"[geopy_plugin] Last-position cache warmed for {len(rows)} users")
+
+def remember_ping(user_id: int, ping_id: int, lat: float, lon: float):
+    """Record a freshly inserted ping as the user's newest known position"""
+    recent = _recent_pings.get(user_id)
+    if recent is None:
+        _recent_pings[user_id] = deque([(ping_id, lat, lon)], maxlen=RECENT_PINGS_PER_USER)
+    elif ping_id > recent[-1][0]:
+        recent.append((ping_id, lat, lon))
+
+async def _on_pings_committed(rows):
+    global _enrich_dropped
+    newest = {}
+    for row in rows:
+        remember_ping(row["user_id"], row["id"], row["latitude"], row["longitude"])
+        newest[row["user_id"]] = row["id"]
+
+    if _enrich_queue is None:
+        return
+    dropped = 0
+    for row in rows:
+        priority = PRIORITY_LIVE if newest[row["user_id"]] == row["id"] else PRIORITY_BACKFILL
+        try:
+            _enrich_queue.put_nowait((row["id"], row["latitude"], row["longitude"], row["user_id"], priority))
+        except asyncio.QueueFull:
+            dropped += 1
+    if dropped:
+        # Never block the ingest flusher – these stay un-enriched until enrich_backfill runs
+        _enrich_dropped += dropped
+        print(f"[geopy] Enrich queue full – left {dropped} ping(s) for the backfill "
+              f"({_enrich_dropped} total)")
+
+async def _enrich_worker():
+    while True:
+        item = await _enrich_queue.get()
+        try:
+            if item is None:
+                return
+            ping_id, lat, lon, user_id, priority = item
+            await enrich_ping(ping_id, lat, lon, user_id, priority=priority)
+        except Exception as e:
+            print(f"[geopy] Enrichment failed for ping {item[0]}: {e}")
+        finally:
+            _enrich_queue.task_done()
+
+def get_cached_previous_position(user_id: int, ping_id: int):
+    """
+    (lat, lon) of the user's ping right before ping_id, or None when the cache
+    can't answer with certainty (the caller then falls back to the index).
+    """
+    recent = _recent_pings.get(user_id)
+    if not recent or recent[0][0] >= ping_id:
+        return None
+    for cached_id, lat, lon in reversed(recent):
+        if cached_id < ping_id:
+            return lat, lon
+    return None
+
+async def get_last_ping_location(ping_id: int, user_id: int = None):
+    """Fetch lat/lon of the same user's ping right before this one (cache first, then idx_user_id_id)"""
+    if user_id is not None:
+        cached = get_cached_previous_position(user_id, ping_id)
+        if cached:
+            return cached
 
-async def get_last_ping_location(ping_id: int):
-    """Fetch lat/lon of the most recent ping before this one (same user implied via ordering)"""
     async for session in get_db():
         result = await session.execute(text('''
             SELECT latitude, longitude
             FROM gps_records
-            WHERE id < :ping_id
+            WHERE user_id = COALESCE(:user_id, (SELECT user_id FROM gps_records WHERE id = :ping_id))
+              AND id < :ping_id
             ORDER BY id DESC
             LIMIT 1
-        '''), {"ping_id": ping_id})
+        '''), {"ping_id": ping_id, "user_id": user_id})
         row = result.fetchone()
         if row:
             print(f"[geopy] Found previous ping location: ({row[0]:.6f}, {row[1]:.6f})")
@@ -73,52 +199,92 @@ async def get_last_ping_location(ping_id: int):
             print("[geopy] No previous ping found – skipping distance calc")
     return None, None
 
-async def enrich_ping(ping_id: int, lat: float, lon: float):
-    """
-    Enrichment entry point – called after every new gps_records insert.
-    Performs reverse geocoding + distance from prev ping.
-    Saves result to geopy_enriched.
-    """
-    print(f"[geopy] Starting enrichment for ping_id={ping_id} at ({lat:.6f}, {lon:.6f})")
+async def _nominatim_reverse(lat: float, lon: float):
+    """Blocking Nominatim call in a thread; raises geopy errors for the worker to retry"""
+    location = await asyncio.to_thread(
+        geolocator.reverse,
+        (lat, lon),
+        exactly_one=True,
+        timeout=10
+    )
+    if not location:
+        print("[geopy] Nominatim returned no result for this coordinate")
+        # 'Unknown', not NULL: a NULL city marks a failed lookup for enrich_backfill to retry
+        return {"address": None, "city": "Unknown", "country": "Unknown"}
 
-    address = city = country = None
-    distance_m = None
+    raw = location.raw.get('address', {})
+    address = location.address
+    city = raw.get('city') or raw.get('town') or raw.get('village') or raw.get('hamlet') or 'Unknown'
+    country = raw.get('country', 'Unknown')
+    print(f"[geopy] Geocoded successfully: {city}, {country}")
+    print(f"[geopy] Full address: {address[:120]}{'...' if len(address) > 120 else ''}")
+    return {"address": address, "city": city, "country": country}
 
-    # Reverse geocode (run blocking Nominatim in thread to avoid blocking asyncio)
+geocoder = GeocodeWorker(_nominatim_reverse, rate_per_sec=NOMINATIM_RATE_PER_SEC, name="geopy_worker")
+
+async def load_offline_geocoder():
+    """Build the gazetteer KD-tree off the event loop (a few seconds for cities1000)"""
+    global offline_geocoder
+    if GEOCODER_BACKEND == "nominatim":
+        return
+    if not OFFLINE_DATASET.exists():
+        print(f"[geopy_plugin] Offline dataset not found ({OFFLINE_DATASET}) – Nominatim only")
+        return
     try:
-        location = await asyncio.to_thread(
-            geolocator.reverse,
-            (lat, lon),
-            exactly_one=True,
-            timeout=10
-        )
-        if location:
-            raw = location.raw.get('address', {})
-            address = location.address
-            city = raw.get('city') or raw.get('town') or raw.get('village') or raw.get('hamlet') or 'Unknown'
-            country = raw.get('country', 'Unknown')
-            print(f"[geopy] Geocoded successfully: {city}, {country}")
-            print(f"[geopy] Full address: {address[:120]}{'...' if len(address) > 120 else ''}")
-        else:
-            print("[geopy] Nominatim returned no result for this coordinate")
-    except GeocoderTimedOut:
-        print("[geopy] Geocoding timed out – skipping address")
-    except GeocoderUnavailable:
-        print("[geopy] Geocoding service unavailable – skipping address")
-    except GeocoderServiceError as e:
-        print(f"[geopy] Nominatim service error: {e}")
+        offline_geocoder = await asyncio.to_thread(OfflineGeocoder.from_file, OFFLINE_DATASET)
     except Exception as e:
-        print(f"[geopy] Unexpected geocoding error: {type(e).__name__}: {e}")
+        print(f"[geopy_plugin] Offline geocoder failed to load: {e}")
 
-    # Calculate distance from previous ping
-    prev_lat, prev_lon = await get_last_ping_location(ping_id)
-    if prev_lat is not None and prev_lon is not None:
-        try:
-            distance_m = geodesic((prev_lat, prev_lon), (lat, lon)).meters
-            print(f"[geopy] Distance from previous ping: {distance_m:.1f} meters")
-        except Exception as e:
-            print(f"[geopy] Distance calculation failed: {e}")
+def offline_place(lat: float, lon: float):
+    """Nearest city/country from the local gazetteer, or None if it isn't loaded"""
+    if offline_geocoder is None:
+        return None
+    hit = offline_geocoder.nearest(lat, lon)
+    if hit is None:
+        return None
+    return {"address": None, "city": hit["city"], "country": hit["country"]}
+
+async def _cached_place(lat: float, lon: float):
+    try:
+        cached = await geocode_cache.get(lat, lon)
+    except Exception as e:
+        print(f"[geopy] Geocode cache lookup failed: {e}")
+        return None
+    if cached is not None:
+        print(f"[geopy] Geocode cache hit: {cached['city']}, {cached['country']}")
+    return cached
 
+async def _nominatim_place(lat: float, lon: float, priority: int, wait_for_slot: bool):
+    place = await geocoder.submit(lat, lon, priority, wait_for_slot)
+    if place is None:
+        print("[geopy] No geocoding result (queue full or lookup failed) – skipping address")
+        return None
+    try:
+        await geocode_cache.put(lat, lon, place)
+    except Exception as e:
+        print(f"[geopy] Geocode cache store failed: {e}")
+    return place
+
+async def reverse_geocode(lat: float, lon: float, priority: int = PRIORITY_LIVE, wait_for_slot: bool = False):
+    """
+    Place dict for a coordinate using GEOCODER_BACKEND:
+    cache hit in microseconds, then the offline gazetteer and/or a
+    rate-limited Nominatim lookup through the worker (stored on success).
+    Returns None if nothing could be resolved.
+    """
+    if GEOCODER_BACKEND != "offline":
+        cached = await _cached_place(lat, lon)
+        if cached is not None:
+            return cached
+        if GEOCODER_BACKEND == "nominatim" or offline_geocoder is None:
+            return await _nominatim_place(lat, lon, priority, wait_for_slot)
+    quick = offline_place(lat, lon)
+    if quick is None or GEOCODER_BACKEND == "offline":
+        return quick
+    return await _nominatim_place(lat, lon, priority, wait_for_slot) or quick
+
+async def _save_enrichment(ping_id: int, lat: float, lon: float, place, distance_m):
+    place = place or {}
     # Save to DB using alias syntax to avoid VALUES() deprecation warning
     try:
         async for session in get_db():
@@ -141,9 +307,9 @@ async def enrich_ping(ping_id: int, lat: float, lon: float):
                 "ping_id": ping_id,
                 "latitude": lat,
                 "longitude": lon,
-                "address": address,
-                "city": city,
-                "country": country,
+                "address": place.get("address"),
+                "city": place.get("city"),
+                "country": place.get("country"),
                 "distance_m": distance_m
             })
             await session.commit()
@@ -151,7 +317,62 @@ async def enrich_ping(ping_id: int, lat: float, lon: float):
     except Exception as e:
         print(f"[geopy] Failed to save enriched data for ping {ping_id}: {e}")
 
+async def enrich_ping(ping_id: int, lat: float, lon: float, user_id: int = None,
+                      priority: int = PRIORITY_LIVE):
+    """
+    Enrichment entry point – called after every new gps_records insert.
+    Performs reverse geocoding + distance from prev ping.
+    Saves result to geopy_enriched.
+    """
+    print(f"[geopy] Starting enrichment for ping_id={ping_id} at ({lat:.6f}, {lon:.6f})")
+
+    distance_m = None
+
+    # Calculate distance from previous ping
+    prev_lat, prev_lon = await get_last_ping_location(ping_id, user_id)
+    if prev_lat is not None and prev_lon is not None:
+        try:
+            distance_m = geodesic((prev_lat, prev_lon), (lat, lon)).meters
+            print(f"[geopy] Distance from previous ping: {distance_m:.1f} meters")
+        except Exception as e:
+            print(f"[geopy] Distance calculation failed: {e}")
+
+    if GEOCODER_BACKEND == "offline+nominatim" and offline_geocoder is not None:
+        cached = await _cached_place(lat, lon)
+        if cached is not None:
+            await _save_enrichment(ping_id, lat, lon, cached, distance_m)
+            return
+        # Fast first pass: city/country from the gazetteer right away,
+        # then refine with the full Nominatim address when the worker gets to it
+        quick = offline_place(lat, lon)
+        await _save_enrichment(ping_id, lat, lon, quick, distance_m)
+        refined = await _nominatim_place(lat, lon, priority, False)
+        if refined is not None:
+            await _save_enrichment(ping_id, lat, lon, refined, distance_m)
+        return
+
+    place = await reverse_geocode(lat, lon, priority)
+    await _save_enrichment(ping_id, lat, lon, place, distance_m)
+
+async def shutdown():
+    # Queued lookups resolve to None; pings not started yet are left to the backfill,
+    # in-flight enrichments finish their writes
+    await geocoder.shutdown()
+    if _enrich_queue is not None:
+        while not _enrich_queue.empty():
+            _enrich_queue.get_nowait()
+            _enrich_queue.task_done()
+        for _ in _enrich_workers:
+            _enrich_queue.put_nowait(None)
+        await asyncio.gather(*_enrich_workers, return_exceptions=True)
+
 def initialize():
+    global _enrich_queue
+    _enrich_queue = asyncio.Queue(maxsize=ENRICH_QUEUE_MAX)
+    _enrich_workers.extend(asyncio.create_task(_enrich_worker()) for _ in range(ENRICH_WORKERS))
+    ping_ingest.register_listener(_on_pings_committed)
+    geocoder.start()
     asyncio.create_task(init_mysql())
     asyncio.create_task(init_db())
+    asyncio.create_task(load_offline_geocoder())
     print("[geopy_plugin] Initialized – enrich_ping ready to be called on new pings")
\ No newline at end of file
@@ -0,0 +1,261 @@
+# Plugin_Files/gps_odometer_plugin.py
+# Version: 1.42.20260118 – GPS-derived miles between fill-ups
+#   When fill-ups have no (or bad) odometer readings, the miles between two full
+#   tanks are estimated from the user's own GPS track between the two fill_dates.
+#   One query on gps_records (user_id, timestamp) loads the track for every
+#   uncached interval of a user's vehicles at once; cumulative track distance is
+#   computed in one vectorized call and each interval is a difference of two
+#   bisected indexes. Estimates are cached per fill-up pair in fillup_gps_miles
+#   (intervals without enough pings are not, so late pings still count). Estimates
+#   are dropped when a fill-up forces a vehicle rebuild or late pings are committed.
+#   Assumes the user's pings between fills are that vehicle's driving.
+
+import asyncio
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, text
+
+from utils.db_mysql import get_db, build_multi_insert
+from utils import ping_ingest
+from utils.distance import track_distances_m
+
+METERS_PER_MILE = 1609.344
+MIN_PINGS_PER_INTERVAL = 2  # fewer than this → no estimate for the interval
+LATE_PING_SEC = 60  # pings committed this long after their timestamp may change cached estimates
+
+async def init_db():
+    print("[gps_odometer] Creating/updating fillup_gps_miles table...")
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS fillup_gps_miles (
+                from_fill_id INT NOT NULL,
+                to_fill_id INT NOT NULL,
+                vehicle_id INT NOT NULL,
+                miles DOUBLE,
+                ping_count INT NOT NULL DEFAULT 0,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (from_fill_id, to_fill_id),
+                INDEX idx_vehicle (vehicle_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+        try:
+            await session.execute(text('''
+                CREATE INDEX idx_user_timestamp ON gps_records (user_id, timestamp)
+            '''))
+            await session.commit()
+            print("[gps_odometer] Created index idx_user_timestamp on gps_records")
+        except Exception as e:
+            if "Duplicate key name" in str(e):
+                print("[gps_odometer] Index idx_user_timestamp already exists")
+            else:
+                print(f"[gps_odometer] Index creation failed: {e}")
+    print("[gps_odometer] fillup_gps_miles ready")
+
+def _ping_time(fill_date: datetime) -> datetime:
+    """fill_date is stored in UTC, gps_records.timestamp in server local time"""
+    return fill_date.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def full_tank_intervals(fills):
+    """
+    [(from_fill_id, to_fill_id, user_id, start, end, gallons, cost)] between consecutive
+    full tanks; partial fills in between add their fuel to the closing tank.
+    fills: (id, user_id, gallons, price, is_full_tank, fill_date) in date order.
+    """
+    intervals = []
+    prev_full = None
+    gallons = cost = 0.0
+    for fill_id, user_id, g, price, is_full, fill_date in fills:
+        gallons += g
+        cost += g * price
+        if not is_full:
+            continue
+        if prev_full is not None and gallons > 0:
+            intervals.append((prev_full[0], fill_id, user_id, prev_full[1], fill_date, gallons, cost))
+        prev_full = (fill_id, fill_date)
+        gallons = cost = 0.0
+    return intervals
+
+async def _load_track(user_id: int, ranges):
+    """
+    (timestamps, cumulative meters) for one user over the given [start, end] ranges –
+    one statement; the OR'd ranges are separate index ranges on (user_id, timestamp),
+    so stretches already cached in between aren't read. Differences of the cumulative
+    distance are only meaningful within one range.
+    """
+    where = " OR ".join(f"timestamp BETWEEN :start{i} AND :end{i}" for i in range(len(ranges)))
+    params = {"user_id": user_id}
+    for i, (start, end) in enumerate(ranges):
+        params[f"start{i}"] = _ping_time(start)
+        params[f"end{i}"] = _ping_time(end)
+    async for session in get_db():
+        result = await session.execute(text(f'''
+            SELECT timestamp, latitude, longitude
+            FROM gps_records
+            WHERE user_id = :user_id
+              AND ({where})
+            ORDER BY timestamp, id
+        '''), params)
+        rows = result.fetchall()
+    times = [r[0] for r in rows]
+    _, cumulative = track_distances_m([r[1] for r in rows], [r[2] for r in rows])
+    return times, cumulative
+
+async def estimate_interval_miles(intervals_by_vehicle: dict) -> dict:
+    """
+    {(from_fill_id, to_fill_id): miles or None} for {vehicle_id: full_tank_intervals()}.
+    Cached pairs cost nothing; the rest share one track query per user. Only real
+    estimates are cached – an interval without pings yet (ingest lag, a later
+    backfill) is looked at again next time instead of staying None forever.
+    """
+    intervals_by_vehicle = {vid: ivs for vid, ivs in intervals_by_vehicle.items() if ivs}
+    if not intervals_by_vehicle:
+        return {}
+
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT from_fill_id, to_fill_id, miles
+            FROM fillup_gps_miles
+            WHERE vehicle_id IN :vids
+              AND miles IS NOT NULL
+        ''').bindparams(bindparam("vids", expanding=True)), {"vids": list(intervals_by_vehicle)})
+        cached = {(r[0], r[1]): r[2] for r in result.fetchall()}
+
+    miles = {}
+    missing = {}
+    for vehicle_id, intervals in intervals_by_vehicle.items():
+        for interval in intervals:
+            key = interval[:2]
+            if key in cached:
+                miles[key] = cached[key]
+            else:
+                missing.setdefault(interval[2], []).append((vehicle_id, interval))
+
+    new_rows = []
+    for user_id, user_intervals in missing.items():
+        times, cumulative = await _load_track(user_id, [(i[3], i[4]) for _, i in user_intervals])
+        for vehicle_id, (from_id, to_id, _, start, end, _, _) in user_intervals:
+            lo = bisect_left(times, _ping_time(start))
+            hi = bisect_right(times, _ping_time(end)) - 1
+            count = max(0, hi - lo + 1)
+            estimate = None
+            if count >= MIN_PINGS_PER_INTERVAL:
+                estimate = float(cumulative[hi] - cumulative[lo]) / METERS_PER_MILE
+                new_rows.append({"from_fill_id": from_id, "to_fill_id": to_id, "vehicle_id": vehicle_id,
+                                 "miles": estimate, "ping_count": count})
+            miles[(from_id, to_id)] = estimate
+
+    if new_rows:
+        sql, params = build_multi_insert(
+            "fillup_gps_miles", ("from_fill_id", "to_fill_id", "vehicle_id", "miles", "ping_count"), new_rows,
+            suffix="AS new ON DUPLICATE KEY UPDATE miles = new.miles, ping_count = new.ping_count",
+        )
+        async for session in get_db():
+            await session.execute(text(sql), params)
+            await session.commit()
+        print(f"[gps_odometer] Estimated {len(new_rows)} interval(s) for {len(intervals_by_vehicle)} vehicle(s)")
+    return miles
+
+async def invalidate_vehicle(vehicle_id: int, session=None):
+    """
+    Drop a vehicle's cached estimates after its fill-ups were edited, deleted or
+    backdated. Pass the caller's session to run inside its transaction (caller commits).
+    """
+    if session is None:
+        async for own_session in get_db():
+            await invalidate_vehicle(vehicle_id, own_session)
+            await own_session.commit()
+        return
+    await session.execute(text('''
+        DELETE FROM fillup_gps_miles WHERE vehicle_id = :vid
+    '''), {"vid": vehicle_id})
+
+async def _on_pings_committed(rows):
+    """
+    Late pings (spill replay, queue lag, imports) can fall inside intervals that were
+    already estimated: drop every cached estimate of that user ending at or after the
+    oldest late ping. Live pings are newer than any fill-up and cost nothing.
+    """
+    cutoff = datetime.now() - timedelta(seconds=LATE_PING_SEC)
+    oldest = {}
+    for row in rows:
+        ts = row["timestamp"]
+        if ts < cutoff and (row["user_id"] not in oldest or ts < oldest[row["user_id"]]):
+            oldest[row["user_id"]] = ts
+    if not oldest:
+        return
+    async for session in get_db():
+        for user_id, ts in oldest.items():
+            # gps_records.timestamp is local time, fill_date UTC
+            since = ts.astimezone(timezone.utc).replace(tzinfo=None)
+            result = await session.execute(text('''
+                DELETE m FROM fillup_gps_miles m
+                JOIN fuel_records f ON f.id = m.to_fill_id
+                WHERE f.user_id = :user_id AND f.fill_date >= :since
+            '''), {"user_id": user_id, "since": since})
+            if result.rowcount:
+                print(f"[gps_odometer] Late pings for user {user_id} – dropped {result.rowcount} cached estimate(s)")
+        await session.commit()
+
+def _stats_from_intervals(vehicle_id: int, intervals, miles: dict):
+    total_miles = total_gallons = total_cost = 0.0
+    counted = []
+    for interval in intervals:
+        estimate = miles.get(interval[:2])
+        if not estimate:
+            continue
+        total_miles += estimate
+        total_gallons += interval[5]
+        total_cost += interval[6]
+        counted.append(interval)
+
+    if not counted or total_gallons <= 0:
+        print(f"[gps_odometer] No GPS-covered full-tank intervals for vehicle {vehicle_id}")
+        return None
+
+    return {
+        'mpg': total_miles / total_gallons,
+        'miles': total_miles,
+        'gallons': total_gallons,
+        'cost': total_cost,
+        'cost_per_mile': total_cost / total_miles if total_miles > 0 else 0.0,
+        'fill_count': len(counted),
+        'period_start': counted[0][3].strftime('%Y-%m-%d'),
+        'period_end': counted[-1][4].strftime('%Y-%m-%d'),
+        'source': 'gps',
+    }
+
+async def gps_fuel_stats_many(vehicle_ids) -> dict:
+    """
+    {vehicle_id: stats or None} – full-tank-to-full-tank stats with miles from the
+    GPS track instead of the odometer, for several vehicles at once: one fuel_records
+    query, one cache query and one track query per user, however many vehicles.
+    Same dict shape as vehicles_plugin.calculate_fuel_stats plus 'source': 'gps'.
+    """
+    vehicle_ids = list(vehicle_ids)
+    if not vehicle_ids:
+        return {}
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT vehicle_id, id, user_id, gallons, price, is_full_tank, fill_date
+            FROM fuel_records
+            WHERE vehicle_id IN :vids
+            ORDER BY vehicle_id, fill_date ASC, id ASC
+        ''').bindparams(bindparam("vids", expanding=True)), {"vids": vehicle_ids})
+        fills = {vid: [] for vid in vehicle_ids}
+        for row in result.fetchall():
+            fills[row[0]].append(row[1:])
+
+    intervals = {vid: full_tank_intervals(vehicle_fills) for vid, vehicle_fills in fills.items()}
+    miles = await estimate_interval_miles(intervals)
+    return {vid: _stats_from_intervals(vid, intervals[vid], miles) for vid in vehicle_ids}
+
+async def gps_fuel_stats(vehicle_id: int):
+    """gps_fuel_stats_many() for a single vehicle"""
+    return (await gps_fuel_stats_many([vehicle_id]))[vehicle_id]
+
+def initialize():
+    ping_ingest.register_listener(_on_pings_committed)
+    asyncio.create_task(init_db())
+    print("[gps_odometer_plugin] Initialized – GPS miles between fill-ups ready")
@@ -0,0 +1,142 @@
+# Plugin_Files/live_location_plugin.py
+# Version: 1.42.20260118 – Live-location stream mode with server-side downsampling
+#   Telegram delivers a shared live location as a stream of edited_message updates
+#   (every few seconds). Each user's last kept point is held in memory and a new
+#   point is only stored when it crosses a distance, time or heading threshold.
+#   Thresholds are per user (live_location_settings table, /live command).
+#   Kept vs dropped counters are exposed through stats() and /live; they are kept in
+#   memory since the last restart, per user for the USER_COUNTERS_MAX most recent users.
+
+import asyncio
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+
+from utils.db_mysql import get_db
+from utils.distance import haversine_m, bearing_deg, heading_delta_deg
+
+DEFAULT_THRESHOLDS = {
+    "min_distance_m": 50.0,    # keep once the user moved this far from the last kept point
+    "max_interval_s": 300,     # ...or this long passed since the last kept point
+    "min_heading_deg": 30.0,   # ...or the direction of travel turned this much
+}
+HEADING_MIN_MOVE_M = 10.0      # ignore heading changes while (almost) standing still
+USER_COUNTERS_MAX = 1000       # users whose kept/dropped counts are held (least recently active evicted)
+
+_thresholds = {}    # user_id -> overrides loaded from live_location_settings
+_last_kept = {}     # user_id -> (lat, lon, heading, kept_at)
+_counters = {"kept": 0, "dropped": 0}
+_user_counters = OrderedDict()  # user_id -> {"kept": n, "dropped": n}, in memory since restart
+
+async def init_db():
+    print("[live_location] Creating/updating live_location_settings table...")
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS live_location_settings (
+                user_id BIGINT PRIMARY KEY,
+                min_distance_m DOUBLE NOT NULL,
+                max_interval_s INT NOT NULL,
+                min_heading_deg DOUBLE NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+        result = await session.execute(text('''
+            SELECT user_id, min_distance_m, max_interval_s, min_heading_deg
+            FROM live_location_settings
+        '''))
+        for uid, dist, interval, heading in result.fetchall():
+            _thresholds[uid] = {
+                "min_distance_m": dist,
+                "max_interval_s": interval,
+                "min_heading_deg": heading,
+            }
+    print(f"[live_location] Settings loaded for {len(_thresholds)} users")
+
+def get_thresholds(user_id: int) -> dict:
+    return _thresholds.get(user_id, DEFAULT_THRESHOLDS)
+
+async def set_thresholds(user_id: int, min_distance_m: float, max_interval_s: int, min_heading_deg: float):
+    async for session in get_db():
+        await session.execute(text('''
+            INSERT INTO live_location_settings (user_id, min_distance_m, max_interval_s, min_heading_deg)
+            VALUES (:uid, :dist, :interval, :heading) AS new
+            ON DUPLICATE KEY UPDATE
+                min_distance_m  = new.min_distance_m,
+                max_interval_s  = new.max_interval_s,
+                min_heading_deg = new.min_heading_deg
+        '''), {"uid": user_id, "dist": min_distance_m, "interval": max_interval_s, "heading": min_heading_deg})
+        await session.commit()
+    _thresholds[user_id] = {
+        "min_distance_m": min_distance_m,
+        "max_interval_s": max_interval_s,
+        "min_heading_deg": min_heading_deg,
+    }
+    print(f"[live_location] Thresholds for user {user_id}: {_thresholds[user_id]}")
+
+async def reset_thresholds(user_id: int):
+    async for session in get_db():
+        await session.execute(text('''
+            DELETE FROM live_location_settings WHERE user_id = :uid
+        '''), {"uid": user_id})
+        await session.commit()
+    _thresholds.pop(user_id, None)
+
+def start_stream(user_id: int):
+    """A new live-location share began – forget the previous stream's state"""
+    _last_kept.pop(user_id, None)
+
+def should_keep(user_id: int, lat: float, lon: float, heading: float = None, now: float = None):
+    """
+    Decide whether a live-location update is worth storing.
+    Returns (keep, reason). Kept points become the new reference point.
+    """
+    now = time.time() if now is None else now
+    limits = get_thresholds(user_id)
+    counters = _user_counters.get(user_id)
+    if counters is None:
+        counters = _user_counters[user_id] = {"kept": 0, "dropped": 0}
+        while len(_user_counters) > USER_COUNTERS_MAX:
+            _user_counters.popitem(last=False)
+    _user_counters.move_to_end(user_id)
+    last = _last_kept.get(user_id)
+
+    reason = None
+    if last is None:
+        reason = "first"
+    else:
+        last_lat, last_lon, last_heading, last_at = last
+        moved = haversine_m(last_lat, last_lon, lat, lon)
+        if heading is None and moved >= HEADING_MIN_MOVE_M:
+            heading = bearing_deg(last_lat, last_lon, lat, lon)
+
+        if moved >= limits["min_distance_m"]:
+            reason = "distance"
+        elif now - last_at >= limits["max_interval_s"]:
+            reason = "time"
+        elif (heading is not None and last_heading is not None
+              and moved >= HEADING_MIN_MOVE_M
+              and heading_delta_deg(heading, last_heading) >= limits["min_heading_deg"]):
+            reason = "heading"
+
+    if reason is None:
+        _counters["dropped"] += 1
+        counters["dropped"] += 1
+        return False, None
+
+    if heading is None and last is not None:
+        heading = last[2]
+    _last_kept[user_id] = (lat, lon, heading, now)
+    _counters["kept"] += 1
+    counters["kept"] += 1
+    return True, reason
+
+def stats(user_id: int = None) -> dict:
+    if user_id is not None:
+        return dict(_user_counters.get(user_id, {"kept": 0, "dropped": 0}))
+    return {**_counters, "active_streams": len(_last_kept)}
+
+def initialize():
+    asyncio.create_task(init_db())
+    print("[live_location_plugin] Initialized – live-location downsampling ready")
@@ -2,24 +2,29 @@
 # Version: 1.42.20260117 – Fixed import issue + added basic logging
 # Now safely imports from vehicles_plugin without crashing if function missing
 # Provides a fallback /mpg command with useful message if stats not ready
+# All vehicles come from one batched query (get_user_fuel_stats) instead of
+# one stats query per vehicle; MPG is full-tank to full-tank
+# Vehicles without usable odometer readings fall back to GPS-estimated miles,
+# estimated for all of them in one batch (gps_fuel_stats_many)
 
 from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 
 # Safe import – try to get real stats function, fallback if missing
 try:
-    from .vehicles_plugin import get_user_vehicles, calculate_fuel_stats
+    from .vehicles_plugin import get_user_fuel_stats
+    from .gps_odometer_plugin import gps_fuel_stats_many
     REAL_STATS_AVAILABLE = True
 except ImportError as e:
     print(f"[mpg_plugin] Import warning: {e} – using fallback mode")
     REAL_STATS_AVAILABLE = False
 
     # Dummy fallbacks to prevent crashes
-    async def get_user_vehicles(user_id):
+    async def get_user_fuel_stats(user_id):
         return []
 
-    async def calculate_fuel_stats(vehicle_id):
-        return None
+    async def gps_fuel_stats_many(vehicle_ids):
+        return {}
 
 async def cmd_mpg(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -34,7 +39,7 @@ async def cmd_mpg(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print("[mpg] Responded with fallback message (real stats import failed)")
         return
 
-    vehicles = await get_user_vehicles(user_id)
+    vehicles = await get_user_fuel_stats(user_id)
 
     if not vehicles:
         await update.message.reply_text(
@@ -43,24 +48,29 @@ async def cmd_mpg(update: Update, context: ContextTypes.DEFAULT_TYPE):
         print(f"[mpg] No vehicles for user {user_id}")
         return
 
+    # GPS-estimated miles for every vehicle without odometer stats, in one batch
+    gps_stats = await gps_fuel_stats_many([v[0] for v in vehicles if not v[6]])
+
     text = "**Your Fuel Efficiency Summary**\n\n"
     has_data = False
 
-    for vid, plate, year, make, model, initial_odo in vehicles:
-        stats = await calculate_fuel_stats(vid)
-        if stats and stats.get('fill_count', 0) > 1:
+    for vid, plate, year, make, model, initial_odo, stats in vehicles:
+        if not stats:
+            stats = gps_stats.get(vid)
+        if stats and stats.get('fill_count', 0) > 0:
             has_data = True
+            from_gps = stats.get('source') == 'gps'
             text += f"**{year} {make} {model} ({plate})**\n"
-            text += f"  • Overall MPG: **{stats['mpg']:.1f}**\n"
-            text += f"  • Total miles driven: **{stats['miles']:,}** mi\n"
+            text += f"  • Overall MPG: **{stats['mpg']:.1f}**{' (GPS miles)' if from_gps else ''}\n"
+            text += f"  • Total miles driven: **{stats['miles']:,.0f}** mi\n"
             text += f"  • Total fuel used: **{stats['gallons']:.2f}** gal\n"
             text += f"  • Total fuel cost: **${stats['cost']:,.2f}**\n"
             text += f"  • Cost per mile: **${stats['cost_per_mile']:.3f}**\n"
-            text += f"  • Fill-ups counted: {stats['fill_count']}\n"
+            text += f"  • Full-tank intervals: {stats['fill_count']}\n"
             text += f"  • Period: {stats.get('period_start', 'N/A')} to {stats.get('period_end', 'N/A')}\n\n"
             print(f"[mpg] Stats generated for vehicle {vid} ({plate})")
         else:
-            text += f"**{year} {make} {model} ({plate})**: Not enough fill-up data yet (need multiple logged with odometer)\n\n"
+            text += f"**{year} {make} {model} ({plate})**: Not enough fill-up data yet (need 2+ full tanks with odometer or GPS pings in between)\n\n"
             print(f"[mpg] Insufficient data for vehicle {vid} ({plate})")
 
     if not has_data:
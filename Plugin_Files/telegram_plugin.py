@@ -2,6 +2,8 @@
 # RootRecord Telegram bot core - polling, commands, location handling
 # Token from config_telegram.json, absolute import for start
 # Single polling start enforced, no duplicates
+# Location pings are queued in utils/ping_ingest and group-committed in batches
+# Live-location edits are downsampled by live_location_plugin before queueing
 
 import logging
 import asyncio
@@ -20,14 +22,21 @@ from telegram.ext import (
 )
 
 from utils.db_mysql import engine
+from utils import ping_ingest
 from sqlalchemy import text
 
 # Finance handlers
 from .finance_plugin import (
     finance_menu,
     button_handler,
-    add_record,
-    show_quickstats
+)
+
+from . import live_location_plugin
+
+# Fill-up flow (/fillup itself comes from commands/fillup_cmd.py)
+from .fillup_plugin import (
+    handle_fillup_callback,
+    handle_fillup_data,
 )
 
 # Absolute import for start
@@ -65,28 +74,48 @@ _init_lock = asyncio.Lock()
 async def init_db():
     async with engine.begin() as conn:
         await conn.execute(text("SELECT 1"))
-    logger.info("[telegram_plugin] DB connection tested")
+        await conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS gps_records (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                latitude DOUBLE NOT NULL,
+                longitude DOUBLE NOT NULL,
+                timestamp DATETIME NOT NULL,
+                chat_id BIGINT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+    logger.info("[telegram_plugin] DB connection tested, gps_records ready")
 
 async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not update.message or not update.message.location:
+    # Live location arrives as the first message plus a stream of edited_message
+    # updates; MessageHandler passes both here, so use effective_message
+    message = update.effective_message
+    if not message or not message.location:
         return
 
     user = update.effective_user
-    loc = update.message.location
+    loc = message.location
+    is_edit = update.edited_message is not None
+
+    if is_edit or loc.live_period:
+        if not is_edit:
+            live_location_plugin.start_stream(user.id)
+        keep, _ = live_location_plugin.should_keep(user.id, loc.latitude, loc.longitude, loc.heading)
+        if not keep:
+            return
 
-    async with engine.connect() as conn:
-        await conn.execute(text('''
-            INSERT INTO gps_records (user_id, latitude, longitude, timestamp, chat_id)
-            VALUES (:uid, :lat, :lon, NOW(), :chat_id)
-        '''), {
-            "uid": user.id,
-            "lat": loc.latitude,
-            "lon": loc.longitude,
-            "chat_id": update.effective_chat.id
-        })
-        await conn.commit()
-
-    await update.message.reply_text(f"Location logged: {loc.latitude:.6f}, {loc.longitude:.6f}")
+    # Write-behind: the flusher group-commits this with other queued pings
+    await ping_ingest.enqueue(user.id, loc.latitude, loc.longitude, update.effective_chat.id)
+
+    # Only the initial message gets a reply – never answer every live update
+    if not is_edit:
+        if loc.live_period:
+            await message.reply_text(
+                f"Live location logging started: {loc.latitude:.6f}, {loc.longitude:.6f}\n"
+                f"Points are kept when you move, turn, or every few minutes (/live to tune)."
+            )
+        else:
+            await message.reply_text(f"Location logged: {loc.latitude:.6f}, {loc.longitude:.6f}")
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error(f"Exception while handling update: {context.error}")
@@ -108,10 +137,14 @@ async def bot_main():
         application.add_error_handler(error_handler)
 
         # Finance handlers
+        # /finance add|quickstats|verify|rebuild are dispatched inside finance_menu
         application.add_handler(CommandHandler("finance", finance_menu))
         application.add_handler(CallbackQueryHandler(button_handler, pattern="^fin_"))
-        application.add_handler(MessageHandler(filters.Regex(r'^/finance add '), add_record))
-        application.add_handler(MessageHandler(filters.Regex(r'^/finance quickstats'), show_quickstats))
+
+        # Fill-up handlers: full/partial buttons, then "gallons price [odometer]"
+        application.add_handler(CallbackQueryHandler(handle_fillup_callback, pattern="^fillup_"))
+        application.add_handler(MessageHandler(
+            filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, handle_fillup_data))
 
         # Dynamic command loading - only once
         loaded = set()
@@ -156,10 +189,13 @@ async def shutdown_bot():
             await application.updater.stop()
         await application.stop()
         await application.shutdown()
-        await engine.dispose()
+    # Updates have stopped – write out queued pings before the engine goes away
+    await ping_ingest.shutdown()
+    await engine.dispose()
     logger.info("[telegram_plugin] Bot shutdown complete")
 
 def initialize():
+    ping_ingest.start()
     asyncio.create_task(init_db())
     asyncio.create_task(bot_main())
     print("[telegram_plugin] Initialized – polling starting")
\ No newline at end of file
@@ -0,0 +1,309 @@
+# Plugin_Files/trips_plugin.py
+# Version: 1.42.20260118 – Incremental trip / stop segmentation from the ping stream
+#   Each user is either stopped (inside a dwell circle) or moving. A trip starts
+#   when a ping leaves the dwell circle and ends once the user stays within
+#   DWELL_RADIUS_M for DWELL_TIME_S (or goes quiet for MAX_GAP_S). Finished trips
+#   land in `trips` with distance, duration and start/end places.
+#   Only pings past the job_checkpoints watermark are read (PK range scan), and
+#   per-user state lives in `trip_state`, so history is never rescanned – the
+#   first run walks existing pings once, after that each ingest batch wakes the
+#   consumer for just the new rows.
+
+import asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from utils.db_mysql import engine, get_db, build_multi_insert
+from utils import checkpoints, counters, ping_ingest
+from utils.distance import haversine_m
+from Plugin_Files import geopy_plugin
+
+JOB_NAME = "trips"
+DWELL_RADIUS_M = 100.0       # pings within this circle count as "not going anywhere"
+DWELL_TIME_S = 300           # ...for this long → the trip ended at the circle's first ping
+MAX_GAP_S = 1800             # no ping for this long while moving → trip ended at the last ping
+MIN_TRIP_DISTANCE_M = 250.0  # shorter "trips" are GPS drift around a stop
+READ_CHUNK = 2000
+IDLE_CHECK_SEC = 300         # how often open trips are checked for MAX_GAP_S without new pings
+
+TRIP_COLUMNS = (
+    "user_id", "start_ping_id", "end_ping_id", "start_time", "end_time",
+    "duration_s", "distance_m", "ping_count",
+    "start_lat", "start_lon", "end_lat", "end_lon",
+    "start_place", "end_place",
+)
+STATE_COLUMNS = (
+    "user_id", "moving",
+    "anchor_ping_id", "anchor_lat", "anchor_lon", "anchor_time", "anchor_distance_m", "anchor_ping_count",
+    "start_ping_id", "start_lat", "start_lon", "start_time",
+    "last_ping_id", "last_lat", "last_lon", "last_time",
+    "distance_m", "ping_count",
+)
+
+_states = {}      # user_id -> state dict (STATE_COLUMNS)
+_wake = None      # asyncio.Event set by the ping_ingest listener
+_consumer = None
+_stats = {"pings": 0, "trips": 0, "discarded": 0}
+
+async def init_db():
+    print("[trips] Creating/updating trips + trip_state tables...")
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS trips (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                start_ping_id INT NOT NULL,
+                end_ping_id INT NOT NULL,
+                start_time DATETIME NOT NULL,
+                end_time DATETIME NOT NULL,
+                duration_s INT NOT NULL,
+                distance_m DOUBLE NOT NULL,
+                ping_count INT NOT NULL,
+                start_lat DOUBLE, start_lon DOUBLE,
+                end_lat DOUBLE, end_lon DOUBLE,
+                start_place VARCHAR(255),
+                end_place VARCHAR(255),
+                UNIQUE KEY uk_user_start (user_id, start_ping_id),
+                INDEX idx_user_start_time (user_id, start_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS trip_state (
+                user_id BIGINT PRIMARY KEY,
+                moving TINYINT NOT NULL DEFAULT 0,
+                anchor_ping_id INT, anchor_lat DOUBLE, anchor_lon DOUBLE, anchor_time DATETIME,
+                anchor_distance_m DOUBLE, anchor_ping_count INT,
+                start_ping_id INT, start_lat DOUBLE, start_lon DOUBLE, start_time DATETIME,
+                last_ping_id INT, last_lat DOUBLE, last_lon DOUBLE, last_time DATETIME,
+                distance_m DOUBLE NOT NULL DEFAULT 0,
+                ping_count INT NOT NULL DEFAULT 0
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+    await checkpoints.init_db()
+    await _load_states()
+    print(f"[trips] Tables ready, state loaded for {len(_states)} users")
+
+async def _load_states():
+    _states.clear()
+    async for session in get_db():
+        result = await session.execute(text(f"SELECT {', '.join(STATE_COLUMNS)} FROM trip_state"))
+        for row in result.mappings():
+            _states[row["user_id"]] = dict(row)
+
+def _place_name(lat: float, lon: float):
+    place = geopy_plugin.offline_place(lat, lon)
+    if not place or not place.get("city"):
+        return None
+    return f"{place['city']}, {place['country']}"[:255]
+
+def _stop_at(state: dict, ping_id: int, lat: float, lon: float, ts: datetime):
+    state.update(moving=0, anchor_ping_id=ping_id, anchor_lat=lat, anchor_lon=lon, anchor_time=ts,
+                 anchor_distance_m=0.0, anchor_ping_count=0,
+                 start_ping_id=None, start_lat=None, start_lon=None, start_time=None,
+                 distance_m=0.0, ping_count=0)
+
+def _close_trip(state: dict, user_id: int, end_ping_id: int, end_lat: float, end_lon: float,
+                end_time: datetime, distance_m: float, ping_count: int):
+    """Trip dict for a finished movement, or None if it was just drift"""
+    duration_s = int((end_time - state["start_time"]).total_seconds())
+    if distance_m < MIN_TRIP_DISTANCE_M or duration_s <= 0:
+        _stats["discarded"] += 1
+        return None
+    return {
+        "user_id": user_id,
+        "start_ping_id": state["start_ping_id"],
+        "end_ping_id": end_ping_id,
+        "start_time": state["start_time"],
+        "end_time": end_time,
+        "duration_s": duration_s,
+        "distance_m": distance_m,
+        "ping_count": ping_count,
+        "start_lat": state["start_lat"],
+        "start_lon": state["start_lon"],
+        "end_lat": end_lat,
+        "end_lon": end_lon,
+        "start_place": _place_name(state["start_lat"], state["start_lon"]),
+        "end_place": _place_name(end_lat, end_lon),
+    }
+
+def _close_at_last(state: dict, user_id: int):
+    trip = _close_trip(state, user_id, state["last_ping_id"], state["last_lat"], state["last_lon"],
+                       state["last_time"], state["distance_m"], state["ping_count"])
+    _stop_at(state, state["last_ping_id"], state["last_lat"], state["last_lon"], state["last_time"])
+    return trip
+
+def step(user_id: int, ping_id: int, lat: float, lon: float, ts: datetime):
+    """Advance one user's state machine by one ping; returns a finished trip dict or None"""
+    state = _states.get(user_id)
+    if state is None:
+        state = {"user_id": user_id}
+        _stop_at(state, ping_id, lat, lon, ts)
+        state.update(last_ping_id=ping_id, last_lat=lat, last_lon=lon, last_time=ts)
+        _states[user_id] = state
+        return None
+
+    trip = None
+    if state["moving"] and (ts - state["last_time"]).total_seconds() >= MAX_GAP_S:
+        trip = _close_at_last(state, user_id)
+
+    step_m = haversine_m(state["last_lat"], state["last_lon"], lat, lon)
+    from_anchor = haversine_m(state["anchor_lat"], state["anchor_lon"], lat, lon)
+
+    if not state["moving"]:
+        if from_anchor > DWELL_RADIUS_M:
+            # Left the stop: the trip starts at the last ping inside it – but after a
+            # MAX_GAP_S silence the departure time is unknown, so the clock starts at
+            # this ping rather than counting the gap as driving
+            gap_s = (ts - state["last_time"]).total_seconds()
+            start_time = ts if gap_s >= MAX_GAP_S else state["last_time"]
+            state.update(moving=1,
+                         start_ping_id=state["last_ping_id"], start_lat=state["last_lat"],
+                         start_lon=state["last_lon"], start_time=start_time,
+                         distance_m=step_m, ping_count=2,
+                         anchor_ping_id=ping_id, anchor_lat=lat, anchor_lon=lon, anchor_time=ts,
+                         anchor_distance_m=step_m, anchor_ping_count=2)
+    else:
+        state["distance_m"] += step_m
+        state["ping_count"] += 1
+        if from_anchor <= DWELL_RADIUS_M:
+            if (ts - state["anchor_time"]).total_seconds() >= DWELL_TIME_S:
+                # Dwelled long enough: the trip ended when the user first entered this circle
+                trip = _close_trip(state, user_id, state["anchor_ping_id"], state["anchor_lat"],
+                                   state["anchor_lon"], state["anchor_time"],
+                                   state["anchor_distance_m"], state["anchor_ping_count"])
+                _stop_at(state, state["anchor_ping_id"], state["anchor_lat"],
+                         state["anchor_lon"], state["anchor_time"])
+        else:
+            state.update(anchor_ping_id=ping_id, anchor_lat=lat, anchor_lon=lon, anchor_time=ts,
+                         anchor_distance_m=state["distance_m"], anchor_ping_count=state["ping_count"])
+
+    state.update(last_ping_id=ping_id, last_lat=lat, last_lon=lon, last_time=ts)
+    return trip
+
+async def _save(trips, touched, watermark=None):
+    async with engine.begin() as conn:
+        if trips:
+            sql, params = build_multi_insert("trips", TRIP_COLUMNS, trips, verb="INSERT IGNORE")
+            result = await conn.execute(text(sql), params)
+            await counters.increment(conn, {"activities": result.rowcount})
+        if touched:
+            rows = [_states[uid] for uid in touched]
+            updates = ",\n".join(f"{c} = new.{c}" for c in STATE_COLUMNS[1:])
+            sql, params = build_multi_insert("trip_state", STATE_COLUMNS, rows,
+                                             suffix=f"AS new ON DUPLICATE KEY UPDATE {updates}")
+            await conn.execute(text(sql), params)
+        if watermark is not None:
+            await checkpoints.set_watermark(conn, JOB_NAME, watermark)
+    _stats["trips"] += len(trips)
+
+async def _consume_new_pings() -> int:
+    """Process every gps_records row past the watermark; returns how many were read"""
+    async with engine.connect() as conn:
+        watermark = await checkpoints.get_watermark(conn, JOB_NAME)
+
+    total = 0
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(text('''
+                SELECT id, user_id, latitude, longitude, timestamp
+                FROM gps_records
+                WHERE id > :watermark
+                ORDER BY id
+                LIMIT :limit
+            '''), {"watermark": watermark, "limit": READ_CHUNK})
+            rows = result.fetchall()
+        if not rows:
+            return total
+
+        trips, touched = [], set()
+        for row in rows:
+            trip = step(row.user_id, row.id, row.latitude, row.longitude, row.timestamp)
+            touched.add(row.user_id)
+            if trip:
+                trips.append(trip)
+        try:
+            await _save(trips, touched, rows[-1].id)
+        except Exception:
+            await _load_states()  # in-memory state ran ahead of the DB – roll it back
+            raise
+
+        watermark = rows[-1].id
+        total += len(rows)
+        _stats["pings"] += len(rows)
+        if trips:
+            print(f"[trips] {len(trips)} trip(s) finished (up to ping {watermark})")
+        if len(rows) < READ_CHUNK:
+            return total
+
+async def _close_idle_trips():
+    """Users who stopped sending pings mid-trip: close once MAX_GAP_S has passed"""
+    cutoff = datetime.now() - timedelta(seconds=MAX_GAP_S)
+    trips, touched = [], set()
+    for user_id, state in _states.items():
+        if state["moving"] and state["last_time"] <= cutoff:
+            trip = _close_at_last(state, user_id)
+            touched.add(user_id)
+            if trip:
+                trips.append(trip)
+    if touched:
+        try:
+            await _save(trips, touched)
+        except Exception:
+            await _load_states()
+            raise
+        print(f"[trips] Closed {len(trips)} idle trip(s)")
+
+async def _on_pings_committed(rows):
+    if _wake is not None:
+        _wake.set()
+
+async def _run_consumer():
+    await init_db()
+    read = await _consume_new_pings()
+    print(f"[trips] Caught up ({read} pings since last run)")
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), IDLE_CHECK_SEC)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            await _consume_new_pings()
+            await _close_idle_trips()
+        except Exception as e:
+            print(f"[trips] Segmentation pass failed: {e}")
+
+async def get_recent_trips(user_id: int, limit: int = 5):
+    """Newest finished trips for a user (idx_user_start_time)"""
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT start_time, end_time, duration_s, distance_m, start_place, end_place
+            FROM trips
+            WHERE user_id = :user_id
+            ORDER BY start_time DESC
+            LIMIT :limit
+        '''), {"user_id": user_id, "limit": limit})
+        return [dict(r) for r in result.mappings()]
+    return []
+
+def current_state(user_id: int):
+    state = _states.get(user_id)
+    if state is None:
+        return None
+    return "moving" if state["moving"] else "stopped"
+
+def stats() -> dict:
+    return {**_stats, "users": len(_states), "moving": sum(1 for s in _states.values() if s["moving"])}
+
+async def shutdown():
+    if _consumer is not None:
+        _consumer.cancel()
+        await asyncio.gather(_consumer, return_exceptions=True)
+
+def initialize():
+    global _wake, _consumer
+    _wake = asyncio.Event()
+    ping_ingest.register_listener(_on_pings_committed)
+    _consumer = asyncio.create_task(_run_consumer())
+    print("[trips_plugin] Initialized – trip segmentation follows the ping stream")
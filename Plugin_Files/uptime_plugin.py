@@ -1,20 +1,32 @@
 # Plugin_Files/uptime_plugin.py
-# Version: 1.42.20260117 – FULL MySQL migration (no SQLite left)
+# Version: 1.42.20260118 – FULL MySQL migration (no SQLite left)
 #         Uses shared async get_db() for all queries
 #         Tables: uptime_records (events), uptime_stats (snapshots)
 #         Periodic: every 60s calculate + print + save snapshot
 #         /uptime command: real async query + formatted reply
 #         Shutdown: async record 'stop' event
 #         Handles unpaired starts, crashes, no events
+#         uptime_checkpoint: running totals + last event folded so far; the periodic
+#         tick and /uptime only read events past it (/uptime rebuild recomputes it)
+#         uptime_heartbeat: one row upserted every HEARTBEAT_INTERVAL s; a run that
+#         ended without a 'stop' gets a 'crash' event at its last heartbeat on the
+#         next startup, so downtime is accurate to one heartbeat
+#         'stop' is recorded from shutdown() on the running loop (core calls it)
+#         read_uptime_stats(): lock-free, write-free variant for the dashboard
 
 import asyncio
 from datetime import datetime, timedelta
 from sqlalchemy import text
 
 from utils.db_mysql import get_db, init_mysql
+from utils import scheduler
 from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 
+FOLD_BATCH = 10000  # events read per query while catching the checkpoint up
+HEARTBEAT_INTERVAL = 30  # seconds – worst-case error on a crash's downtime
+SNAPSHOT_INTERVAL = 60
+
 YELLOW = "\033[93m"
 RESET  = "\033[0m"
 
@@ -38,19 +50,144 @@ async def init_db():
                 status ENUM('running', 'stopped') NOT NULL
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
         '''))
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS uptime_checkpoint (
+                id TINYINT PRIMARY KEY,
+                last_event_id INT NOT NULL DEFAULT 0,
+                last_event ENUM('start', 'stop', 'crash') NULL,
+                last_ts DATETIME NULL,
+                total_up_s DOUBLE NOT NULL DEFAULT 0,
+                total_down_s DOUBLE NOT NULL DEFAULT 0,
+                updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS uptime_heartbeat (
+                id TINYINT PRIMARY KEY,
+                last_alive DATETIME NOT NULL
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
         await session.commit()
     print("[uptime_plugin] Uptime tables ready (MySQL)")
 
-async def calculate_uptime_stats():
+def format_td(td):
+    days = td.days
+    hours, rem = divmod(td.seconds, 3600)
+    mins, secs = divmod(rem, 60)
+    parts = []
+    if days: parts.append(f"{days}d")
+    if hours: parts.append(f"{hours}h")
+    if mins: parts.append(f"{mins}m")
+    if secs or not parts: parts.append(f"{secs}s")
+    return " ".join(parts)
+
+def fold_events(state: dict, events) -> dict:
+    """
+    Fold (id, event_type, timestamp) rows, oldest first, into the accumulator.
+    Time after a 'start' counts as up, after a 'stop'/'crash' as down.
+    """
+    for event_id, event_type, ts in events:
+        if state["last_ts"] is not None:
+            delta = (ts - state["last_ts"]).total_seconds()
+            if state["last_event"] == "start":
+                state["total_up_s"] += delta
+            elif state["last_event"] in ("stop", "crash"):
+                state["total_down_s"] += delta
+        state["last_event"] = event_type
+        state["last_ts"] = ts
+        state["last_event_id"] = event_id
+    return state
+
+async def refresh_checkpoint():
+    """
+    Fold events newer than the checkpoint into it and save it – O(new events).
+    Returns (state dict, server NOW()) so the open interval uses the clock the events use.
+    """
     async for session in get_db():
         result = await session.execute(text('''
-            SELECT event_type, timestamp
-            FROM uptime_records
-            ORDER BY timestamp ASC
+            SELECT last_event_id, last_event, last_ts, total_up_s, total_down_s, NOW()
+            FROM uptime_checkpoint
+            WHERE id = 1
+            FOR UPDATE
         '''))
-        events = result.fetchall()
+        row = result.fetchone()
+        state = {"last_event_id": 0, "last_event": None, "last_ts": None, "total_up_s": 0.0, "total_down_s": 0.0}
+        if row is not None:
+            state.update(last_event_id=row[0], last_event=row[1], last_ts=row[2],
+                         total_up_s=float(row[3]), total_down_s=float(row[4]))
+            now = row[5]
+        else:
+            now = (await session.execute(text("SELECT NOW()"))).scalar()
 
-    if not events:
+        folded = 0
+        while True:
+            result = await session.execute(text('''
+                SELECT id, event_type, timestamp
+                FROM uptime_records
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :batch
+            '''), {"last_id": state["last_event_id"], "batch": FOLD_BATCH})
+            events = result.fetchall()
+            fold_events(state, events)
+            folded += len(events)
+            if len(events) < FOLD_BATCH:
+                break
+
+        if folded or row is None:
+            await session.execute(text('''
+                INSERT INTO uptime_checkpoint (id, last_event_id, last_event, last_ts, total_up_s, total_down_s)
+                VALUES (1, :last_event_id, :last_event, :last_ts, :total_up_s, :total_down_s)
+                AS new ON DUPLICATE KEY UPDATE
+                    last_event_id = new.last_event_id,
+                    last_event    = new.last_event,
+                    last_ts       = new.last_ts,
+                    total_up_s    = new.total_up_s,
+                    total_down_s  = new.total_down_s
+            '''), state)
+        await session.commit()
+    return state, now
+
+async def rebuild_uptime_checkpoint():
+    """Recompute the accumulator from the whole event log"""
+    async for session in get_db():
+        await session.execute(text("DELETE FROM uptime_checkpoint WHERE id = 1"))
+        await session.commit()
+    state, _ = await refresh_checkpoint()
+    print(f"[uptime_plugin] Rebuilt uptime checkpoint up to event {state['last_event_id']}")
+    return state
+
+async def read_uptime_stats():
+    """
+    Read-only uptime for frequent pollers (the in-process dashboard): no row lock,
+    no write, no log line. Events the periodic tick hasn't folded yet (normally
+    none) are folded in memory only.
+    """
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT last_event_id, last_event, last_ts, total_up_s, total_down_s, NOW()
+            FROM uptime_checkpoint
+            WHERE id = 1
+        '''))
+        row = result.fetchone()
+        state = {"last_event_id": 0, "last_event": None, "last_ts": None, "total_up_s": 0.0, "total_down_s": 0.0}
+        if row is not None:
+            state.update(last_event_id=row[0], last_event=row[1], last_ts=row[2],
+                         total_up_s=float(row[3]), total_down_s=float(row[4]))
+            now = row[5]
+        else:
+            now = (await session.execute(text("SELECT NOW()"))).scalar()
+        result = await session.execute(text('''
+            SELECT id, event_type, timestamp
+            FROM uptime_records
+            WHERE id > :last_id
+            ORDER BY id
+        '''), {"last_id": state["last_event_id"]})
+        fold_events(state, result.fetchall())
+    return _stats_from_state(state, now)
+
+def _stats_from_state(state: dict, now):
+    if state["last_ts"] is None:
         return {
             "uptime_pct": 0.0,
             "total_up": "0s",
@@ -59,52 +196,22 @@ async def calculate_uptime_stats():
             "last_event_time": "No events recorded"
         }
 
-    total_up = timedelta()
-    total_down = timedelta()
-    is_running = False
-    last_ts = None
-    last_event_type = None
-
-    for event_type, ts in events:
-        if last_ts:
-            delta = ts - last_ts
-            if last_event_type == "start":
-                total_up += delta
-            elif last_event_type in ("stop", "crash"):
-                total_down += delta
-
-        last_ts = ts
-        last_event_type = event_type
-
-        if event_type == "start":
-            is_running = True
-        elif event_type in ("stop", "crash"):
-            is_running = False
+    total_up = timedelta(seconds=state["total_up_s"])
+    total_down = timedelta(seconds=state["total_down_s"])
+    is_running = state["last_event"] == "start"
+    last_ts = state["last_ts"]
 
     # If still running, add time from last start to now
-    if is_running and last_ts:
-        now = datetime.utcnow()
-        delta = now - last_ts
-        total_up += delta
+    if is_running:
+        total_up += max(now - last_ts, timedelta())
 
     total_time = total_up + total_down
     uptime_pct = (total_up.total_seconds() / total_time.total_seconds() * 100) if total_time.total_seconds() > 0 else 0.0
 
-    def format_td(td):
-        days = td.days
-        hours, rem = divmod(td.seconds, 3600)
-        mins, secs = divmod(rem, 60)
-        parts = []
-        if days: parts.append(f"{days}d")
-        if hours: parts.append(f"{hours}h")
-        if mins: parts.append(f"{mins}m")
-        if secs or not parts: parts.append(f"{secs}s")
-        return " ".join(parts)
-
     status = "running" if is_running else "stopped"
-    last_event_time = f"{last_event_type} at {last_ts.strftime('%Y-%m-%d %H:%M:%S UTC')}" if last_ts else "N/A"
+    last_event_time = f"{state['last_event']} at {last_ts.strftime('%Y-%m-%d %H:%M:%S')}"
 
-    stats = {
+    return {
         "uptime_pct": uptime_pct,
         "total_up": format_td(total_up),
         "total_down": format_td(total_down),
@@ -112,7 +219,13 @@ async def calculate_uptime_stats():
         "last_event_time": last_event_time
     }
 
-    print(f"{YELLOW}[UPTIME] {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')} | "
+async def calculate_uptime_stats():
+    state, now = await refresh_checkpoint()
+    stats = _stats_from_state(state, now)
+    if state["last_ts"] is None:
+        return stats
+
+    print(f"{YELLOW}[UPTIME] {now.strftime('%Y-%m-%d %H:%M:%S')} | "
           f"Up: {stats['total_up']} | Down: {stats['total_down']} | "
           f"{stats['uptime_pct']:.3f}% | Status: {stats['status']}{RESET}")
 
@@ -133,14 +246,25 @@ async def save_stats_snapshot(stats):
     print("[uptime_plugin] Saved stats snapshot to MySQL")
 
 async def periodic_update():
-    while True:
-        stats = await calculate_uptime_stats()
-        await save_stats_snapshot(stats)
-        await asyncio.sleep(60)
+    stats = await calculate_uptime_stats()
+    await save_stats_snapshot(stats)
+
+async def heartbeat():
+    """One single-row upsert – the last time this process was known alive"""
+    async for session in get_db():
+        await session.execute(text('''
+            INSERT INTO uptime_heartbeat (id, last_alive) VALUES (1, NOW())
+            AS new ON DUPLICATE KEY UPDATE last_alive = new.last_alive
+        '''))
+        await session.commit()
 
 async def cmd_uptime(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if context.args and context.args[0].lower() == "rebuild":
+        state = await rebuild_uptime_checkpoint()
+        await update.message.reply_text(f"Uptime checkpoint rebuilt (up to event {state['last_event_id']}).")
+        return
     stats = await calculate_uptime_stats()
-    text = (
+    reply = (
         f"**RootRecord Lifetime Uptime**\n\n"
         f"• Status: **{stats['status'].upper()}** {'🟢' if stats['status'] == 'running' else '🔴'}\n"
         f"• Uptime percentage: **{stats['uptime_pct']:.3f}%**\n"
@@ -149,31 +273,52 @@ async def cmd_uptime(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• Last event: {stats['last_event_time']}\n\n"
         f"Tracks every start/stop/crash — survives restarts."
     )
-    await update.message.reply_text(text, parse_mode="Markdown")
+    await update.message.reply_text(reply, parse_mode="Markdown")
 
 def initialize():
     asyncio.create_task(init_mysql())
-    asyncio.create_task(init_db())
-    asyncio.create_task(periodic_update())
-
-    # Record initial 'start' event
-    asyncio.create_task(record_start_event())
+    asyncio.create_task(_startup())
+    print(f"[uptime_plugin] Initialized – MySQL mode, heartbeat every {HEARTBEAT_INTERVAL}s, "
+          f"snapshots every {SNAPSHOT_INTERVAL}s")
 
-    print("[uptime_plugin] Initialized – MySQL mode, periodic updates every 60s")
+async def _startup():
+    await init_db()
+    await record_start_event()
+    scheduler.register("uptime_heartbeat", heartbeat, HEARTBEAT_INTERVAL)
+    scheduler.register("uptime_snapshot", periodic_update, SNAPSHOT_INTERVAL)
 
 async def record_start_event():
+    """
+    Record 'start'. If the previous run never recorded 'stop' it crashed: close it
+    with a 'crash' event at its last heartbeat (or at its start if it never beat).
+    """
     async for session in get_db():
+        result = await session.execute(text('''
+            SELECT event_type, timestamp FROM uptime_records ORDER BY id DESC LIMIT 1
+        '''))
+        last = result.fetchone()
+        if last is not None and last[0] == "start":
+            result = await session.execute(text("SELECT last_alive FROM uptime_heartbeat WHERE id = 1"))
+            last_alive = result.scalar()
+            crashed_at = max(last[1], last_alive) if last_alive is not None else last[1]
+            await session.execute(text('''
+                INSERT INTO uptime_records (event_type, timestamp)
+                VALUES ('crash', :ts)
+            '''), {"ts": crashed_at})
+            print(f"[uptime_plugin] Previous run ended without 'stop' – recorded crash at {crashed_at}")
         await session.execute(text('''
             INSERT INTO uptime_records (event_type, timestamp)
             VALUES ('start', NOW())
         '''))
+        await session.execute(text('''
+            INSERT INTO uptime_heartbeat (id, last_alive) VALUES (1, NOW())
+            AS new ON DUPLICATE KEY UPDATE last_alive = new.last_alive
+        '''))
         await session.commit()
     print("[uptime_plugin] Recorded initial 'start' event")
 
-# Graceful shutdown: record 'stop'
-import atexit
-
-async def record_shutdown():
+async def shutdown():
+    """Graceful shutdown: record 'stop' (called by core on the running loop)"""
     async for session in get_db():
         await session.execute(text('''
             INSERT INTO uptime_records (event_type, timestamp)
@@ -181,8 +326,3 @@ async def record_shutdown():
         '''))
         await session.commit()
     print("[uptime_plugin] Recorded 'stop' event on shutdown")
-
-def sync_shutdown():
-    asyncio.run(record_shutdown())
-
-atexit.register(sync_shutdown)
\ No newline at end of file
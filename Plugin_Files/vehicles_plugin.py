@@ -4,17 +4,34 @@
 #         Exports get_user_vehicles and calculate_fuel_stats for mpg_plugin
 #         Added logging + basic error handling
 #         /vehicle add and /vehicles commands included for completeness
+#         vehicle_fuel_stats: running per-vehicle totals updated in O(1) inside the
+#         fill-up transaction (apply_fillup); calculate_fuel_stats is one PK read.
+#         rebuild_fuel_stats() recomputes a vehicle after edits/deletes/backdated fills
+#         MPG is full-tank to full-tank: partial fills carry their gallons/cost
+#         forward until the next full tank closes the interval
+#         get_user_fuel_stats(): every vehicle of a user with its vehicle_fuel_stats row
+#         in one join
+#         Active vehicle per user (active_vehicles table + bounded LRU cache):
+#         /vehicle use PLATE|ID selects it, a newly added vehicle becomes active,
+#         fill-ups resolve it via get_active_vehicle() without a query when cached
 
 import asyncio
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 from sqlalchemy import text
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CommandHandler, ContextTypes
 
-from utils.db_mysql import get_db, init_mysql
+from utils.db_mysql import get_db, init_mysql, build_multi_insert
+from utils import counters
+from Plugin_Files import gps_odometer_plugin
 
 ROOT = Path(__file__).parent.parent
+ACTIVE_CACHE_MAX = 1000  # users whose active vehicle is kept in memory
+
+_active_cache = OrderedDict()  # user_id -> vehicle_id (None = user has no vehicles)
+_active_writes = 0  # bumped on every committed change; lookups that raced one don't cache
 
 async def init_db():
     print("[vehicles_plugin] Creating/updating vehicles table in MySQL...")
@@ -33,7 +50,54 @@ async def init_db():
             )
         '''))
         await session.commit()
-    print("[vehicles_plugin] Vehicles table ready")
+
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS vehicle_fuel_stats (
+                vehicle_id INT PRIMARY KEY,
+                total_miles DOUBLE NOT NULL DEFAULT 0,
+                total_gallons DOUBLE NOT NULL DEFAULT 0,
+                total_cost DOUBLE NOT NULL DEFAULT 0,
+                valid_intervals INT NOT NULL DEFAULT 0,
+                odometer_fills INT NOT NULL DEFAULT 0,
+                last_odometer DOUBLE,
+                pending_gallons DOUBLE NOT NULL DEFAULT 0,
+                pending_cost DOUBLE NOT NULL DEFAULT 0,
+                first_fill_date DATETIME,
+                last_fill_date DATETIME,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS active_vehicles (
+                user_id BIGINT PRIMARY KEY,
+                vehicle_id INT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+        try:
+            await session.execute(text('''
+                CREATE INDEX idx_user_created ON vehicles (user_id, created_at)
+            '''))
+            await session.commit()
+            print("[vehicles_plugin] Created index idx_user_created")
+        except Exception as e:
+            if "Duplicate key name" in str(e):
+                print("[vehicles_plugin] Index idx_user_created already exists")
+            else:
+                print(f"[vehicles_plugin] Index creation failed: {e}")
+    print("[vehicles_plugin] Vehicles + vehicle_fuel_stats tables ready")
+
+    # Fill-ups logged before the aggregate existed – build their rows once
+    try:
+        rebuilt = await rebuild_all_fuel_stats(missing_only=True)
+        if rebuilt:
+            print(f"[vehicles_plugin] Built fuel stats for {rebuilt} vehicles")
+    except Exception as e:
+        print(f"[vehicles_plugin] Fuel stats backfill skipped: {e}")  # fuel_records not created yet
 
 async def get_user_vehicles(user_id: int):
     """Fetch all vehicles for a user, ordered by creation date."""
@@ -49,75 +113,299 @@ async def get_user_vehicles(user_id: int):
     print(f"[vehicles] Loaded {len(vehicles)} vehicles for user {user_id}")
     return vehicles
 
-async def calculate_fuel_stats(vehicle_id: int):
+STATS_COLUMNS = (
+    "total_miles", "total_gallons", "total_cost", "valid_intervals", "odometer_fills",
+    "last_odometer", "pending_gallons", "pending_cost", "first_fill_date", "last_fill_date",
+)
+
+def _empty_totals() -> dict:
+    totals = {col: 0 for col in STATS_COLUMNS}
+    totals.update(total_miles=0.0, total_gallons=0.0, total_cost=0.0,
+                  pending_gallons=0.0, pending_cost=0.0,
+                  last_odometer=None, first_fill_date=None, last_fill_date=None)
+    return totals
+
+def _fold_fill(totals: dict, odometer, gallons: float, price: float, is_full: bool, fill_date):
     """
-    Calculate real cumulative MPG and related stats for a vehicle.
-    - Uses miles and gallons (US units) exclusively
-    - Requires at least 2 fill-ups with valid increasing odometer readings
-    - Returns dict with mpg, miles, gallons, cost, cost_per_mile, fill_count, period
-    - Skips invalid intervals (odo not increasing)
+    Add one fill-up (in date order) to the running totals.
+    Partial fills only accumulate; a full tank closes the interval since the
+    previous full tank: miles = odometer delta, fuel = everything bought in between.
+    Returns True when a valid interval was counted.
     """
+    totals["pending_gallons"] += gallons
+    totals["pending_cost"] += gallons * price
+    if odometer is not None:
+        totals["odometer_fills"] += 1
+    if totals["first_fill_date"] is None:
+        totals["first_fill_date"] = fill_date
+    totals["last_fill_date"] = fill_date
+    if not is_full:
+        return False
+
+    prev_odo = totals["last_odometer"]
+    counted = (prev_odo is not None and odometer is not None
+               and odometer > prev_odo and totals["pending_gallons"] > 0)
+    if counted:
+        totals["total_miles"] += odometer - prev_odo
+        totals["total_gallons"] += totals["pending_gallons"]
+        totals["total_cost"] += totals["pending_cost"]
+        totals["valid_intervals"] += 1
+    elif prev_odo is not None:
+        print(f"[vehicles] Skipped invalid interval: odo {prev_odo} → {odometer}, "
+              f"gallons {totals['pending_gallons']:.3f}")
+    totals["last_odometer"] = odometer
+    totals["pending_gallons"] = 0.0
+    totals["pending_cost"] = 0.0
+    return counted
+
+async def _write_totals(session, vehicle_id: int, totals: dict):
+    updates = ", ".join(f"{c} = new.{c}" for c in STATS_COLUMNS)
+    sql, params = build_multi_insert(
+        "vehicle_fuel_stats", ("vehicle_id",) + STATS_COLUMNS,
+        [{"vehicle_id": vehicle_id, **totals}],
+        suffix=f"AS new ON DUPLICATE KEY UPDATE {updates}",
+    )
+    await session.execute(text(sql), params)
+
+async def rebuild_fuel_stats(vehicle_id: int, session=None):
+    """
+    Recompute a vehicle's vehicle_fuel_stats row from fuel_records.
+    Needed after a fill-up is edited/deleted or logged out of date order;
+    pass the caller's session to run inside its transaction (caller commits).
+    """
+    if session is None:
+        async for own_session in get_db():
+            await rebuild_fuel_stats(vehicle_id, own_session)
+            await own_session.commit()
+        return
+
+    result = await session.execute(text('''
+        SELECT odometer, gallons, price, is_full_tank, fill_date
+        FROM fuel_records
+        WHERE vehicle_id = :vid
+        ORDER BY fill_date ASC, id ASC
+    '''), {"vid": vehicle_id})
+    fills = result.fetchall()
+
+    totals = _empty_totals()
+    for odometer, gallons, price, is_full, fill_date in fills:
+        _fold_fill(totals, odometer, gallons, price, bool(is_full), fill_date)
+    await _write_totals(session, vehicle_id, totals)
+    print(f"[vehicles] Rebuilt fuel stats for vehicle {vehicle_id} from {len(fills)} fill-ups "
+          f"({totals['valid_intervals']} valid intervals)")
+
+async def rebuild_all_fuel_stats(missing_only: bool = False):
+    """Rebuild every vehicle with fill-ups, or only those without a stats row yet"""
+    query = "SELECT DISTINCT f.vehicle_id FROM fuel_records f"
+    if missing_only:
+        query += (" LEFT JOIN vehicle_fuel_stats s ON s.vehicle_id = f.vehicle_id"
+                  " WHERE s.vehicle_id IS NULL")
     async for session in get_db():
-        result = await session.execute(text('''
-            SELECT odometer, gallons, price, fill_date
-            FROM fuel_records
-            WHERE vehicle_id = :vid 
-              AND odometer IS NOT NULL
-            ORDER BY fill_date ASC, id ASC
-        '''), {"vid": vehicle_id})
-        fills = result.fetchall()
-
-    if len(fills) < 2:
-        print(f"[vehicles] Not enough fill-ups for MPG stats (need 2+ with odometer) on vehicle {vehicle_id}")
-        return None
+        result = await session.execute(text(query))
+        vehicle_ids = [row[0] for row in result.fetchall()]
+    for vid in vehicle_ids:
+        await rebuild_fuel_stats(vid)
+    return len(vehicle_ids)
 
-    total_miles = 0.0
-    total_gallons = 0.0
-    total_cost = 0.0
-    period_start = fills[0][3]
-    period_end = fills[-1][3]
-    valid_intervals = 0
-
-    for i in range(1, len(fills)):
-        prev_odo = fills[i-1][0]
-        curr_odo = fills[i][0]
-        gallons = fills[i][1]
-        price = fills[i][2]
-
-        if curr_odo > prev_odo and gallons > 0:
-            miles = curr_odo - prev_odo
-            total_miles += miles
-            total_gallons += gallons
-            total_cost += gallons * price
-            valid_intervals += 1
-            print(f"[vehicles] Valid interval on vehicle {vehicle_id}: {miles:.1f} mi / {gallons:.3f} gal")
-        else:
-            print(f"[vehicles] Skipped invalid interval on vehicle {vehicle_id}: odo {prev_odo} → {curr_odo}, gallons {gallons}")
+async def apply_fillup(session, vehicle_id: int, odometer, gallons: float, price: float,
+                       fill_date, is_full: bool = True):
+    """
+    Fold a just-inserted fill-up into vehicle_fuel_stats, in the caller's transaction.
+    O(1): locks the vehicle's stats row and adds one fill. Falls back to a
+    rebuild when there is no stats row yet or the fill is older than the last one.
+    """
+    result = await session.execute(text(f'''
+        SELECT {", ".join(STATS_COLUMNS)}
+        FROM vehicle_fuel_stats
+        WHERE vehicle_id = :vid
+        FOR UPDATE
+    '''), {"vid": vehicle_id})
+    row = result.mappings().fetchone()
+
+    if row is None or (row["last_fill_date"] is not None and fill_date < row["last_fill_date"]):
+        await rebuild_fuel_stats(vehicle_id, session)
+        # A backdated fill splits an interval the GPS estimates were cached for
+        await gps_odometer_plugin.invalidate_vehicle(vehicle_id, session)
+        return
+
+    totals = dict(row)
+    _fold_fill(totals, odometer, gallons, price, is_full, fill_date)
+    await _write_totals(session, vehicle_id, totals)
 
+def _stats_from_row(vehicle_id: int, row):
+    total_miles, total_gallons, total_cost, valid_intervals, first_date, last_date = row
     if total_gallons <= 0 or valid_intervals == 0:
         print(f"[vehicles] No valid MPG data after filtering for vehicle {vehicle_id}")
         return None
 
     mpg = total_miles / total_gallons
-    cost_per_mile = total_cost / total_miles if total_miles > 0 else 0.0
-
-    stats = {
+    return {
         'mpg': mpg,
         'miles': total_miles,
         'gallons': total_gallons,
         'cost': total_cost,
-        'cost_per_mile': cost_per_mile,
+        'cost_per_mile': total_cost / total_miles if total_miles > 0 else 0.0,
         'fill_count': valid_intervals,
-        'period_start': period_start.strftime('%Y-%m-%d'),
-        'period_end': period_end.strftime('%Y-%m-%d')
+        'period_start': first_date.strftime('%Y-%m-%d'),
+        'period_end': last_date.strftime('%Y-%m-%d')
     }
 
-    print(f"[vehicles] MPG stats calculated for vehicle {vehicle_id}: "
-          f"{mpg:.1f} mpg over {total_miles:.0f} miles / {total_gallons:.2f} gallons")
+async def calculate_fuel_stats(vehicle_id: int):
+    """
+    Cumulative MPG and related stats for a vehicle (miles and gallons, US units).
+    - One primary-key read of vehicle_fuel_stats, however many fill-ups exist
+    - Full tank to full tank: needs 2+ full fill-ups with odometer readings
+    - Returns dict with mpg, miles, gallons, cost, cost_per_mile, fill_count, period
+    - Invalid intervals (odo not increasing) are skipped when the totals are built
+    """
+    query = text('''
+        SELECT total_miles, total_gallons, total_cost, valid_intervals,
+               first_fill_date, last_fill_date
+        FROM vehicle_fuel_stats
+        WHERE vehicle_id = :vid
+    ''')
+    async for session in get_db():
+        row = (await session.execute(query, {"vid": vehicle_id})).fetchone()
+        if row is None:
+            # Fill-ups logged before the aggregate existed – build it once
+            await rebuild_fuel_stats(vehicle_id, session)
+            await session.commit()
+            row = (await session.execute(query, {"vid": vehicle_id})).fetchone()
+
+    stats = _stats_from_row(vehicle_id, row)
+    if stats:
+        print(f"[vehicles] MPG stats for vehicle {vehicle_id}: "
+              f"{stats['mpg']:.1f} mpg over {stats['miles']:.0f} miles / {stats['gallons']:.2f} gallons")
     return stats
 
+async def get_user_fuel_stats(user_id: int):
+    """
+    Fuel stats for all of a user's vehicles in one round trip: vehicles joined to
+    their vehicle_fuel_stats rows, so the cost is one PK lookup per vehicle however
+    many fill-ups exist. Vehicles without a stats row (no fill-ups) get None.
+    Returns [(vehicle_id, plate, year, make, model, initial_odometer, stats or None)].
+    """
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT v.vehicle_id, v.plate, v.year, v.make, v.model, v.initial_odometer,
+                   s.total_miles, s.total_gallons, s.total_cost, s.valid_intervals,
+                   s.first_fill_date, s.last_fill_date
+            FROM vehicles v
+            LEFT JOIN vehicle_fuel_stats s ON s.vehicle_id = v.vehicle_id
+            WHERE v.user_id = :user_id
+            ORDER BY v.created_at ASC
+        '''), {"user_id": user_id})
+        rows = result.fetchall()
+
+    vehicles = [(*row[:6], _stats_from_row(row[0], row[6:]) if row[6] is not None else None)
+                for row in rows]
+    print(f"[vehicles] Batched fuel stats for {len(vehicles)} vehicles of user {user_id}")
+    return vehicles
+
+def _cache_active(user_id: int, vehicle_id):
+    _active_cache[user_id] = vehicle_id
+    _active_cache.move_to_end(user_id)
+    while len(_active_cache) > ACTIVE_CACHE_MAX:
+        _active_cache.popitem(last=False)
+
+def invalidate_active_vehicle(user_id: int):
+    """Forget a user's active vehicle – call after the change that outdated it has committed"""
+    global _active_writes
+    _active_writes += 1
+    _active_cache.pop(user_id, None)
+
+async def get_active_vehicle(user_id: int):
+    """
+    vehicle_id fill-ups should be logged against, or None if the user has no vehicles.
+    Cached per user; on a miss the stored choice (or else the user's oldest vehicle)
+    is resolved with one indexed query.
+    """
+    if user_id in _active_cache:
+        _active_cache.move_to_end(user_id)
+        return _active_cache[user_id]
+
+    writes = _active_writes
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT v.vehicle_id
+            FROM vehicles v
+            LEFT JOIN active_vehicles a
+              ON a.user_id = v.user_id AND a.vehicle_id = v.vehicle_id
+            WHERE v.user_id = :user_id
+            ORDER BY a.vehicle_id IS NULL, v.created_at ASC, v.vehicle_id ASC
+            LIMIT 1
+        '''), {"user_id": user_id})
+        row = result.fetchone()
+
+    vehicle_id = row[0] if row else None
+    if writes == _active_writes:
+        _cache_active(user_id, vehicle_id)
+    return vehicle_id
+
+async def set_active_vehicle(user_id: int, vehicle_id: int, session=None):
+    """
+    Persist the user's active vehicle and refresh the cache.
+    With a session the write joins the caller's transaction and the cache is left
+    alone: call the returned function after commit() (skip it on rollback).
+    """
+    if session is None:
+        async for own_session in get_db():
+            after_commit = await set_active_vehicle(user_id, vehicle_id, own_session)
+            await own_session.commit()
+        after_commit()
+        return None
+    await session.execute(text('''
+        INSERT INTO active_vehicles (user_id, vehicle_id)
+        VALUES (:user_id, :vehicle_id) AS new
+        ON DUPLICATE KEY UPDATE vehicle_id = new.vehicle_id
+    '''), {"user_id": user_id, "vehicle_id": vehicle_id})
+
+    def after_commit():
+        global _active_writes
+        _active_writes += 1
+        _cache_active(user_id, vehicle_id)
+    return after_commit
+
+async def find_user_vehicle(user_id: int, plate_or_id: str):
+    """(vehicle_id, plate, year, make, model) owned by the user, matched by plate or ID"""
+    async for session in get_db():
+        result = await session.execute(text('''
+            SELECT vehicle_id, plate, year, make, model
+            FROM vehicles
+            WHERE user_id = :user_id
+              AND (plate = :plate OR vehicle_id = :vid)
+            LIMIT 1
+        '''), {
+            "user_id": user_id,
+            "plate": plate_or_id.upper(),
+            "vid": int(plate_or_id) if plate_or_id.isdigit() else -1
+        })
+        return result.fetchone()
+    return None
+
+async def cmd_vehicle_use(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = list(context.args or [])
+    if args and args[0].lower() == "use":
+        args = args[1:]
+    if not args:
+        await update.message.reply_text("Usage: /vehicle use PLATE (or vehicle ID from /vehicles)")
+        return
+
+    user_id = update.effective_user.id
+    vehicle = await find_user_vehicle(user_id, args[0])
+    if vehicle is None:
+        await update.message.reply_text(f"No vehicle '{args[0]}' found. See /vehicles.")
+        return
+
+    vid, plate, year, make, model = vehicle
+    await set_active_vehicle(user_id, vid)
+    await update.message.reply_text(f"Fill-ups will now be logged for {year} {make} {model} ({plate}).")
+    print(f"[vehicles] User {user_id} switched active vehicle to {vid} ({plate})")
+
 async def cmd_vehicle_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    args = context.args
+    args = list(context.args or [])
+    if args and args[0].lower() == "add":
+        args = args[1:]  # called as /vehicle add ...
     if len(args) < 5:
         await update.message.reply_text(
             "Usage: /vehicle add PLATE YEAR MAKE MODEL INITIAL_ODO\n"
@@ -138,7 +426,7 @@ async def cmd_vehicle_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     async for session in get_db():
         try:
-            await session.execute(text('''
+            result = await session.execute(text('''
                 INSERT INTO vehicles (user_id, plate, year, make, model, initial_odometer)
                 VALUES (:user_id, :plate, :year, :make, :model, :odometer)
             '''), {
@@ -149,17 +437,36 @@ async def cmd_vehicle_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "model": model,
                 "odometer": initial_odo
             })
+            # The car just added is the one about to be filled up
+            cache_active = await set_active_vehicle(user_id, result.lastrowid, session)
+            await counters.increment(session, {"vehicles": 1})
             await session.commit()
+            cache_active()
             await update.message.reply_text(
                 f"Vehicle added successfully:\n"
                 f"{year} {make} {model} ({plate})\n"
-                f"Initial odometer: {initial_odo} miles"
+                f"Initial odometer: {initial_odo} miles\n"
+                f"Now your active vehicle for /fillup (switch with /vehicle use PLATE)"
             )
             print(f"[vehicles] Added vehicle for user {user_id}: {plate} ({year} {make} {model})")
         except Exception as e:
             await update.message.reply_text(f"Error adding vehicle: {str(e)}")
             print(f"[vehicles] Add failed for user {user_id}: {e}")
 
+async def cmd_vehicle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/vehicle add ... | /vehicle use PLATE"""
+    action = context.args[0].lower() if context.args else ""
+    if action == "add":
+        await cmd_vehicle_add(update, context)
+    elif action == "use":
+        await cmd_vehicle_use(update, context)
+    else:
+        await update.message.reply_text(
+            "Usage:\n"
+            "/vehicle add PLATE YEAR MAKE MODEL ODOMETER\n"
+            "/vehicle use PLATE"
+        )
+
 async def cmd_vehicles(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     vehicles = await get_user_vehicles(user_id)
@@ -170,9 +477,10 @@ async def cmd_vehicles(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
+    active = await get_active_vehicle(user_id)
     text = "**Your Vehicles**\n\n"
     for vid, plate, year, make, model, odo in vehicles:
-        text += f"• {year} {make} {model} ({plate})\n"
+        text += f"• {year} {make} {model} ({plate}){' – active' if vid == active else ''}\n"
         text += f"  Initial odometer: {odo} miles (ID: {vid})\n\n"
     await update.message.reply_text(text, parse_mode="Markdown")
     print(f"[vehicles] Listed {len(vehicles)} vehicles for user {user_id}")
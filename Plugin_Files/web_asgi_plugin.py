@@ -0,0 +1,175 @@
+# Plugin_Files/web_asgi_plugin.py
+# Version: 1.42.20260118 – Optional in-process ASGI dashboard
+#   Serves the same endpoints as web/app.py (/ and /totals.json) from inside the
+#   bot's event loop with uvicorn. Reads go through the shared asyncmy engine
+#   (utils/db_mysql) – no second driver, config loader or process – and totals
+#   include state the database hasn't seen yet: pings still waiting in the
+#   ping_ingest queue are counted, and uptime is a read-only view of uptime_plugin's
+#   accumulator. Responses are cached for CACHE_TTL_SEC with ETag / Last-Modified
+#   and 304s, like the Flask app.
+#
+#   Off by default. Enable with config_web.json: {"asgi": true, "port": 5000}
+#   (stop web/app.py first if it uses the same port) and `pip install uvicorn`.
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+
+from utils.db_mysql import engine
+from utils import counters, ping_ingest
+
+ROOT = Path(__file__).parent.parent
+CONFIG_PATH = ROOT / "config_web.json"
+INDEX_PATH = ROOT / "web" / "index.html"
+DEFAULT_PORT = 5000
+CACHE_TTL_SEC = 2  # in-process reads are cheap; this just collapses bursts
+
+_server = None
+_task = None
+_cache = {"body": None, "etag": None, "last_modified": None, "expires": 0.0}
+_cache_lock = None
+_index_html = None
+
+def load_config() -> dict:
+    if not CONFIG_PATH.exists():
+        return {}
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+async def build_totals() -> dict:
+    """Dashboard totals from the shared engine plus in-memory state"""
+    async with engine.connect() as conn:
+        values = await counters.read(conn)
+    queued = ping_ingest.stats()["queue_depth"]
+    payload = {
+        "users": values["users"],
+        "pings": values["pings"] + queued,
+        "pings_queued": queued,
+        "vehicles": values["vehicles"],
+        "fillups": values["fillups"],
+        "finance_entries": values["finance_entries"],
+        "activities": values["activities"],
+        "updated_at": (values["updated_at"] or datetime.now()).isoformat(),
+        "source": "in_process",
+    }
+    try:
+        from Plugin_Files import uptime_plugin
+        uptime = await uptime_plugin.read_uptime_stats()
+        payload["uptime"] = f"{uptime['uptime_pct']:.2f}%"
+    except Exception as e:
+        print(f"[web_asgi] Uptime unavailable: {e}")
+    return payload
+
+async def _cached_totals():
+    """(body, etag, last_modified) – one coroutine refreshes, the rest reuse it"""
+    global _cache_lock
+    if _cache_lock is None:
+        _cache_lock = asyncio.Lock()
+    if _cache["body"] is not None and time.monotonic() < _cache["expires"]:
+        return _cache["body"], _cache["etag"], _cache["last_modified"]
+    async with _cache_lock:
+        if _cache["body"] is None or time.monotonic() >= _cache["expires"]:
+            payload = await build_totals()
+            body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            last_modified = datetime.fromisoformat(payload["updated_at"]).astimezone(timezone.utc)
+            _cache.update(body=body, etag=f'"{hashlib.sha1(body).hexdigest()[:20]}"',
+                          last_modified=last_modified, expires=time.monotonic() + CACHE_TTL_SEC)
+    return _cache["body"], _cache["etag"], _cache["last_modified"]
+
+def _not_modified(headers: dict, etag: str, last_modified: datetime) -> bool:
+    if_none_match = headers.get(b"if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.decode("latin-1").split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = headers.get(b"if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since.decode("latin-1"))
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def _send(send, status: int, body: bytes = b"", headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+async def app(scope, receive, send):
+    """Minimal ASGI app: GET / and GET /totals.json"""
+    if scope["type"] != "http":
+        return
+    if scope["method"] not in ("GET", "HEAD"):
+        await _send(send, 405, b"Method Not Allowed", [("content-type", "text/plain")])
+        return
+    head = scope["method"] == "HEAD"
+
+    if scope["path"] == "/":
+        global _index_html
+        if _index_html is None:
+            _index_html = INDEX_PATH.read_bytes()
+        await _send(send, 200, b"" if head else _index_html,
+                    [("content-type", "text/html; charset=utf-8"), ("content-length", str(len(_index_html)))])
+        return
+
+    if scope["path"] == "/totals.json":
+        try:
+            body, etag, last_modified = await _cached_totals()
+        except Exception as e:
+            print(f"[web_asgi] /totals.json failed: {e}")
+            error = json.dumps({"error": f"Database error: {e}"}).encode("utf-8")
+            await _send(send, 500, error, [("content-type", "application/json")])
+            return
+        headers = [("etag", etag), ("last-modified", format_datetime(last_modified, usegmt=True)),
+                   ("cache-control", f"public, max-age={CACHE_TTL_SEC}")]
+        if _not_modified(dict(scope["headers"]), etag, last_modified):
+            await _send(send, 304, b"", headers)
+            return
+        await _send(send, 200, b"" if head else body,
+                    headers + [("content-type", "application/json"), ("content-length", str(len(body)))])
+        return
+
+    await _send(send, 404, b"Not Found", [("content-type", "text/plain")])
+
+def _embedded_server(uvicorn, config):
+    class EmbeddedServer(uvicorn.Server):
+        """Leaves SIGINT/SIGTERM to core.py – uvicorn must not take over the bot's signals"""
+
+        def install_signal_handlers(self):  # uvicorn < 0.29
+            pass
+
+        @contextlib.contextmanager
+        def capture_signals(self):  # uvicorn >= 0.29
+            yield
+
+    return EmbeddedServer(config)
+
+def initialize():
+    global _server, _task
+    config = load_config()
+    if not config.get("asgi"):
+        print("[web_asgi_plugin] Disabled – set \"asgi\": true in config_web.json to serve the dashboard in-process")
+        return
+    try:
+        import uvicorn
+    except ImportError:
+        print("[web_asgi_plugin] uvicorn not installed (pip install uvicorn) – in-process dashboard disabled")
+        return
+
+    port = int(config.get("port", DEFAULT_PORT))
+    _server = _embedded_server(uvicorn, uvicorn.Config(
+        app, host=config.get("host", "0.0.0.0"), port=port,
+        lifespan="off", log_level="warning", access_log=False,
+    ))
+    _task = asyncio.create_task(_server.serve())
+    print(f"[web_asgi_plugin] Initialized – dashboard on http://localhost:{port} (shared engine)")
+
+async def shutdown():
+    if _server is not None and _task is not None and not _task.done():
+        _server.should_exit = True
+        await asyncio.gather(_task, return_exceptions=True)
+        print("[web_asgi_plugin] Dashboard server stopped")
@@ -0,0 +1,56 @@
+# commands/backfill_cmd.py
+# /backfill – enrich historical pings that have no geopy_enriched row
+#   /backfill            → progress / checkpoint
+#   /backfill start      → run in the background, resumes from the checkpoint
+#   /backfill stop       → stop after the current chunk (checkpoint is kept)
+#   /backfill reset      → next run starts over from the first ping
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from Plugin_Files import enrich_backfill_plugin as backfill
+
+async def cmd_backfill(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    action = args[0].lower() if args else "status"
+    chat_id = update.effective_chat.id
+
+    if action == "start":
+        async def _report(summary):
+            await context.bot.send_message(
+                chat_id,
+                f"Backfill {summary['state']}: {summary['rows']:,} pings enriched "
+                f"({summary['scanned']:,} scanned) in {summary['elapsed_s']:.0f}s – "
+                f"{summary['rows_per_sec']:,.1f} rows/s, checkpoint id {summary['watermark']}"
+            )
+
+        if backfill.start(on_done=_report):
+            await update.message.reply_text("Backfill started – resuming from the last checkpoint.")
+        else:
+            await update.message.reply_text("A backfill is already running. /backfill stop to pause it.")
+    elif action == "stop":
+        if backfill.request_stop():
+            await update.message.reply_text("Stopping after the current chunk – progress is checkpointed.")
+        else:
+            await update.message.reply_text("No backfill is running.")
+    elif action == "reset":
+        if backfill.is_running():
+            await update.message.reply_text("Stop the running backfill before resetting.")
+            return
+        await backfill.reset_checkpoint()
+        await update.message.reply_text("Backfill checkpoint reset – next run starts from the first ping.")
+    else:
+        p = backfill.progress()
+        checkpoint = await backfill.get_checkpoint()
+        state = "running" if p["running"] else "idle"
+        await update.message.reply_text(
+            f"**Enrichment Backfill** – {state}\n"
+            f"Checkpoint: id {checkpoint}\n"
+            f"Last run: {p['rows']:,} enriched / {p['scanned']:,} scanned, "
+            f"{p['rows_per_sec']:,.1f} rows/s\n\n"
+            f"/backfill start | stop | reset",
+            parse_mode="Markdown"
+        )
+    print(f"[backfill] User {update.effective_user.id} ran /backfill {action}")
+
+handler = CommandHandler("backfill", cmd_backfill)
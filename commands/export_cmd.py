@@ -0,0 +1,48 @@
+# commands/export_cmd.py
+# /export [pings|finance] [csv|ndjson] – your history as gzip files, sent part by part
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from Plugin_Files.export_plugin import export_table, EXPORTS, FORMATS
+
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = [a.lower() for a in (context.args or [])]
+    kind = args[0] if args else "pings"
+    fmt = args[1] if len(args) > 1 else "csv"
+    if kind not in EXPORTS or fmt not in FORMATS:
+        await update.message.reply_text(
+            f"Usage: /export [{'|'.join(EXPORTS)}] [{'|'.join(FORMATS)}]"
+        )
+        return
+
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    await update.message.reply_text(f"Exporting your {kind} as {fmt}.gz...")
+
+    async def _send(path, part_no, rows):
+        try:
+            with open(path, "rb") as f:
+                await context.bot.send_document(
+                    chat_id, document=f, filename=path.name,
+                    caption=f"{kind} part {part_no} – {rows:,} rows"
+                )
+        finally:
+            path.unlink(missing_ok=True)
+
+    try:
+        summary = await export_table(kind, fmt, user_id, on_part=_send)
+    except Exception as e:
+        print(f"[export] /export failed for user {user_id}: {e}")
+        await update.message.reply_text(f"Export failed: {e}")
+        return
+
+    if not summary["rows"]:
+        await update.message.reply_text(f"No {kind} to export yet.")
+    else:
+        await update.message.reply_text(
+            f"Export done: {summary['rows']:,} rows in {len(summary['parts'])} file(s)."
+        )
+    print(f"[export] User {user_id} exported {summary['rows']:,} {kind} rows")
+
+handler = CommandHandler("export", cmd_export)
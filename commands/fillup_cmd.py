@@ -1,7 +1,8 @@
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+# commands/fillup_cmd.py
+# /fillup – log a fill-up for the active vehicle (flow lives in fillup_plugin)
 
-async def cmd_fillup(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Fill-up: Send gallons price [odometer].")
+from telegram.ext import CommandHandler
 
-handler = CommandHandler("fillup", cmd_fillup)
\ No newline at end of file
+from Plugin_Files.fillup_plugin import cmd_fillup
+
+handler = CommandHandler("fillup", cmd_fillup)
@@ -0,0 +1,78 @@
+# commands/import_cmd.py
+# Bank export import – send a .csv / .ofx / .qfx file as a document with caption /import
+# The import runs as a background task so other updates keep flowing; progress and
+# the final summary are sent to the chat.
+
+import time
+import uuid
+
+from telegram import Update
+from telegram.ext import MessageHandler, ContextTypes, filters
+
+from Plugin_Files.finance_import_plugin import import_file, IMPORT_DIR
+
+MAX_IMPORT_BYTES = 20 * 1024 * 1024  # Bot API download limit
+PROGRESS_EVERY_SEC = 15              # at most one progress message this often
+
+_running = set()  # user_ids with an import in progress
+
+async def _run_import(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, path):
+    last_report = time.monotonic()
+
+    async def _progress(summary):
+        nonlocal last_report
+        if time.monotonic() - last_report < PROGRESS_EVERY_SEC:
+            return
+        last_report = time.monotonic()
+        await context.bot.send_message(
+            chat_id, f"Importing... {summary['parsed']:,} rows read, {summary['inserted']:,} added so far"
+        )
+
+    try:
+        summary = await import_file(user_id, path, on_progress=_progress)
+        await context.bot.send_message(
+            chat_id,
+            f"Import finished: {summary['inserted']:,} records added, "
+            f"{summary['duplicates']:,} duplicates skipped "
+            f"({summary['parsed']:,} rows in {summary['elapsed_s']:.1f}s, "
+            f"{summary['rows_per_sec']:,.0f} rows/s)"
+        )
+    except Exception as e:
+        print(f"[import] Import failed for user {user_id}: {e}")
+        await context.bot.send_message(chat_id, f"Import failed: {e}")
+    finally:
+        path.unlink(missing_ok=True)
+        _running.discard(user_id)
+
+async def cmd_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    doc = update.message.document
+    suffix = ("." + doc.file_name.rsplit(".", 1)[-1].lower()) if doc.file_name and "." in doc.file_name else ""
+    if suffix not in (".csv", ".ofx", ".qfx"):
+        await update.message.reply_text("Send a .csv, .ofx or .qfx bank export with caption /import")
+        return
+    if doc.file_size and doc.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text("File is too large (20 MB max) – split the export and retry.")
+        return
+    if user_id in _running:
+        await update.message.reply_text("An import is already running – wait for it to finish.")
+        return
+
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = IMPORT_DIR / f"{user_id}_{uuid.uuid4().hex}{suffix}"
+    try:
+        tg_file = await context.bot.get_file(doc.file_id)
+        await tg_file.download_to_drive(path)
+    except Exception as e:
+        path.unlink(missing_ok=True)
+        print(f"[import] Download failed for user {user_id}: {e}")
+        await update.message.reply_text(f"Import failed: {e}")
+        return
+
+    _running.add(user_id)
+    await update.message.reply_text(f"Importing {doc.file_name} in the background – I'll report back here.")
+    context.application.create_task(
+        _run_import(context, update.effective_chat.id, user_id, path), update=update
+    )
+
+handler = MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import"), cmd_import)
@@ -0,0 +1,54 @@
+# commands/live_cmd.py
+# /live – show or tune live-location downsampling thresholds
+#   /live                          → current thresholds + kept/dropped counters (since restart)
+#   /live set <meters> <seconds> <degrees>
+#   /live reset                    → back to defaults
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from Plugin_Files.live_location_plugin import (
+    get_thresholds,
+    set_thresholds,
+    reset_thresholds,
+    stats,
+)
+
+async def cmd_live(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    args = context.args or []
+
+    if args and args[0].lower() == "set":
+        if len(args) < 4:
+            await update.message.reply_text("Usage: /live set <meters> <seconds> <degrees>")
+            return
+        try:
+            dist = float(args[1])
+            interval = int(args[2])
+            heading = float(args[3])
+        except ValueError:
+            await update.message.reply_text("Meters and degrees must be numbers, seconds an integer.")
+            return
+        if dist <= 0 or interval <= 0 or not 0 < heading <= 180:
+            await update.message.reply_text("Thresholds must be positive (degrees 1-180).")
+            return
+        await set_thresholds(user_id, dist, interval, heading)
+    elif args and args[0].lower() == "reset":
+        await reset_thresholds(user_id)
+
+    limits = get_thresholds(user_id)
+    mine = stats(user_id)
+    total = mine["kept"] + mine["dropped"]
+    reply = (
+        f"**Live Location Downsampling**\n"
+        f"Keep a point every **{limits['min_distance_m']:.0f} m**, "
+        f"**{limits['max_interval_s']} s**, or **{limits['min_heading_deg']:.0f}°** turn\n"
+        f"Kept: {mine['kept']} | Dropped: {mine['dropped']}"
+        + (f" ({mine['dropped'] / total * 100:.0f}% saved)" if total else "")
+        + " – since the bot last restarted"
+        + "\n\nChange: /live set <meters> <seconds> <degrees> | /live reset"
+    )
+    await update.message.reply_text(reply, parse_mode="Markdown")
+    print(f"[live] User {user_id} viewed/updated live thresholds")
+
+handler = CommandHandler("live", cmd_live)
@@ -1,7 +1,5 @@
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+from telegram.ext import CommandHandler
 
-async def cmd_mpg(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("MPG: (stats coming soon).")
+from Plugin_Files.mpg_plugin import cmd_mpg
 
-handler = CommandHandler("mpg", cmd_mpg)
\ No newline at end of file
+handler = CommandHandler("mpg", cmd_mpg)
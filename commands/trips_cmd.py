@@ -0,0 +1,32 @@
+# commands/trips_cmd.py
+# /trips – latest finished trips (trips_plugin segmentation)
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from Plugin_Files.trips_plugin import get_recent_trips, current_state
+
+async def cmd_trips(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    trips = await get_recent_trips(user_id, limit=5)
+    state = current_state(user_id)
+
+    if not trips:
+        reply = "No trips recorded yet. Share your live location while moving to log one."
+    else:
+        lines = ["**Recent Trips**"]
+        for t in trips:
+            minutes = t["duration_s"] / 60
+            route = f"{t['start_place'] or 'Unknown'} → {t['end_place'] or 'Unknown'}"
+            lines.append(
+                f"{t['start_time']:%b %d %H:%M} – {t['distance_m'] / 1609.344:.1f} mi "
+                f"in {minutes:.0f} min ({route})"
+            )
+        reply = "\n".join(lines)
+    if state:
+        reply += f"\n\nRight now: {state}"
+
+    await update.message.reply_text(reply, parse_mode="Markdown")
+    print(f"[trips] User {user_id} viewed recent trips")
+
+handler = CommandHandler("trips", cmd_trips)
@@ -1,7 +1,8 @@
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+# commands/uptime_cmd.py
+# /uptime – lifetime uptime from the checkpointed accumulator; /uptime rebuild recomputes it
 
-async def cmd_uptime(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Uptime: Bot is running (full stats soon).")
+from telegram.ext import CommandHandler
 
-handler = CommandHandler("uptime", cmd_uptime)
\ No newline at end of file
+from Plugin_Files.uptime_plugin import cmd_uptime
+
+handler = CommandHandler("uptime", cmd_uptime)
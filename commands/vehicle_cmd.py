@@ -0,0 +1,5 @@
+from telegram.ext import CommandHandler
+
+from Plugin_Files.vehicles_plugin import cmd_vehicle
+
+handler = CommandHandler("vehicle", cmd_vehicle)
@@ -1,7 +1,5 @@
-from telegram import Update
-from telegram.ext import CommandHandler, ContextTypes
+from telegram.ext import CommandHandler
 
-async def cmd_vehicles(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("Vehicles: (list coming soon).")
+from Plugin_Files.vehicles_plugin import cmd_vehicles
 
-handler = CommandHandler("vehicles", cmd_vehicles)
\ No newline at end of file
+handler = CommandHandler("vehicles", cmd_vehicles)
@@ -11,6 +11,7 @@ import asyncio
 import shutil
 
 from utils.db_mysql import engine
+from utils import scheduler, counters
 from sqlalchemy import text
 
 BASE_DIR = Path(__file__).parent
@@ -76,6 +77,9 @@ async def ensure_all_tables():
                 INDEX idx_snapshot_time (snapshot_time)
             )
         """))
+    # Write paths increment dashboard_counters inside their own transactions,
+    # so it has to exist before any plugin starts
+    await counters.init_db()
 
 def discover_plugin_names():
     plugins = []
@@ -97,6 +101,17 @@ async def auto_run_plugins_async(plugins):
         except Exception as e:
             log_debug(f"[plugins] Failed to init {plugin_name}: {e}")
 
+async def auto_shutdown_plugins_async(plugins):
+    for plugin_name in plugins:
+        module = sys.modules.get(f"Plugin_Files.{plugin_name}")
+        if module is None or not hasattr(module, "shutdown"):
+            continue
+        try:
+            await module.shutdown()
+            log_debug(f"[plugins] Shut down {plugin_name}")
+        except Exception as e:
+            log_debug(f"[plugins] Failed to shut down {plugin_name}: {e}")
+
 async def main_loop():
     plugins = discover_plugin_names()
     await auto_run_plugins_async(plugins)
@@ -113,12 +128,16 @@ async def main_loop():
         await shutdown_bot()
         bot_task.cancel()
         await asyncio.gather(bot_task, return_exceptions=True)
+        await scheduler.shutdown()
+        await auto_shutdown_plugins_async(plugins)
+        await engine.dispose()
 
 async def initialize_system():
     await ensure_all_tables()
     ensure_logs_folder()
     ensure_data_folder()
     clear_pycache()
+    await engine.dispose()  # main_loop runs on a new event loop – don't hand it this loop's connections
     log_debug("RootRecord initialization complete (MySQL mode)")
 
 if __name__ == "__main__":
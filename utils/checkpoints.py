@@ -0,0 +1,40 @@
+# utils/checkpoints.py
+# Edited Version: 1.42.20260118
+
+"""
+Named watermarks for resumable background jobs (backfills, incremental consumers).
+get/set take the caller's session or connection, so a watermark can be
+advanced in the same transaction as the rows it covers.
+"""
+
+from sqlalchemy import text
+
+from utils.db_mysql import get_db
+
+
+async def init_db():
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS job_checkpoints (
+                job VARCHAR(64) PRIMARY KEY,
+                watermark BIGINT NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+
+async def get_watermark(conn, job: str) -> int:
+    result = await conn.execute(text('''
+        SELECT watermark FROM job_checkpoints WHERE job = :job
+    '''), {"job": job})
+    value = result.scalar()
+    return int(value) if value is not None else 0
+
+
+async def set_watermark(conn, job: str, watermark: int):
+    await conn.execute(text('''
+        INSERT INTO job_checkpoints (job, watermark)
+        VALUES (:job, :watermark) AS new
+        ON DUPLICATE KEY UPDATE watermark = new.watermark
+    '''), {"job": job, "watermark": watermark})
@@ -0,0 +1,121 @@
+# utils/counters.py
+# Edited Version: 1.42.20260118
+
+"""
+Event-driven dashboard counters.
+Write paths call increment() in the same transaction as their INSERT, so
+dashboard_counters is exact at commit time and /totals.json reads a handful of
+primary-key rows instead of COUNT(*) scans. Distinct ping users are tracked in
+dashboard_ping_users (INSERT IGNORE; only genuinely new users bump the count).
+reconcile() recounts everything from the source tables to correct any drift.
+The tables are created by core.ensure_all_tables, before any plugin can write.
+"""
+
+from sqlalchemy import text
+
+from utils.db_mysql import get_db, build_multi_insert
+from utils import checkpoints
+
+SEED_JOB = "dashboard_counters_seed"  # job_checkpoints flag: 1 once a full recount has run
+
+# counter name -> query that recounts it from the source table
+SOURCES = {
+    "users": "SELECT COUNT(*) FROM dashboard_ping_users",
+    "pings": "SELECT COUNT(*) FROM gps_records",
+    "vehicles": "SELECT COUNT(*) FROM vehicles",
+    "fillups": "SELECT COUNT(*) FROM fuel_records",
+    "finance_entries": "SELECT COUNT(*) FROM finance_records",
+    "activities": "SELECT COUNT(*) FROM trips",
+}
+
+
+async def init_db():
+    await checkpoints.init_db()
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS dashboard_counters (
+                name VARCHAR(64) PRIMARY KEY,
+                value BIGINT NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS dashboard_ping_users (
+                user_id BIGINT PRIMARY KEY
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+
+
+async def increment(conn, deltas: dict):
+    """Add deltas ({counter: n}) in the caller's session/connection – one upsert"""
+    rows = [{"name": name, "value": n} for name, n in deltas.items() if n]
+    if not rows:
+        return
+    sql, params = build_multi_insert(
+        "dashboard_counters", ("name", "value"), rows,
+        suffix="AS new ON DUPLICATE KEY UPDATE value = dashboard_counters.value + new.value",
+    )
+    await conn.execute(text(sql), params)
+
+
+async def add_ping_users(conn, user_ids):
+    """Record users seen in a ping batch; bumps 'users' by however many are new"""
+    rows = [{"user_id": uid} for uid in set(user_ids)]
+    if not rows:
+        return
+    sql, params = build_multi_insert("dashboard_ping_users", ("user_id",), rows, verb="INSERT IGNORE")
+    result = await conn.execute(text(sql), params)
+    await increment(conn, {"users": result.rowcount})
+
+
+async def read(conn) -> dict:
+    """{counter: value} plus 'updated_at' (newest change)"""
+    result = await conn.execute(text("SELECT name, value, updated_at FROM dashboard_counters"))
+    values = {name: 0 for name in SOURCES}
+    updated_at = None
+    for name, value, changed in result.fetchall():
+        values[name] = int(value)
+        if changed is not None and (updated_at is None or changed > updated_at):
+            updated_at = changed
+    values["updated_at"] = updated_at
+    return values
+
+
+async def is_seeded(conn) -> bool:
+    return await checkpoints.get_watermark(conn, SEED_JOB) > 0
+
+
+async def reconcile() -> dict:
+    """
+    Recount every counter from its source table and correct it by the difference.
+    Stored values and counts come from one snapshot and the fix is applied as a
+    delta (value + actual - stored), so increments committed meanwhile are kept.
+    Returns {counter: (stored, actual)} for the ones that had drifted.
+    """
+    async for session in get_db():
+        # Plain read + INSERT IGNORE: INSERT ... SELECT would share-lock gps_records
+        # and stall ping batches for the length of the scan
+        result = await session.execute(text("SELECT DISTINCT user_id FROM gps_records"))
+        user_ids = [r[0] for r in result.fetchall()]
+        await session.commit()
+        for i in range(0, len(user_ids), 1000):
+            await add_ping_users(session, user_ids[i:i + 1000])
+            await session.commit()
+
+        # One transaction: the first read fixes the snapshot for all of them
+        stored = await read(session)
+        actual = {}
+        for name, query in SOURCES.items():
+            try:
+                actual[name] = int((await session.execute(text(query))).scalar() or 0)
+            except Exception as e:
+                print(f"[counters] Can't recount {name}: {e}")  # source table not created yet
+
+        drift = {name: (stored[name], value) for name, value in actual.items() if stored[name] != value}
+        await increment(session, {name: value - stored[name] for name, value in actual.items()})
+        await checkpoints.set_watermark(session, SEED_JOB, 1)
+        await session.commit()
+    if drift:
+        print(f"[counters] Reconciled drift: {drift}")
+    return drift
@@ -36,4 +36,25 @@ async def init_mysql():
 async def get_version():
     async with engine.connect() as conn:
         result = await conn.execute(text("SELECT VERSION()"))
-        return result.scalar()
\ No newline at end of file
+        return result.scalar()
+
+def build_multi_insert(table: str, columns, rows, suffix: str = "", verb: str = "INSERT"):
+    """
+    Build one multi-row INSERT for a list of row dicts keyed by column name.
+    Returns (sql, params) ready for session.execute(text(sql), params).
+    suffix is appended as-is (e.g. an ON DUPLICATE KEY UPDATE clause).
+    """
+    groups = []
+    params = {}
+    for i, row in enumerate(rows):
+        names = []
+        for col in columns:
+            key = f"{col}_{i}"
+            params[key] = row.get(col)
+            names.append(f":{key}")
+        groups.append("(" + ", ".join(names) + ")")
+
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES " + ", ".join(groups)
+    if suffix:
+        sql += " " + suffix
+    return sql, params
@@ -0,0 +1,323 @@
+# utils/distance.py
+# Edited Version: 1.42.20260118
+
+"""
+Great-circle distance helpers (meters / degrees).
+Pure math, no DB access - safe to call on every location update.
+
+track_distances_m() works on whole tracks at once with NumPy:
+  "haversine" – spherical, ~0.5% worst case vs the ellipsoid, fastest
+  "vincenty"  – WGS-84 ellipsoid (Vincenty inverse), agrees with geopy's geodesic to < 1 mm
+Without NumPy the same calls fall back to pure-Python loops.
+
+Accuracy checks vs geopy.geodesic (assertions, NumPy and pure-Python paths)
+followed by a benchmark:  python -m utils.distance [points]
+"""
+
+import math
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional – vectorized paths fall back to the scalar functions
+    np = None
+
+EARTH_RADIUS_M = 6371008.8  # mean Earth radius (IUGG)
+
+# WGS-84 ellipsoid (what geopy's geodesic uses by default)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+VINCENTY_TOLERANCE = 1e-12  # radians of longitude on the auxiliary sphere (~0.006 mm)
+VINCENTY_MAX_ITER = 200
+
+# Tolerances check_accuracy() asserts against geopy's geodesic
+HAVERSINE_MAX_REL_ERR = 0.006   # 0.6 % (measured worst case ~0.54 %)
+VINCENTY_MAX_ERR_M = 0.001      # 1 mm
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing_deg(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Initial bearing from point 1 to point 2, 0-360 degrees clockwise from north"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dlmb = math.radians(lon2 - lon1)
+    y = math.sin(dlmb) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlmb)
+    return (math.degrees(math.atan2(y, x)) + 360.0) % 360.0
+
+
+def heading_delta_deg(a: float, b: float) -> float:
+    """Smallest absolute difference between two headings (0-180)"""
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+
+def vincenty_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Ellipsoidal (WGS-84) distance in meters; falls back to haversine for near-antipodal points"""
+    f = WGS84_F
+    L = math.radians(lon2 - lon1)
+    U1 = math.atan((1 - f) * math.tan(math.radians(lat1)))
+    U2 = math.atan((1 - f) * math.tan(math.radians(lat2)))
+    sinU1, cosU1 = math.sin(U1), math.cos(U1)
+    sinU2, cosU2 = math.sin(U2), math.cos(U2)
+
+    lam = L
+    for _ in range(VINCENTY_MAX_ITER):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0  # coincident points
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sm = cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha if cos2_alpha else 0.0  # equatorial line
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        if abs(lam - lam_prev) < VINCENTY_TOLERANCE:
+            break
+    else:
+        return haversine_m(lat1, lon1, lat2, lon2)
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    d_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    return WGS84_B * A * (sigma - d_sigma)
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """Element-wise haversine over NumPy arrays (degrees in, meters out)"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def vincenty_np(lat1, lon1, lat2, lon2):
+    """
+    Element-wise Vincenty inverse on WGS-84 over NumPy arrays (meters).
+    Pairs iterate together until every lambda has converged; pairs still
+    moving after VINCENTY_MAX_ITER (near-antipodal) get haversine instead.
+    """
+    f = WGS84_F
+    L = np.radians(np.asarray(lon2, dtype=float) - np.asarray(lon1, dtype=float))
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    def _terms(lam):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        # Coincident points (sin_sigma == 0) and equatorial lines (cos2_alpha == 0)
+        safe_sin_sigma = np.where(sin_sigma == 0, 1.0, sin_sigma)
+        sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / safe_sin_sigma)
+        cos2_alpha = 1 - sin_alpha ** 2
+        safe_cos2_alpha = np.where(cos2_alpha == 0, 1.0, cos2_alpha)
+        cos_2sm = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / safe_cos2_alpha)
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_next = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        return sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sm, lam_next
+
+    lam = L
+    for _ in range(VINCENTY_MAX_ITER):
+        sin_sigma, cos_sigma, sigma, cos2_alpha, cos_2sm, lam_next = _terms(lam)
+        diverged = np.abs(lam_next - lam) >= VINCENTY_TOLERANCE
+        lam = lam_next
+        if not diverged.any():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    d_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+    meters = WGS84_B * A * (sigma - d_sigma)
+    if diverged.any():
+        meters = np.where(diverged, haversine_np(lat1, lon1, lat2, lon2), meters)
+    return meters
+
+
+def track_distances_m(lats, lons, method: str = "haversine"):
+    """
+    Per-segment and cumulative distance for one ordered track in a single call.
+    Returns (segments, cumulative): len(lats) - 1 segment lengths and len(lats)
+    running totals starting at 0. NumPy arrays when NumPy is installed, lists otherwise.
+    method: "haversine" (fast, spherical) or "vincenty" (WGS-84, geodesic accuracy)
+    """
+    if method not in ("haversine", "vincenty"):
+        raise ValueError(f"Unknown distance method: {method}")
+
+    if np is None:
+        pair = haversine_m if method == "haversine" else vincenty_m
+        segments = [pair(lats[i - 1], lons[i - 1], lats[i], lons[i]) for i in range(1, len(lats))]
+        cumulative = [0.0] * len(lats)
+        for i, meters in enumerate(segments, start=1):
+            cumulative[i] = cumulative[i - 1] + meters
+        return segments, cumulative
+
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if lats.size < 2:
+        return np.zeros(0), np.zeros(lats.size)
+    pair = haversine_np if method == "haversine" else vincenty_np
+    segments = pair(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+    return segments, cumulative
+
+
+def segment_distances_m(lats, lons, method: str = "haversine"):
+    """Length of each segment of a track (len(lats) - 1 values) as a plain list"""
+    segments, _ = track_distances_m(lats, lons, method)
+    return [float(m) for m in segments]
+
+
+def _accuracy_pairs(count: int = 2000, seed: int = 94):
+    """Deterministic test pairs: short GPS-like steps plus long global pairs (not near-antipodal)"""
+    import random
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        lat, lon = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        pairs.append((lat, lon, lat + rng.uniform(-0.005, 0.005), lon + rng.uniform(-0.005, 0.005)))
+    for _ in range(count):
+        lat1, lon1 = rng.uniform(-89, 89), rng.uniform(-180, 180)
+        pairs.append((lat1, lon1, rng.uniform(-89, 89), (lon1 + rng.uniform(-120, 120) + 180) % 360 - 180))
+    return pairs
+
+
+def _assert_close(name: str, computed, reference, pairs):
+    for meters, ref, pair in zip(computed, reference, pairs):
+        meters = float(meters)
+        if name.startswith("haversine"):
+            ok = abs(meters - ref) <= HAVERSINE_MAX_REL_ERR * ref + 1e-6
+        else:
+            ok = abs(meters - ref) <= VINCENTY_MAX_ERR_M
+        assert ok, f"{name}: {pair} gave {meters:.4f} m, geodesic {ref:.4f} m"
+    print(f"[check] {name:<18} OK on {len(pairs):,} pairs")
+
+
+def check_accuracy():
+    """
+    Assert haversine / Vincenty against geopy's geodesic within HAVERSINE_MAX_REL_ERR
+    and VINCENTY_MAX_ERR_M – scalar functions, the pure-Python track fallback and,
+    when NumPy is installed, the vectorized paths. Raises AssertionError on a regression.
+    """
+    global np
+    from geopy.distance import geodesic
+
+    pairs = _accuracy_pairs()
+    reference = [geodesic((a, b), (c, d)).meters for a, b, c, d in pairs]
+    _assert_close("haversine scalar", [haversine_m(*p) for p in pairs], reference, pairs)
+    _assert_close("vincenty scalar", [vincenty_m(*p) for p in pairs], reference, pairs)
+    assert vincenty_m(35.0, -106.0, 35.0, -106.0) == 0.0
+    assert haversine_m(35.0, -106.0, 35.0, -106.0) == 0.0
+
+    # Tracks: one two-point track per pair, so segment i is pair i
+    def _tracks(method):
+        return [track_distances_m([a, c], [b, d], method)[0][0] for a, b, c, d in pairs]
+
+    numpy_module = np
+    try:
+        np = None  # force the pure-Python fallback
+        _assert_close("haversine fallback", _tracks("haversine"), reference, pairs)
+        _assert_close("vincenty fallback", _tracks("vincenty"), reference, pairs)
+    finally:
+        np = numpy_module
+
+    if np is None:
+        print("[check] NumPy not installed – vectorized paths not checked")
+        return
+    lat1, lon1, lat2, lon2 = (np.array(col) for col in zip(*pairs))
+    _assert_close("haversine numpy", haversine_np(lat1, lon1, lat2, lon2), reference, pairs)
+    _assert_close("vincenty numpy", vincenty_np(lat1, lon1, lat2, lon2), reference, pairs)
+
+    # A whole track in one call: cumulative total equals the sum of geodesic steps
+    track = pairs[:200]
+    lats = [p[0] for p in track]
+    lons = [p[1] for p in track]
+    walk_ref = sum(geodesic((lats[i - 1], lons[i - 1]), (lats[i], lons[i])).meters for i in range(1, len(lats)))
+    _, cumulative = track_distances_m(lats, lons, "vincenty")
+    assert abs(cumulative[-1] - walk_ref) <= VINCENTY_MAX_ERR_M * len(lats), (cumulative[-1], walk_ref)
+    assert cumulative[0] == 0.0
+    print("[check] vincenty cumulative OK")
+
+
+def _benchmark(points: int = 1_000_000):
+    from geopy.distance import geodesic
+
+    if np is None:
+        print("[benchmark] NumPy not installed – only the pure-Python fallback is available")
+        return
+
+    rng = np.random.default_rng(94)
+    # Random walk: ~1-500 m steps from Albuquerque, like a long ping history
+    step_m = rng.uniform(1, 500, points - 1)
+    heading = rng.uniform(0, 2 * np.pi, points - 1)
+    lats = np.concatenate(([35.0844], 35.0844 + np.cumsum(step_m * np.cos(heading)) / 111_320))
+    lons = np.concatenate(([-106.6504], -106.6504 + np.cumsum(step_m * np.sin(heading)) / 91_000))
+
+    timings = {}
+    for method in ("haversine", "vincenty"):
+        started = time.perf_counter()
+        segments, cumulative = track_distances_m(lats, lons, method)
+        timings[method] = time.perf_counter() - started
+        print(f"[benchmark] {method:<9} numpy: {points:,} points in {timings[method] * 1e3:8.1f} ms "
+              f"({points / timings[method]:>12,.0f} points/s) – track {cumulative[-1] / 1000:,.1f} km")
+
+    sample = min(20_000, points - 1)
+    started = time.perf_counter()
+    for i in range(1, sample + 1):
+        haversine_m(lats[i - 1], lons[i - 1], lats[i], lons[i])
+    python_rate = sample / (time.perf_counter() - started)
+    started = time.perf_counter()
+    reference = np.array([geodesic((lats[i - 1], lons[i - 1]), (lats[i], lons[i])).meters
+                          for i in range(1, sample + 1)])
+    geodesic_rate = sample / (time.perf_counter() - started)
+    print(f"[benchmark] haversine python loop: {python_rate:>12,.0f} points/s")
+    print(f"[benchmark] geopy geodesic loop:   {geodesic_rate:>12,.0f} points/s "
+          f"(1M points ≈ {points / geodesic_rate:,.0f}s)")
+
+    # Accuracy on the sample plus long / near-antipodal pairs
+    for method in ("haversine", "vincenty"):
+        segments, _ = track_distances_m(lats[:sample + 1], lons[:sample + 1], method)
+        err = np.abs(segments - reference)
+        print(f"[benchmark] {method:<9} vs geodesic (track): max {err.max():.4f} m, "
+              f"max rel {np.max(err / np.maximum(reference, 1e-9)) * 100:.4f}%")
+
+    lat1 = rng.uniform(-89, 89, 2000)
+    lon1 = rng.uniform(-180, 180, 2000)
+    lat2 = rng.uniform(-89, 89, 2000)
+    lon2 = rng.uniform(-180, 180, 2000)
+    far = np.array([geodesic((a, b), (c, d)).meters for a, b, c, d in zip(lat1, lon1, lat2, lon2)])
+    for name, fn in (("haversine", haversine_np), ("vincenty", vincenty_np)):
+        err = np.abs(fn(lat1, lon1, lat2, lon2) - far)
+        print(f"[benchmark] {name:<9} vs geodesic (global pairs): max {err.max():.3f} m, "
+              f"max rel {np.max(err / far) * 100:.4f}%")
+
+
+if __name__ == "__main__":
+    check_accuracy()
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,141 @@
+# utils/geocode_cache.py
+# Edited Version: 1.42.20260118
+
+"""
+Two-tier reverse-geocode cache keyed by quantized lat/lon cells.
+Tier 1: in-process LRU (microseconds, lost on restart)
+Tier 2: geocode_cache table in MySQL (survives restarts)
+A ping that lands in a cell seen before resolves without a Nominatim call.
+"""
+
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from utils.db_mysql import get_db
+
+# Cell size is set by decimal places: 3 ≈ 110 m, 4 ≈ 11 m (north-south)
+L1_PRECISION = 3
+L1_MAX_ENTRIES = 5000
+L1_TTL_SEC = 6 * 3600
+
+L2_PRECISION = 3
+L2_TTL_DAYS = 90
+
+_lru = OrderedDict()  # cell_key -> (result dict, expires_at)
+
+_stats = {
+    "l1_hits": 0,
+    "l2_hits": 0,
+    "misses": 0,
+    "l1_expired": 0,
+    "l1_evictions": 0,
+    "stores": 0,
+}
+
+
+def cell_key(lat: float, lon: float, precision: int) -> str:
+    """Stable key for the grid cell centred nearest to (lat, lon)"""
+    scale = 10 ** precision
+    return f"{precision}:{round(lat * scale)}:{round(lon * scale)}"
+
+
+async def init_db():
+    async for session in get_db():
+        await session.execute(text('''
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                cell_key VARCHAR(48) PRIMARY KEY,
+                address TEXT,
+                city TEXT,
+                country TEXT,
+                fetched_at DATETIME NOT NULL,
+                INDEX idx_fetched_at (fetched_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+        '''))
+        await session.commit()
+    print(f"[geocode_cache] Ready (L1 {L1_MAX_ENTRIES} cells @ {L1_PRECISION} dp, "
+          f"L2 MySQL @ {L2_PRECISION} dp, TTL {L2_TTL_DAYS}d)")
+
+
+def _l1_get(key: str):
+    entry = _lru.get(key)
+    if entry is None:
+        return None
+    result, expires_at = entry
+    if expires_at < time.time():
+        del _lru[key]
+        _stats["l1_expired"] += 1
+        return None
+    _lru.move_to_end(key)
+    return result
+
+
+def _l1_put(key: str, result: dict):
+    _lru[key] = (result, time.time() + L1_TTL_SEC)
+    _lru.move_to_end(key)
+    while len(_lru) > L1_MAX_ENTRIES:
+        _lru.popitem(last=False)
+        _stats["l1_evictions"] += 1
+
+
+async def get(lat: float, lon: float):
+    """
+    Cached {'address', 'city', 'country'} for the cell, or None on a miss.
+    A cached dict may hold None values – that's a remembered "no result".
+    """
+    l1_key = cell_key(lat, lon, L1_PRECISION)
+    result = _l1_get(l1_key)
+    if result is not None:
+        _stats["l1_hits"] += 1
+        return result
+
+    row = None
+    async for session in get_db():
+        res = await session.execute(text('''
+            SELECT address, city, country
+            FROM geocode_cache
+            WHERE cell_key = :key
+              AND fetched_at >= NOW() - INTERVAL :ttl DAY
+        '''), {"key": cell_key(lat, lon, L2_PRECISION), "ttl": L2_TTL_DAYS})
+        row = res.fetchone()
+
+    if row is None:
+        _stats["misses"] += 1
+        return None
+
+    _stats["l2_hits"] += 1
+    result = {"address": row[0], "city": row[1], "country": row[2]}
+    _l1_put(l1_key, result)
+    return result
+
+
+async def put(lat: float, lon: float, result: dict):
+    """Store a fresh geocoding result in both tiers"""
+    result = {
+        "address": result.get("address"),
+        "city": result.get("city"),
+        "country": result.get("country"),
+    }
+    _l1_put(cell_key(lat, lon, L1_PRECISION), result)
+
+    async for session in get_db():
+        await session.execute(text('''
+            INSERT INTO geocode_cache (cell_key, address, city, country, fetched_at)
+            VALUES (:key, :address, :city, :country, NOW()) AS new
+            ON DUPLICATE KEY UPDATE
+                address    = new.address,
+                city       = new.city,
+                country    = new.country,
+                fetched_at = new.fetched_at
+        '''), {"key": cell_key(lat, lon, L2_PRECISION), **result})
+        await session.commit()
+    _stats["stores"] += 1
+
+
+def stats() -> dict:
+    snapshot = dict(_stats)
+    lookups = _stats["l1_hits"] + _stats["l2_hits"] + _stats["misses"]
+    snapshot["l1_size"] = len(_lru)
+    snapshot["hit_rate"] = ((_stats["l1_hits"] + _stats["l2_hits"]) / lookups) if lookups else 0.0
+    return snapshot
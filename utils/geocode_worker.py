@@ -0,0 +1,269 @@
+# utils/geocode_worker.py
+# Edited Version: 1.42.20260118
+
+"""
+Rate-limited, coalescing geocoding worker.
+- Token bucket enforces the provider's request rate (Nominatim: 1 req/s)
+- Bounded priority queue: live pings (newest first) jump ahead of backfill work
+- Requests for nearly identical coordinates share one in-flight lookup
+- Timeouts / unavailability are retried with exponential backoff
+The geocode function is injected, so a local fake can stand in for Nominatim:
+python -m utils.geocode_worker runs self_check() against one.
+"""
+
+import asyncio
+import itertools
+import time
+
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+
+from utils.geocode_cache import cell_key
+
+PRIORITY_LIVE = 0
+PRIORITY_BACKFILL = 1
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await self._sleep((1 - self.tokens) / self.rate)
+
+
+class GeocodeWorker:
+    """
+    geocode_fn: async callable (lat, lon) -> result, raising on failure.
+    submit() returns the result, or None if the queue was full or all retries failed.
+    """
+
+    def __init__(self, geocode_fn, rate_per_sec: float = 1.0, burst: int = 1,
+                 max_queue: int = 500, coalesce_precision: int = 4,
+                 max_retries: int = 3, backoff_base: float = 1.0,
+                 retry_on=(GeocoderTimedOut, GeocoderUnavailable),
+                 name: str = "geocode_worker"):
+        self.geocode_fn = geocode_fn
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        self.max_queue = max_queue
+        self.coalesce_precision = coalesce_precision
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retry_on = retry_on
+        self.name = name
+
+        self._queue = None
+        self._task = None
+        self._closed = False
+        self._seq = itertools.count()
+        self._inflight = {}  # cell key -> [future, best priority queued]
+        self._stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "calls": 0,
+            "retries": 0,
+            "failed": 0,
+            "dropped": 0,
+        }
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        print(f"[{self.name}] Started ({self.bucket.rate}/s, queue {self.max_queue})")
+
+    def _queue_key(self, priority: int):
+        # Live lane is LIFO (newest ping first), backfill lane stays FIFO
+        seq = next(self._seq)
+        return (priority, -seq if priority == PRIORITY_LIVE else seq)
+
+    async def submit(self, lat: float, lon: float, priority: int = PRIORITY_LIVE, wait_for_slot: bool = False):
+        if self._closed:
+            return None
+        self.start()
+        self._stats["submitted"] += 1
+        key = cell_key(lat, lon, self.coalesce_precision)
+
+        entry = self._inflight.get(key)
+        if entry is not None:
+            self._stats["coalesced"] += 1
+            future, queued_priority = entry
+            if priority < queued_priority and not self._queue.full():
+                # Re-queue the shared lookup in the faster lane; the stale entry is skipped later
+                entry[1] = priority
+                self._queue.put_nowait((*self._queue_key(priority), key, lat, lon))
+            return await asyncio.shield(future)
+
+        item = (*self._queue_key(priority), key, lat, lon)
+        if wait_for_slot:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = [future, priority]
+            await self._queue.put(item)
+        else:
+            if self._queue.full():
+                self._stats["dropped"] += 1
+                return None
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = [future, priority]
+            self._queue.put_nowait(item)
+
+        return await asyncio.shield(future)
+
+    async def _lookup(self, lat: float, lon: float):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self._stats["calls"] += 1
+            try:
+                return await self.geocode_fn(lat, lon)
+            except self.retry_on as e:
+                if attempt == self.max_retries:
+                    print(f"[{self.name}] Giving up on ({lat:.5f}, {lon:.5f}) after {attempt + 1} tries: {type(e).__name__}")
+                    break
+                delay = self.backoff_base * (2 ** attempt)
+                self._stats["retries"] += 1
+                print(f"[{self.name}] {type(e).__name__} – retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                print(f"[{self.name}] Lookup failed for ({lat:.5f}, {lon:.5f}): {type(e).__name__}: {e}")
+                break
+        self._stats["failed"] += 1
+        return None
+
+    async def _run(self):
+        while True:
+            _, _, key, lat, lon = await self._queue.get()
+            entry = self._inflight.get(key)
+            if entry is None or entry[0].done():
+                continue  # already served through a faster-lane duplicate
+            try:
+                result = await self._lookup(lat, lon)
+            finally:
+                self._inflight.pop(key, None)
+            if not entry[0].done():
+                entry[0].set_result(result)
+
+    async def shutdown(self):
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for future, _ in self._inflight.values():
+            if not future.done():
+                future.set_result(None)
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        snapshot["inflight"] = len(self._inflight)
+        return snapshot
+
+
+async def self_check():
+    """
+    Assertions against a fake geocoder (no network):
+    token-bucket pacing, one backend call per coalesced cell, LIFO live lane ahead
+    of the FIFO backfill lane, and a retry after GeocoderTimedOut.
+    Raises AssertionError on a regression.
+    """
+    rate = 20.0
+
+    # 1. Pacing: distinct cells never go out faster than rate_per_sec
+    stamps = []
+
+    async def timed_geocode(lat, lon):
+        stamps.append(time.monotonic())
+        return {"city": f"{lat:.3f},{lon:.3f}"}
+
+    worker = GeocodeWorker(timed_geocode, rate_per_sec=rate)
+    results = await asyncio.gather(*(worker.submit(35.0 + i / 100, -106.0) for i in range(10)))
+    await worker.shutdown()
+    assert all(r is not None for r in results), results
+    assert len(stamps) == 10, stamps
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    assert min(gaps) >= 1 / rate * 0.9, f"calls {min(gaps):.4f}s apart, limit {1 / rate:.4f}s"
+    observed = (len(stamps) - 1) / (stamps[-1] - stamps[0])
+    assert observed <= rate * 1.05, f"{observed:.1f} req/s > {rate} req/s"
+    print(f"[check] rate limit OK ({observed:.1f} req/s ≤ {rate})")
+
+    # 2. Coalescing: nearby coordinates in one cell → one backend call, same result
+    calls = []
+
+    async def counting_geocode(lat, lon):
+        calls.append((lat, lon))
+        await asyncio.sleep(0.01)
+        return {"city": "shared"}
+
+    worker = GeocodeWorker(counting_geocode, rate_per_sec=rate)
+    results = await asyncio.gather(*(worker.submit(35.08410 + i * 1e-6, -106.65040) for i in range(5)))
+    assert len(calls) == 1, calls
+    assert all(r == {"city": "shared"} for r in results), results
+    assert worker.stats()["coalesced"] == 4, worker.stats()
+    await worker.shutdown()
+    print("[check] coalescing OK (5 requests → 1 call)")
+
+    # 3. Lanes: while the first lookup runs, queued live requests go newest first,
+    #    and all of them before queued backfill requests (which stay FIFO)
+    order = []
+    release = asyncio.Event()
+
+    async def gated_geocode(lat, lon):
+        order.append(lat)
+        if len(order) == 1:
+            await release.wait()
+        return {"city": "x"}
+
+    worker = GeocodeWorker(gated_geocode, rate_per_sec=1000.0)
+    first = asyncio.create_task(worker.submit(1.0, 0.0))
+    while not order:
+        await asyncio.sleep(0)
+    pending = [asyncio.create_task(worker.submit(lat, 0.0, PRIORITY_BACKFILL)) for lat in (10.0, 11.0)]
+    pending += [asyncio.create_task(worker.submit(lat, 0.0, PRIORITY_LIVE)) for lat in (2.0, 3.0, 4.0)]
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(first, *pending)
+    await worker.shutdown()
+    assert order == [1.0, 4.0, 3.0, 2.0, 10.0, 11.0], order
+    print("[check] live lane LIFO ahead of FIFO backfill OK")
+
+    # 4. Retry: a GeocoderTimedOut is retried with backoff and the result still arrives
+    attempts = []
+
+    async def flaky_geocode(lat, lon):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise GeocoderTimedOut("fake timeout")
+        return {"city": "after retry"}
+
+    worker = GeocodeWorker(flaky_geocode, rate_per_sec=1000.0, backoff_base=0.05)
+    result = await worker.submit(35.0, -106.0)
+    await worker.shutdown()
+    assert result == {"city": "after retry"}, result
+    assert len(attempts) == 2 and worker.stats()["retries"] == 1, worker.stats()
+    assert attempts[1] - attempts[0] >= 0.05 * 0.9, "retry did not back off"
+    print("[check] retry on GeocoderTimedOut OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(self_check())
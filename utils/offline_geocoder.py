@@ -0,0 +1,202 @@
+# utils/offline_geocoder.py
+# Edited Version: 1.42.20260118
+
+"""
+Offline reverse geocoder: nearest populated place from a local gazetteer.
+Loads a GeoNames dump (cities1000.txt / cities500.txt, tab separated) or a
+simple CSV (name, latitude, longitude, country_code) into an array-backed
+KD-tree over 3D unit vectors, so Euclidean nearest == great-circle nearest.
+A lookup touches a few dozen nodes – well under a millisecond, no network.
+
+Benchmark:  python -m utils.offline_geocoder [path/to/cities1000.txt]
+"""
+
+import csv
+import math
+import random
+import sys
+import time
+from array import array
+from pathlib import Path
+
+from utils.distance import EARTH_RADIUS_M
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_DATASET = ROOT / "data" / "cities1000.txt"
+DEFAULT_COUNTRY_INFO = ROOT / "data" / "countryInfo.txt"
+
+
+def _unit_vector(lat: float, lon: float):
+    phi = math.radians(lat)
+    lmb = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lmb), cos_phi * math.sin(lmb), math.sin(phi)
+
+
+def _load_country_names(path: Path) -> dict:
+    names = {}
+    if not path or not Path(path).exists():
+        return names
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > 4:
+                names[cols[0]] = cols[4]
+    return names
+
+
+def _iter_places(path: Path):
+    """Yield (name, lat, lon, country_code) without loading the whole file"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            for row in csv.DictReader(f):
+                lat = row.get("latitude") or row.get("lat")
+                lon = row.get("longitude") or row.get("lon")
+                if not lat or not lon:
+                    continue
+                yield (row.get("name") or row.get("city") or "",
+                       float(lat), float(lon),
+                       row.get("country_code") or row.get("country") or "")
+        else:
+            # GeoNames: geonameid, name, asciiname, alternatenames, lat, lon, class, code, country, ...
+            for line in f:
+                cols = line.split("\t")
+                if len(cols) < 9:
+                    continue
+                yield cols[1], float(cols[4]), float(cols[5]), cols[8]
+
+
+class OfflineGeocoder:
+    """Static KD-tree: node for slice [lo, hi) sits at mid = (lo + hi) // 2, split axis = depth % 3"""
+
+    def __init__(self, places, country_names: dict = None):
+        places = list(places)
+        self.country_names = country_names or {}
+        points = [(*_unit_vector(lat, lon), i) for i, (_, lat, lon, _) in enumerate(places)]
+        self._build(points, 0, len(points), 0)
+
+        self._x = array("d", (p[0] for p in points))
+        self._y = array("d", (p[1] for p in points))
+        self._z = array("d", (p[2] for p in points))
+        self._names = [places[p[3]][0] for p in points]
+        self._lat = array("d", (places[p[3]][1] for p in points))
+        self._lon = array("d", (places[p[3]][2] for p in points))
+        self._cc = [places[p[3]][3] for p in points]
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_DATASET, country_info_path=DEFAULT_COUNTRY_INFO):
+        path = Path(path)
+        started = time.perf_counter()
+        geocoder = cls(_iter_places(path), _load_country_names(country_info_path))
+        print(f"[offline_geocoder] Loaded {len(geocoder):,} places from {path.name} "
+              f"in {time.perf_counter() - started:.1f}s")
+        return geocoder
+
+    def _build(self, points, lo, hi, depth):
+        # Iterative median placement so deep trees don't hit the recursion limit
+        stack = [(lo, hi, depth)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= 1:
+                continue
+            axis = depth % 3
+            points[lo:hi] = sorted(points[lo:hi], key=lambda p: p[axis])
+            mid = (lo + hi) // 2
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+    def __len__(self):
+        return len(self._names)
+
+    def _nearest_index(self, qx: float, qy: float, qz: float):
+        xs, ys, zs = self._x, self._y, self._z
+        best_i = -1
+        best_d2 = float("inf")
+        # Each entry carries a lower bound on its distance, re-checked when popped
+        stack = [(0, len(xs), 0, 0.0)]
+        while stack:
+            lo, hi, depth, bound = stack.pop()
+            if lo >= hi or bound >= best_d2:
+                continue
+            mid = (lo + hi) >> 1
+            dx = xs[mid] - qx
+            dy = ys[mid] - qy
+            dz = zs[mid] - qz
+            d2 = dx * dx + dy * dy + dz * dz
+            if d2 < best_d2:
+                best_d2 = d2
+                best_i = mid
+
+            axis = depth % 3
+            diff = dx if axis == 0 else dy if axis == 1 else dz  # node minus query
+            depth += 1
+            if diff > 0:
+                stack.append((mid + 1, hi, depth, diff * diff))
+                stack.append((lo, mid, depth, bound))
+            else:
+                stack.append((lo, mid, depth, diff * diff))
+                stack.append((mid + 1, hi, depth, bound))
+        return best_i, best_d2
+
+    def nearest(self, lat: float, lon: float):
+        """Nearest place as {'city', 'country', 'country_code', 'distance_m', 'latitude', 'longitude'}"""
+        if not self._names:
+            return None
+        i, d2 = self._nearest_index(*_unit_vector(lat, lon))
+        chord = math.sqrt(d2)
+        cc = self._cc[i]
+        return {
+            "city": self._names[i],
+            "country": self.country_names.get(cc, cc),
+            "country_code": cc,
+            "distance_m": 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2)),
+            "latitude": self._lat[i],
+            "longitude": self._lon[i],
+        }
+
+    def nearest_brute_force(self, lat: float, lon: float):
+        """Linear scan – reference for the benchmark"""
+        qx, qy, qz = _unit_vector(lat, lon)
+        xs, ys, zs = self._x, self._y, self._z
+        best_i = min(range(len(xs)), key=lambda i: (xs[i] - qx) ** 2 + (ys[i] - qy) ** 2 + (zs[i] - qz) ** 2)
+        return self._names[best_i]
+
+
+def _benchmark(path=None):
+    rng = random.Random(94)
+    if path:
+        geocoder = OfflineGeocoder.from_file(path)
+    else:
+        count = 150_000  # roughly the size of cities1000
+        started = time.perf_counter()
+        geocoder = OfflineGeocoder(
+            (f"place{i}", math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180), "XX")
+            for i in range(count)
+        )
+        print(f"[benchmark] Built synthetic tree of {count:,} places in {time.perf_counter() - started:.1f}s")
+
+    queries = [(math.degrees(math.asin(rng.uniform(-1, 1))), rng.uniform(-180, 180)) for _ in range(20_000)]
+
+    started = time.perf_counter()
+    for lat, lon in queries:
+        geocoder.nearest(lat, lon)
+    kd_elapsed = time.perf_counter() - started
+
+    sample = queries[:50]
+    started = time.perf_counter()
+    brute = [geocoder.nearest_brute_force(lat, lon) for lat, lon in sample]
+    brute_elapsed = time.perf_counter() - started
+
+    mismatches = sum(geocoder.nearest(lat, lon)["city"] != name for (lat, lon), name in zip(sample, brute))
+    print(f"[benchmark] KD-tree:     {len(queries) / kd_elapsed:>12,.0f} lookups/s "
+          f"({kd_elapsed / len(queries) * 1e6:.1f} µs each)")
+    print(f"[benchmark] Brute force: {len(sample) / brute_elapsed:>12,.1f} lookups/s "
+          f"({brute_elapsed / len(sample) * 1e3:.1f} ms each)")
+    print(f"[benchmark] Nominatim:   {1.0:>12,.1f} lookups/s (usage policy limit)")
+    print(f"[benchmark] KD-tree vs brute force mismatches: {mismatches}/{len(sample)}")
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
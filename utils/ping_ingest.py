@@ -0,0 +1,278 @@
+# utils/ping_ingest.py
+# Edited Version: 1.42.20260118
+
+"""
+Write-behind ingest queue for gps_records.
+handle_location enqueues pings and replies right away; a single flusher task
+group-commits them as one multi-row INSERT per batch, flushing when
+BATCH_MAX_ROWS pings are waiting or FLUSH_INTERVAL_SEC has passed since the
+first ping of the batch arrived.
+A batch that still fails after WRITE_RETRIES is spilled to data/ping_spill as
+NDJSON and replayed (oldest first) once the database accepts writes again.
+Listeners get each row's new id without reading it back: a multi-row INSERT ...
+VALUES is a "simple insert", so InnoDB reserves its auto-increment values in one
+block in every innodb_autoinc_lock_mode, and they are lastrowid + n * step with
+step = @@auto_increment_increment (read once from the server, normally 1).
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import text
+
+from utils.db_mysql import engine, build_multi_insert
+from utils import counters
+
+BATCH_MAX_ROWS = 100        # flush as soon as this many pings are queued
+FLUSH_INTERVAL_SEC = 2.0    # ...or this long after the first ping of a batch
+MAX_QUEUE_SIZE = 10000      # enqueue() waits (backpressure) beyond this
+WRITE_RETRIES = 3
+SPILL_DIR = Path(__file__).parent.parent / "data" / "ping_spill"
+SPILL_RETRY_SEC = 30.0      # how often spilled batches are retried while the DB is failing
+
+GPS_COLUMNS = ("user_id", "latitude", "longitude", "timestamp", "chat_id")
+
+_STOP = object()  # sentinel pushed by shutdown() so the flusher drains and exits
+
+_queue = None
+_flusher = None
+_listeners = []
+_id_step = None  # @@auto_increment_increment, read on the first insert
+_spill_pending = True  # SPILL_DIR may hold batches (checked on disk until a replay empties it)
+_next_replay = 0.0     # loop.time() before which spilled batches aren't retried
+
+_stats = {
+    "enqueued": 0,
+    "written": 0,
+    "batches": 0,
+    "failed": 0,
+    "spilled": 0,
+    "replayed": 0,
+    "last_batch_size": 0,
+    "max_batch_size": 0,
+    "last_flush_ms": 0.0,
+}
+
+
+def register_listener(callback):
+    """
+    Register an async callback(rows) that runs after each committed batch.
+    rows is a list of dicts with GPS_COLUMNS plus the new 'id'.
+    """
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def start():
+    """Create the queue and flusher task (idempotent, needs a running loop)"""
+    global _queue, _flusher
+    if _flusher is not None and not _flusher.done():
+        return
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=MAX_QUEUE_SIZE)
+    _flusher = asyncio.create_task(_run_flusher())
+    print(f"[ping_ingest] Flusher started (batch {BATCH_MAX_ROWS} rows / {FLUSH_INTERVAL_SEC}s)")
+
+
+async def enqueue(user_id: int, lat: float, lon: float, chat_id: int, timestamp: datetime = None):
+    """Queue one ping for the next batch. Timestamp is captured now, not at flush time."""
+    start()
+    await _queue.put({
+        "user_id": user_id,
+        "latitude": lat,
+        "longitude": lon,
+        "timestamp": timestamp or datetime.now(),
+        "chat_id": chat_id,
+    })
+    _stats["enqueued"] += 1
+
+
+def stats():
+    """Snapshot of queue depth and batch sizes for tuning"""
+    snapshot = dict(_stats)
+    snapshot["queue_depth"] = _queue.qsize() if _queue is not None else 0
+    snapshot["avg_batch_size"] = (_stats["written"] / _stats["batches"]) if _stats["batches"] else 0.0
+    return snapshot
+
+
+async def _insert(batch):
+    """One multi-row INSERT plus counters in one transaction; returns the first new id"""
+    global _id_step
+    sql, params = build_multi_insert("gps_records", GPS_COLUMNS, batch)
+    async with engine.begin() as conn:
+        if _id_step is None:
+            _id_step = int((await conn.execute(text("SELECT @@auto_increment_increment"))).scalar() or 1)
+            if _id_step != 1:
+                print(f"[ping_ingest] auto_increment_increment is {_id_step} – batch ids step by {_id_step}")
+        result = await conn.execute(text(sql), params)
+        await counters.increment(conn, {"pings": len(batch)})
+        await counters.add_ping_users(conn, (ping["user_id"] for ping in batch))
+    return result.lastrowid
+
+
+async def _committed(batch, first_id: int, elapsed_ms: float):
+    _stats["written"] += len(batch)
+    _stats["batches"] += 1
+    _stats["last_batch_size"] = len(batch)
+    _stats["max_batch_size"] = max(_stats["max_batch_size"], len(batch))
+    _stats["last_flush_ms"] = elapsed_ms
+    print(f"[ping_ingest] Flushed {len(batch)} pings in {elapsed_ms:.1f} ms "
+          f"(queue depth {_queue.qsize()}, avg batch {stats()['avg_batch_size']:.1f})")
+
+    # One multi-row INSERT gets one block of auto-increment ids starting at lastrowid
+    for offset, ping in enumerate(batch):
+        ping["id"] = first_id + offset * _id_step
+
+    for callback in _listeners:
+        try:
+            await callback(batch)
+        except Exception as e:
+            print(f"[ping_ingest] Listener {getattr(callback, '__name__', callback)} failed: {e}")
+
+
+def _spill(batch):
+    """Write a failed batch to SPILL_DIR (tmp file + rename, so replay never sees half a file)"""
+    SPILL_DIR.mkdir(parents=True, exist_ok=True)
+    path = SPILL_DIR / f"{time.time_ns()}.ndjson"
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for ping in batch:
+            f.write(json.dumps({**ping, "timestamp": ping["timestamp"].isoformat()}) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def _load_spill(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for ping in rows:
+        ping["timestamp"] = datetime.fromisoformat(ping["timestamp"])
+    return rows
+
+
+def _spill_files():
+    return sorted(SPILL_DIR.glob("*.ndjson")) if SPILL_DIR.exists() else []
+
+
+async def _replay_spill():
+    """Re-insert spilled batches oldest first; stops at the first failure until SPILL_RETRY_SEC passes"""
+    global _next_replay, _spill_pending
+    loop = asyncio.get_running_loop()
+    if not _spill_pending or loop.time() < _next_replay:
+        return
+    for path in _spill_files():
+        try:
+            batch = _load_spill(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ping_ingest] Unreadable spill file {path.name}, set aside as .bad: {e}")
+            path.rename(path.with_suffix(".bad"))
+            continue
+        started = time.perf_counter()
+        try:
+            first_id = await _insert(batch) if batch else 0
+        except Exception as e:
+            print(f"[ping_ingest] Replay of {path.name} failed, retrying in {SPILL_RETRY_SEC:.0f}s: {e}")
+            _next_replay = loop.time() + SPILL_RETRY_SEC
+            return
+        path.unlink()
+        _stats["replayed"] += len(batch)
+        print(f"[ping_ingest] Replayed {len(batch)} spilled pings from {path.name}")
+        if batch:
+            await _committed(batch, first_id, (time.perf_counter() - started) * 1000)
+    _spill_pending = False
+
+
+async def _write_batch(batch):
+    global _spill_pending
+    for attempt in range(1, WRITE_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            first_id = await _insert(batch)
+            break
+        except Exception as e:
+            print(f"[ping_ingest] Batch write failed ({len(batch)} pings, attempt {attempt}/{WRITE_RETRIES}): {e}")
+            if attempt == WRITE_RETRIES:
+                try:
+                    path = await asyncio.to_thread(_spill, batch)
+                except Exception as spill_error:
+                    _stats["failed"] += len(batch)
+                    print(f"[ping_ingest] Could not spill batch – {len(batch)} pings lost: {spill_error}")
+                    return
+                _stats["spilled"] += len(batch)
+                _spill_pending = True
+                print(f"[ping_ingest] Spilled {len(batch)} pings to {path.name} for replay")
+                return
+            await asyncio.sleep(attempt)
+
+    await _committed(batch, first_id, (time.perf_counter() - started) * 1000)
+    await _replay_spill()
+
+
+async def _run_flusher():
+    loop = asyncio.get_running_loop()
+    stopping = False
+
+    # Batches spilled by an earlier run (or before a restart) go in first
+    await _replay_spill()
+
+    while not stopping:
+        if _spill_pending:
+            try:
+                item = await asyncio.wait_for(_queue.get(), SPILL_RETRY_SEC)
+            except asyncio.TimeoutError:
+                await _replay_spill()  # no new pings – retry the spill on its own
+                continue
+        else:
+            item = await _queue.get()
+        if item is _STOP:
+            break
+
+        batch = [item]
+        deadline = loop.time() + FLUSH_INTERVAL_SEC
+        while len(batch) < BATCH_MAX_ROWS:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+
+        await _write_batch(batch)
+
+    # Drain anything queued behind the stop sentinel
+    while not _queue.empty():
+        batch = []
+        while not _queue.empty() and len(batch) < BATCH_MAX_ROWS:
+            item = _queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            await _write_batch(batch)
+
+
+async def shutdown(timeout: float = 30.0):
+    """Flush everything still queued, then stop the flusher"""
+    global _flusher
+    if _flusher is None or _flusher.done():
+        return
+
+    pending = _queue.qsize()
+    print(f"[ping_ingest] Flushing {pending} queued pings before shutdown...")
+    await _queue.put(_STOP)
+    try:
+        await asyncio.wait_for(_flusher, timeout)
+    except asyncio.TimeoutError:
+        print(f"[ping_ingest] Flush timed out after {timeout}s – {_queue.qsize()} pings not written")
+    _flusher = None
+    s = stats()
+    print(f"[ping_ingest] Stopped – {s['written']} pings in {s['batches']} batches, "
+          f"{s['spilled']} spilled, {s['replayed']} replayed, {s['failed']} failed")
@@ -10,8 +10,10 @@ from datetime import datetime
 
 _tasks = {}  # name -> (coro, interval_sec, last_run)
 
-async def _run_periodic(name, coro, interval):
+async def _run_periodic(name, coro, interval, first_delay=0):
     """Internal runner for a single periodic task"""
+    if first_delay:
+        await asyncio.sleep(first_delay)
     while True:
         start = datetime.utcnow()
         try:
@@ -22,16 +24,17 @@ async def _run_periodic(name, coro, interval):
         sleep_time = max(0, interval - elapsed)
         await asyncio.sleep(sleep_time)
 
-def register(name: str, coro, interval_seconds: float):
+def register(name: str, coro, interval_seconds: float, first_delay: float = 0):
     """
     Register a periodic coroutine to run every interval_seconds.
+    first_delay postpones the first run (default: run right away).
     Example: scheduler.register("uptime_print", my_print_func, 60)
     """
     if name in _tasks:
         print(f"[scheduler] Task '{name}' already registered - skipping")
         return
 
-    task = asyncio.create_task(_run_periodic(name, coro, interval_seconds))
+    task = asyncio.create_task(_run_periodic(name, coro, interval_seconds, first_delay))
     _tasks[name] = (task, interval_seconds)
     print(f"[scheduler] Registered task '{name}' every {interval_seconds}s")
 
@@ -1,13 +1,23 @@
 # rootrecord/web/app.py
 # RootRecord Web Dashboard – v1.45.20260118
-# Uses dashboard_totals snapshot table (primary) + live fallback; MySQL only
+# Uses dashboard_counters (primary, exact in real time), dashboard_totals snapshot,
+# then live fallback; MySQL only
+# Connections come from a bounded mysql.connector pool; /totals.json is served from
+# an in-process cache (CACHE_TTL_SEC) with ETag / Last-Modified, answering
+# conditional requests with 304. Runs under waitress (multi-threaded, Windows-friendly)
+#   python web/app.py [--port 5000] [--threads 8] [--dev]
+#   benchmark: python web/bench.py
 
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, send_from_directory, request
 from pathlib import Path
+import argparse
+import hashlib
 import json
+import threading
+import time
 import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
+from mysql.connector import Error, pooling
+from datetime import datetime, timezone
 
 app = Flask(__name__, static_folder='.')
 
@@ -29,29 +39,83 @@ def load_mysql_config():
 
 config = load_mysql_config()
 
+POOL_SIZE = 4          # max concurrent DB connections (mysql.connector caps pools at 32)
+POOL_WAIT_SEC = 10     # how long a request waits for a free connection
+CACHE_TTL_SEC = 5      # /totals.json is rebuilt from MySQL at most this often
+DEFAULT_THREADS = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)  # get_connection() fails instead of waiting
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name="dashboard",
+                pool_size=POOL_SIZE,
+                pool_reset_session=True,
+                host="localhost",
+                user=config["mysql_user"],
+                password=config["mysql_password"],
+                database=config["mysql_db"],
+                raise_on_warnings=True,
+                connect_timeout=10
+            )
+            print(f"[dashboard] MySQL pool ready ({POOL_SIZE} connections)")
+    return _pool
+
 def get_mysql_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user=config["mysql_user"],
-        password=config["mysql_password"],
-        database=config["mysql_db"],
-        raise_on_warnings=True,
-        connect_timeout=10
-    )
+    """Pooled connection – close() hands it back to the pool"""
+    if not _pool_slots.acquire(timeout=POOL_WAIT_SEC):
+        raise Error(msg=f"No free MySQL connection after {POOL_WAIT_SEC}s")
+    try:
+        return _get_pool().get_connection()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_mysql_connection(conn):
+    try:
+        conn.close()
+    finally:
+        _pool_slots.release()
 
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
 
-@app.route('/totals.json')
-def totals():
+def _load_totals():
+    """(payload dict, HTTP status) straight from MySQL"""
     conn = None
     cursor = None
     try:
         conn = get_mysql_connection()
         cursor = conn.cursor(dictionary=True)
 
-        # Primary: Get the most recent snapshot from dashboard_totals
+        # Primary: live counters kept by the write paths (utils/counters) – six PK rows
+        try:
+            cursor.execute("SELECT name, value, updated_at FROM dashboard_counters")
+            counter_rows = cursor.fetchall()
+        except Error as e:
+            print(f"[dashboard] dashboard_counters unavailable ({e}) → snapshot")
+            counter_rows = []
+        if counter_rows:
+            values = {r["name"]: int(r["value"]) for r in counter_rows}
+            updated = max((r["updated_at"] for r in counter_rows if r["updated_at"]), default=None)
+            return {
+                "users": values.get("users", 0),
+                "pings": values.get("pings", 0),
+                "vehicles": values.get("vehicles", 0),
+                "fillups": values.get("fillups", 0),
+                "finance_entries": values.get("finance_entries", 0),
+                "activities": values.get("activities", 0),
+                "updated_at": updated.isoformat() if updated else datetime.now().isoformat(),
+                "source": "counters"
+            }, 200
+
+        # Next: the most recent snapshot from dashboard_totals
         cursor.execute("""
             SELECT 
                 total_users,
@@ -68,16 +132,16 @@ def totals():
         row = cursor.fetchone()
 
         if row:
-            return jsonify({
+            return {
                 "users": row.get("total_users", 0),
                 "pings": row.get("total_pings", 0),
                 "vehicles": row.get("total_vehicles", 0),
                 "fillups": row.get("total_fillups", 0),
                 "finance_entries": row.get("total_finance_entries", 0),
                 "activities": row.get("total_activities", 0),
-                "updated_at": row["updated_at"].isoformat() if row["updated_at"] else datetime.utcnow().isoformat(),
+                "updated_at": row["updated_at"].isoformat() if row["updated_at"] else datetime.now().isoformat(),
                 "source": "snapshot"
-            })
+            }, 200
 
         # Fallback: No snapshot yet → compute live aggregates
         print("[dashboard] No snapshot found → falling back to live counts")
@@ -88,40 +152,106 @@ def totals():
                 (SELECT COUNT(*) FROM vehicles) AS total_vehicles,
                 (SELECT COUNT(*) FROM fuel_records) AS total_fillups,
                 (SELECT COUNT(*) FROM finance_records) AS total_finance_entries,
-                0 AS total_activities,
+                (SELECT COUNT(*) FROM trips) AS total_activities,
                 NOW() AS updated_at
         """)
         fallback = cursor.fetchone()
 
         if fallback:
-            return jsonify({
+            return {
                 "users": fallback.get("total_users", 0),
                 "pings": fallback.get("total_pings", 0),
                 "vehicles": fallback.get("total_vehicles", 0),
                 "fillups": fallback.get("total_fillups", 0),
                 "finance_entries": fallback.get("total_finance_entries", 0),
                 "activities": fallback.get("total_activities", 0),
-                "updated_at": fallback["updated_at"].isoformat() if fallback["updated_at"] else datetime.utcnow().isoformat(),
+                "updated_at": fallback["updated_at"].isoformat() if fallback["updated_at"] else datetime.now().isoformat(),
                 "source": "live_fallback",
                 "note": "snapshot table empty – consider running update task"
-            })
+            }, 200
 
-        return jsonify({"error": "No data available in database"}), 503
+        return {"error": "No data available in database"}, 503
 
     except Error as e:
         print(f"[dashboard] MySQL error: {e}")
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
+        return {"error": f"Database error: {str(e)}"}, 500
 
     except Exception as e:
         print(f"[dashboard] Unexpected error: {e}")
-        return jsonify({"error": "Internal server error"}), 500
+        return {"error": "Internal server error"}, 500
 
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+        if conn:
+            release_mysql_connection(conn)
+
+# Latest /totals.json as one (body, etag, last_modified, expires) tuple, rebuilt at most
+# every CACHE_TTL_SEC and replaced in a single assignment so readers never mix two versions
+_cache = (None, None, None, 0.0)
+_cache_lock = threading.Lock()
+
+def _cached_totals():
+    """(body, etag, last_modified, status) – one thread refreshes, the rest reuse it"""
+    global _cache
+    body, etag, last_modified, expires = _cache
+    if body is not None and time.monotonic() < expires:
+        return body, etag, last_modified, 200
+    # While another thread refreshes, serve the previous body rather than queueing on MySQL
+    if not _cache_lock.acquire(blocking=body is None):
+        return body, etag, last_modified, 200
+    try:
+        body, etag, last_modified, expires = _cache
+        if body is not None and time.monotonic() < expires:
+            return body, etag, last_modified, 200
+
+        payload, status = _load_totals()
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        if status != 200:
+            return body, None, None, status  # errors are never cached
+
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        try:
+            # updated_at is MySQL / server local time; HTTP dates are UTC
+            last_modified = datetime.fromisoformat(payload["updated_at"]).astimezone(timezone.utc)
+        except (KeyError, TypeError, ValueError):
+            last_modified = None
+        _cache = (body, etag, last_modified, time.monotonic() + CACHE_TTL_SEC)
+        return body, etag, last_modified, status
+    finally:
+        _cache_lock.release()
+
+@app.route('/totals.json')
+def totals():
+    body, etag, last_modified, status = _cached_totals()
+    response = app.response_class(body, status=status, mimetype="application/json")
+    if status != 200:
+        return response
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = CACHE_TTL_SEC
+    return response.make_conditional(request)  # 304 on a matching If-None-Match / If-Modified-Since
+
+def serve(host: str = "0.0.0.0", port: int = 5000, threads: int = DEFAULT_THREADS, dev: bool = False):
+    if not dev:
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            print("[dashboard] waitress not installed (pip install waitress) – using Flask's dev server")
+        else:
+            print(f"[dashboard] Serving with waitress ({threads} threads) – http://localhost:{port}")
+            waitress_serve(app, host=host, port=port, threads=threads)
+            return
+    print(f"[dashboard] Starting Flask dev server – http://localhost:{port}")
+    app.run(debug=dev, host=host, port=port, threaded=True)
 
 if __name__ == '__main__':
-    print("[dashboard] Starting Flask server (MySQL snapshot + fallback mode) – http://localhost:5000")
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="RootRecord web dashboard")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="waitress worker threads")
+    parser.add_argument("--dev", action="store_true", help="Flask debug server instead of waitress")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.threads, args.dev)
\ No newline at end of file
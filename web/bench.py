@@ -0,0 +1,75 @@
+# rootrecord/web/bench.py
+# Load test for the dashboard – requests/second and latency for /totals.json
+#   python web/bench.py [--url http://localhost:5000/totals.json] [--clients 16] [--seconds 10]
+# Runs two passes: plain GETs, then conditional GETs (If-None-Match → 304).
+# Each client thread keeps one HTTP/1.1 connection open, like a polling browser.
+
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+def _client(url, seconds: float, conditional: bool, results: list, errors: list):
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+    etag = None
+    latencies = []
+    codes = {}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+        codes[response.status] = codes.get(response.status, 0) + 1
+        etag = response.getheader("ETag") or etag
+    conn.close()
+    results.append((latencies, codes))
+
+def run(url: str, clients: int, seconds: float, conditional: bool) -> dict:
+    results, errors = [], []
+    threads = [threading.Thread(target=_client, args=(url, seconds, conditional, results, errors))
+               for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(l for lat, _ in results for l in lat)
+    codes = {}
+    for _, c in results:
+        for status, n in c.items():
+            codes[status] = codes.get(status, 0) + n
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "codes": codes,
+        "errors": len(errors),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /totals.json")
+    parser.add_argument("--url", default="http://localhost:5000/totals.json")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    for label, conditional in (("plain GET", False), ("conditional GET", True)):
+        r = run(args.url, args.clients, args.seconds, conditional)
+        print(f"[bench] {label:16s} {r['rps']:8,.0f} req/s  p50 {r['p50_ms']:6.2f} ms  "
+              f"p99 {r['p99_ms']:6.2f} ms  {r['requests']:,} requests  codes {r['codes']}  errors {r['errors']}")